@@ -0,0 +1,142 @@
+import os
+import time
+
+from ttl_cache import TTLCache
+from tweet_schema import batch_digest
+from twitter_client import query_key
+
+# Finished analyses are kept in process memory so Streamlit reruns (widget
+# changes, downloads) and repeated queries from any session reuse them
+# instead of re-running fetch, store, frame build and summary. Both caches
+# are bounded by entry count and by size (tweets held for results, bytes for
+# frames), evicting least recently used first; the session only holds its
+# current analysis.
+RESULT_CACHE_TTL = int(os.getenv("ANALYSIS_CACHE_TTL", "900"))
+MAX_CACHED_RESULTS = int(os.getenv("ANALYSIS_CACHE_MAX_ENTRIES", "8"))
+MAX_CACHED_TWEETS = int(os.getenv("ANALYSIS_CACHE_MAX_TWEETS", "200000"))
+MAX_CACHED_FRAMES = int(os.getenv("FRAME_CACHE_MAX_ENTRIES", "4"))
+MAX_FRAME_BYTES = int(float(os.getenv("FRAME_CACHE_MAX_MB", "256")) * 1024 * 1024)
+# Reports precomputed by batch_runner.py are served for this long
+REPORT_MAX_AGE = int(os.getenv("REPORT_MAX_AGE", str(24 * 3600)))
+
+
+
+def _tweets_held(analysis):
+    collapsed = analysis["collapsed"]
+    return len(analysis["batch"]["tweets"]) + (len(collapsed["tweets"]) if collapsed is not analysis["batch"] else 0)
+
+
+def _frame_bytes(df):
+    return int(df.memory_usage(deep=True).sum())
+
+
+_results = TTLCache(ttl=RESULT_CACHE_TTL, max_entries=MAX_CACHED_RESULTS, weigh=_tweets_held,
+                    max_weight=MAX_CACHED_TWEETS)
+_frames = TTLCache(ttl=RESULT_CACHE_TTL, max_entries=MAX_CACHED_FRAMES, weigh=_frame_bytes,
+                   max_weight=MAX_FRAME_BYTES)
+
+
+def result_key(keyword, pages, weeks, region):
+    return f"{query_key(keyword, region, weeks)}|pages={pages}"
+
+
+def get_result(key):
+    return _results.get(key)
+
+
+def invalidate(key):
+    _results.delete(key)
+
+
+def store_result(key, params, fetch_result, summary_response, collapsed=None, artifact=None, trends=None,
+                 frame=None):
+    # batch is everything fetched (and downloaded); collapsed is the
+    # near-duplicate-free set the dashboard and summary are built from.
+    # artifact is the batch's dump on disk, if one was written while fetching;
+    # frame, if given, is collapsed's frame, already built by the caller.
+    batch = {"tweets": fetch_result["tweets"], "authors": fetch_result["authors"]}
+    analysis = {
+        "key": key,
+        "params": params,
+        "dataset_hash": batch_digest(batch),
+        "batch": batch,
+        "collapsed": collapsed or batch,
+        "new_tweets": fetch_result["new_tweets"],
+        "complete": fetch_result["complete"],
+        "failed_pages": fetch_result["failed_pages"],
+        "summary": summary_response,
+        "trends": trends or [],
+        "artifact": artifact,
+        "created_at": time.time(),
+    }
+    _results.set(key, analysis)
+    if frame is not None:
+        _frames.set(analysis["dataset_hash"], frame)
+    return analysis
+
+
+def load_report(key, max_age=REPORT_MAX_AGE):
+    # Rebuilds an analysis from a report batch_runner.py saved for the same
+    # query: tweets come from the store and the summary from the report, so
+    # nothing is fetched or summarized. None if there is no fresh report.
+    from dedup import collapse_if_enabled
+    from tweet_store import get_report, load_tweets
+
+    stored = get_report(key)
+    if stored is None or time.time() - stored["created_at"] > max_age:
+        return None
+    report = stored["report"]
+    params = report["params"]
+    history = load_tweets(params["keyword"], since=report["window_start"], until=stored["created_at"] + 1,
+                          region=params["region"])
+    fetch_result = {**history, "new_tweets": report["new_tweets"], "complete": report["complete"],
+                    "failed_pages": report["failed_pages"]}
+    analysis = store_result(key, params, fetch_result, report["summary"], collapse_if_enabled(history),
+                            trends=report.get("trends"))
+    analysis.update(created_at=stored["created_at"], precomputed=True)
+    return analysis
+
+
+def get_frame(analysis):
+    # Frames are shared by dataset hash, so the same tweets fetched under
+    # different parameters are only built once
+    import analytics
+
+    df = _frames.get(analysis["dataset_hash"])
+    if df is None:
+        df = analytics.build_frame(analysis["collapsed"])
+        _frames.set(analysis["dataset_hash"], df)
+    return df
+
+
+def download_path(analysis):
+    # The analysis' compressed dump, written once if it is missing; the
+    # download streams its bytes instead of serializing the batch again
+    import tweet_dump
+
+    path = analysis.get("artifact")
+    if not path or not os.path.exists(path):
+        params = analysis["params"]
+        path = tweet_dump.write_dump(analysis["batch"], tweet_dump.export_path(
+            params["keyword"], params["fetched_at"], region=params.get("region", ""),
+            weeks=params.get("weeks"), pages=params.get("pages"),
+        ))
+        analysis["artifact"] = path
+        tweet_dump.prune_exports()
+    return path
+
+
+def open_download(analysis):
+    # Binary file handle on the dump, handed to the download button as is
+    # (Streamlit copies it into its media store) instead of first being
+    # read into a bytes object here
+    return open(download_path(analysis), "rb")
+
+
+def clear():
+    _results.clear()
+    _frames.clear()
+
+
+def stats():
+    return {"results": _results.stats(), "frames": _frames.stats()}
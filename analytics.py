@@ -0,0 +1,143 @@
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+import tracing
+from tweet_schema import to_frame
+
+ENGAGEMENT_FIELDS = ["likeCount", "retweetCount", "replyCount", "quoteCount"]
+
+
+def build_frame(batch):
+    # batch: {"tweets": [compact records], "authors": {id: author}}
+    with tracing.span("frame.build", rows=len(batch["tweets"])):
+        df = to_frame(batch)
+        df["engagement"] = df[ENGAGEMENT_FIELDS].sum(axis=1)
+    return df
+
+
+def engagement_totals(df):
+    totals = df[ENGAGEMENT_FIELDS].sum()
+    return {
+        "Likes": int(totals["likeCount"]),
+        "Retweets": int(totals["retweetCount"]),
+        "Replies": int(totals["replyCount"]),
+        "Quotes": int(totals["quoteCount"]),
+    }
+
+
+def overview_metrics(df):
+    if df.empty:
+        return {"total_tweets": 0, "avg_engagement": 0, "unique_users": 0, "total_likes": 0}
+    return {
+        "total_tweets": len(df),
+        "avg_engagement": int(df["engagement"].mean()),
+        "unique_users": int(df["username"].nunique()),
+        "total_likes": int(df["likeCount"].sum()),
+    }
+
+
+def _ranked(values):
+    # Same ordering as pandas' value_counts: counts in order of first
+    # appearance, then sorted descending with pandas' default sort
+    counts = pc.value_counts(values)
+    ranked = pd.Series(
+        counts.field("counts").to_numpy(zero_copy_only=False),
+        index=pd.Index(counts.field("values").to_pylist()),
+        name="count",
+    )
+    return ranked.sort_values(ascending=False)
+
+
+def hashtag_counts(df):
+    tags = pa.chunked_array(pa.array(df["hashtags"])) if len(df) else pa.chunked_array([], pa.list_(pa.string()))
+    return _ranked(pc.utf8_lower(pc.list_flatten(tags)))
+
+
+def top_hashtags(df, n=5):
+    top = hashtag_counts(df).head(n).reset_index()
+    top.columns = ["Hashtag", "Count"]
+    return top
+
+
+def keyword_mask(df, keyword):
+    return df["text"].str.contains(keyword, case=False, regex=False, na=False)
+
+
+def top_locations(df, keyword, n=10, mask=None, level=None):
+    # mask selects the tweets mentioning keyword; defaults to a substring match.
+    # level ("city", "region" or "country") groups by the place the location
+    # resolves to; None keeps the locations as written.
+    if mask is None:
+        mask = keyword_mask(df, keyword)
+    located = df[mask & (df["location"] != "")]
+    if level is None:
+        top = _ranked(pa.array(located["location"])).head(n).reset_index()
+    else:
+        import locations
+
+        top = locations.level_counts(located["location"], level).head(n).reset_index()
+    top.columns = ["Location", "Mentions"]
+    return top
+
+
+def daily_timeline(df):
+    dates = df["createdAt"].dt.date
+    return dates.groupby(dates).size().rename_axis("date").reset_index(name="count")
+
+
+def top_tweets(df, n=5):
+    return df.nlargest(n, "engagement")
+
+
+def sentiment_totals(df):
+    # Tweets per sentiment label and the mean score
+    from sentiment import NEGATIVE, POSITIVE
+
+    scores = df["sentiment"].to_numpy(dtype=float, na_value=np.nan)
+    return {
+        "Positive": int((scores >= POSITIVE).sum()),
+        "Neutral": int(((scores > NEGATIVE) & (scores < POSITIVE)).sum()),
+        "Negative": int((scores <= NEGATIVE).sum()),
+        "mean": round(float(np.nanmean(scores)), 3) if len(scores) else 0.0,
+    }
+
+
+def sentiment_timeline(df):
+    # Daily mean sentiment and the share of positive and negative tweets
+    from sentiment import NEGATIVE, POSITIVE
+
+    scores = df["sentiment"].astype(float)
+    days = pd.DataFrame({
+        "date": df["createdAt"].dt.date,
+        "sentiment": scores,
+        "positive": scores >= POSITIVE,
+        "negative": scores <= NEGATIVE,
+    }).groupby("date")
+    timeline = days.agg(sentiment=("sentiment", "mean"), positive=("positive", "mean"),
+                        negative=("negative", "mean"), count=("sentiment", "size"))
+    return timeline.reset_index()
+
+
+def sentiment_by_hashtag(df, n=10, min_tweets=3):
+    # Mean sentiment and total engagement of the n most used hashtags
+    if df.empty:
+        return pd.DataFrame(columns=["Hashtag", "Tweets", "Sentiment", "Engagement"])
+    tags = pa.chunked_array(pa.array(df["hashtags"]))
+    rows = pc.list_parent_indices(tags).to_numpy()
+    codes, names = pd.factorize(pc.utf8_lower(pc.list_flatten(tags)).to_numpy(zero_copy_only=False))
+    # A tweet repeating a hashtag counts once for it
+    pairs = np.unique(codes.astype(np.int64) * len(df) + rows)
+    codes, rows = pairs // len(df), pairs % len(df)
+    tweets = np.bincount(codes, minlength=len(names))
+    scores = df["sentiment"].to_numpy(dtype=float, na_value=0.0)
+    engagement = df["engagement"].to_numpy(dtype=float, na_value=0.0)
+    top = pd.DataFrame({
+        "Hashtag": names,
+        "Tweets": tweets,
+        "Sentiment": np.bincount(codes, weights=scores[rows], minlength=len(names)) / np.maximum(tweets, 1),
+        "Engagement": np.bincount(codes, weights=engagement[rows], minlength=len(names)).astype(np.int64),
+    })
+    top = top[top["Tweets"] >= min_tweets].sort_values("Tweets", ascending=False, kind="stable").head(n)
+    return top.reset_index(drop=True)
@@ -1,12 +1,10 @@
-import pandas as pd
-import streamlit as st
-from twitter_client import fetch_tweets
-from gemini_client import summarize_with_gemini
-import plotly.express as px
-import plotly.graph_objects as go
 import os
-import json
-from datetime import datetime
+import streamlit as st
+import time
+from datetime import datetime, timezone
+
+# pandas, plotly and the API clients are imported inside the functions that
+# use them, so cold starts and the welcome screen don't pay for them.
 
 # Twitter-like color scheme
 TWITTER_BLUE = "#1DA1F2"
@@ -144,9 +142,664 @@ def set_custom_theme():
     </style>
     """, unsafe_allow_html=True)
 
+
+def render_overview(df, render_id):
+    import plotly.express as px
+    import plotly.graph_objects as go
+    import analytics
+
+    # Overview metrics
+    metrics = analytics.overview_metrics(df)
+    metrics_cols = st.columns(4)
+    with metrics_cols[0]:
+        st.metric("Total Tweets", metrics["total_tweets"])
+    with metrics_cols[1]:
+        st.metric("Avg. Engagement", metrics["avg_engagement"])
+    with metrics_cols[2]:
+        st.metric("Unique Users", metrics["unique_users"])
+    with metrics_cols[3]:
+        st.metric("Total Likes", f"{metrics['total_likes']:,}")
+
+    # Create two columns for charts
+    chart_col1, chart_col2 = st.columns(2)
+
+    with chart_col1:
+        # Engagement pie chart
+        st.markdown(f"""
+        <div class="chart-section">
+            <h3 style="color: {DARK_TEXT}; margin-top: 0px; font-size: 18px;">
+                <span style="color: {TWITTER_BLUE};">📊</span> Engagement Breakdown
+            </h3>
+        </div>
+        """, unsafe_allow_html=True)
+
+        if not df.empty:
+            totals = analytics.engagement_totals(df)
+            engagement_data = list(totals.values())
+
+            labels = list(totals.keys())
+
+            # Check if we have engagement data
+            if sum(engagement_data) > 0:
+                fig_engagement = go.Figure(data=[go.Pie(
+                    labels=labels,
+                    values=engagement_data,
+                    hole=.4,
+                    marker=dict(colors=[TWITTER_BLUE, '#6c5ce7', '#00bfa6', '#ff6b6b']),
+                    textinfo='label+percent',
+                    insidetextorientation='radial',
+                    hoverinfo='label+value'
+                )])
+
+                fig_engagement.update_layout(
+                    showlegend=False,
+                    plot_bgcolor=WHITE,
+                    paper_bgcolor=WHITE,
+                    font_color=DARK_TEXT,
+                    margin=dict(l=20, r=20, t=20, b=20),
+                    height=300,
+                    annotations=[
+                        dict(
+                            text=f'Total<br>{sum(engagement_data):,}',
+                            x=0.5, y=0.5,
+                            font_size=16,
+                            font_color=DARK_TEXT,
+                            showarrow=False
+                        )
+                    ]
+                )
+
+                st.plotly_chart(fig_engagement, use_container_width=True, key=f"engagement-{render_id}")
+            else:
+                st.info("No engagement data found in the fetched tweets.")
+
+    with chart_col2:
+        # Hashtags Analysis
+        st.markdown(f"""
+        <div class="chart-section">
+            <h3 style="color: {DARK_TEXT}; margin-top: 0px; font-size: 18px;">
+                <span style="color: {TWITTER_BLUE};">🏷️</span> Top Hashtags
+            </h3>
+        </div>
+        """, unsafe_allow_html=True)
+
+        top_hashtags = analytics.top_hashtags(df, 5)
+        if not top_hashtags.empty:
+
+            fig_hashtags = px.bar(
+                top_hashtags, 
+                x="Hashtag", 
+                y="Count", 
+                title="best performing hashtags",
+                color_discrete_sequence=[TWITTER_BLUE]
+            )
+            fig_hashtags.update_layout(
+                plot_bgcolor=WHITE,
+                paper_bgcolor=WHITE,
+                font_color=DARK_TEXT,
+                title_font_color=DARK_TEXT,
+                margin=dict(l=20, r=20, t=20, b=20),
+                bargap=0.4,
+                height=300,
+                xaxis=dict(
+                    title="",
+                    tickangle=-30
+                ),
+                yaxis=dict(
+                    title="Count"
+                )
+            )
+            st.plotly_chart(fig_hashtags, use_container_width=True, key=f"hashtags-{render_id}")
+        else:
+            st.info("No hashtags found in the analyzed tweets.")
+
+    # Activity Timeline
+    st.markdown(f"""
+    <div class="chart-section">
+        <h3 style="color: {DARK_TEXT}; margin-top: 0px; font-size: 18px;">
+            <span style="color: {TWITTER_BLUE};">📅</span> Activity Timeline
+        </h3>
+    </div>
+    """, unsafe_allow_html=True)
+
+    # Activity over time
+    if len(df) >= 3:
+        # Group by date and count tweets
+        tweet_counts = analytics.daily_timeline(df)
+
+        fig_timeline = px.line(
+            tweet_counts, 
+            x='date', 
+            y='count',
+            labels={"date": "Date", "count": "Tweets"}
+        )
+
+        fig_timeline.update_traces(
+            line_color=TWITTER_BLUE,
+            line_width=3,
+            mode='lines+markers',
+            marker=dict(size=8, color=TWITTER_BLUE)
+        )
+
+        fig_timeline.update_layout(
+            plot_bgcolor=WHITE,
+            paper_bgcolor=WHITE,
+            font_color=DARK_TEXT,
+            margin=dict(l=10, r=10, t=10, b=10),
+            height=250,
+            xaxis=dict(
+                showgrid=True,
+                gridcolor='rgba(220,220,220,0.4)'
+            ),
+            yaxis=dict(
+                showgrid=True,
+                gridcolor='rgba(220,220,220,0.4)'
+            )
+        )
+
+        st.plotly_chart(fig_timeline, use_container_width=True, key=f"timeline-{render_id}")
+    else:
+        st.info("Not enough data points for timeline visualization.")
+
+
+def render_sentiment(df, render_id):
+    import plotly.express as px
+    import analytics
+
+    st.markdown(f"""
+    <div class="chart-section">
+        <h3 style="color: {DARK_TEXT}; margin-top: 0px; font-size: 18px;">
+            <span style="color: {TWITTER_BLUE};">💬</span> Sentiment
+        </h3>
+    </div>
+    """, unsafe_allow_html=True)
+
+    if df.empty:
+        st.info("No tweets to score.")
+        return
+
+    totals = analytics.sentiment_totals(df)
+    sentiment_cols = st.columns(4)
+    with sentiment_cols[0]:
+        st.metric("Avg. Sentiment", f"{totals['mean']:+.2f}")
+    for column, label in zip(sentiment_cols[1:], ["Positive", "Neutral", "Negative"]):
+        with column:
+            st.metric(label, f"{totals[label] / len(df):.0%}")
+
+    chart_col1, chart_col2 = st.columns(2)
+
+    with chart_col1:
+        timeline = analytics.sentiment_timeline(df)
+        if len(timeline) >= 2:
+            fig_sentiment = px.line(
+                timeline,
+                x="date",
+                y="sentiment",
+                title="Sentiment over time",
+                labels={"date": "Date", "sentiment": "Avg. sentiment"},
+                hover_data={"count": True, "positive": ":.0%", "negative": ":.0%"},
+            )
+            fig_sentiment.update_traces(
+                line_color=TWITTER_BLUE,
+                line_width=3,
+                mode='lines+markers',
+                marker=dict(size=8, color=TWITTER_BLUE)
+            )
+            fig_sentiment.update_layout(
+                plot_bgcolor=WHITE,
+                paper_bgcolor=WHITE,
+                font_color=DARK_TEXT,
+                title_font_color=DARK_TEXT,
+                margin=dict(l=10, r=10, t=40, b=10),
+                height=300,
+                yaxis=dict(range=[-1, 1], showgrid=True, gridcolor='rgba(220,220,220,0.4)'),
+                xaxis=dict(showgrid=True, gridcolor='rgba(220,220,220,0.4)')
+            )
+            st.plotly_chart(fig_sentiment, use_container_width=True, key=f"sentiment-{render_id}")
+        else:
+            st.info("Not enough days of tweets for a sentiment trend.")
+
+    with chart_col2:
+        by_hashtag = analytics.sentiment_by_hashtag(df, 10)
+        if not by_hashtag.empty:
+            fig_tags = px.bar(
+                by_hashtag,
+                x="Hashtag",
+                y="Sentiment",
+                title="Sentiment by hashtag",
+                color="Sentiment",
+                color_continuous_scale=['#ff6b6b', '#dfe6e9', '#00bfa6'],
+                range_color=[-1, 1],
+                hover_data={"Tweets": True, "Engagement": ":,"},
+            )
+            fig_tags.update_layout(
+                plot_bgcolor=WHITE,
+                paper_bgcolor=WHITE,
+                font_color=DARK_TEXT,
+                title_font_color=DARK_TEXT,
+                margin=dict(l=20, r=20, t=40, b=20),
+                bargap=0.4,
+                height=300,
+                coloraxis_showscale=False,
+                xaxis=dict(title="", tickangle=-30),
+                yaxis=dict(title="Avg. sentiment", range=[-1, 1])
+            )
+            st.plotly_chart(fig_tags, use_container_width=True, key=f"sentiment-hashtags-{render_id}")
+        else:
+            st.info("No hashtag is used often enough to score.")
+
+
+def render_locations(df, keyword, render_id, mask=None):
+    # mask defaults to the search index's matches for keyword
+    import plotly.express as px
+    import analytics
+    import search_index
+
+    st.markdown(f"""
+    <h3 style="color: {DARK_TEXT}; margin-top: 10px;">
+        <span style="color: {TWITTER_BLUE};">🌍</span> Top Locations
+    </h3>
+    """, unsafe_allow_html=True)
+
+    levels = {"Country": "country", "Region": "region", "City": "city", "As written": None}
+    level = st.radio("Group by", list(levels), horizontal=True, key="location_level")
+    if mask is None:
+        mask = search_index.frame_mask(df, keyword, keyword=keyword)
+    top_locs = analytics.top_locations(df, keyword, 10, mask=mask, level=levels[level])
+
+    if not top_locs.empty:
+
+        fig_loc = px.bar(
+            top_locs, 
+            x="Location", 
+            y="Mentions", 
+            title=f"Top 10 Locations Discussing '{keyword}'",
+            color_discrete_sequence=[TWITTER_BLUE]
+        )
+        fig_loc.update_layout(
+            plot_bgcolor=WHITE,
+            paper_bgcolor=WHITE,
+            font_color=DARK_TEXT,
+            title_font_color=DARK_TEXT,
+            margin=dict(l=20, r=20, t=40, b=20),
+            title_x=0.5,
+            bargap=0.4
+        )
+        st.plotly_chart(fig_loc, use_container_width=True, key=f"locations-{render_id}")
+    elif levels[level] is not None:
+        st.caption(f"No author locations matched a known {level.lower()}.")
+
+
+def render_top_tweets(df):
+    import pandas as pd
+    import analytics
+
+    st.markdown(f"""
+    <h3 style="color: {DARK_TEXT}; margin-top: 10px;">
+        <span style="color: {TWITTER_BLUE};">🔥</span> Top Tweets by Engagement
+    </h3>
+    """, unsafe_allow_html=True)
+
+    top_engaged = analytics.top_tweets(df, 5)
+
+    if not top_engaged.empty:
+        for _, row in top_engaged.iterrows():
+            engagement = row.get('engagement', 0)
+            created_at = row['createdAt'].strftime('%b %d, %Y') if pd.notnull(row['createdAt']) else ""
+
+            st.markdown(f"""
+                <div class="tweet-card">
+                    <div style="display: flex; justify-content: space-between; margin-bottom: 8px;">
+                        <div>
+                            <span style="font-weight: bold; color: {DARK_TEXT};">@{row['username']}</span>
+                            <span style="color: {GRAY_TEXT}; margin-left: 5px;">· {created_at}</span>
+                        </div>
+                        <div style="color: {TWITTER_BLUE}; font-weight: bold;">
+                            {engagement} engagement
+                        </div>
+                    </div>
+                    <p style="font-size: 15px; line-height: 1.5; color: {DARK_TEXT}; margin-bottom: 12px;">
+                        {row['text']}
+                    </p>
+                    <div style="display: flex; justify-content: space-between; color: {GRAY_TEXT};">
+                        <span>❤️ {row.get('likeCount', 0)}</span>
+                        <span>🔁 {row.get('retweetCount', 0)}</span>
+                        <span>💬 {row.get('replyCount', 0)}</span>
+                        <span>🔖 {row.get('quoteCount', 0)}</span>
+                    </div>
+                </div>
+            """, unsafe_allow_html=True)
+    else:
+        st.info("No tweets available to display.")
+
+
+def render_over_time(keyword, render_id, weeks=8):
+    import plotly.graph_objects as go
+    import rollups
+
+    # Reads only the stored rollups, which cover every run of this keyword
+    st.markdown(f"""
+    <h3 style="color: {DARK_TEXT}; margin-top: 10px;">
+        <span style="color: {TWITTER_BLUE};">📈</span> '{keyword}' Over Time
+    </h3>
+    """, unsafe_allow_html=True)
+
+    weekly = rollups.week_over_week(keyword, weeks=weeks)
+    if not weekly or not any(week["tweets"] for week in weekly):
+        st.info("No stored history for this keyword yet.")
+        return
+
+    latest = weekly[-1]
+    week_label = datetime.fromtimestamp(latest["week_start"], timezone.utc).strftime("%b %d")
+    metrics_cols = st.columns(3)
+    with metrics_cols[0]:
+        change = latest["tweets_change_pct"]
+        st.metric(f"Tweets (week of {week_label})", f"{latest['tweets']:,}",
+                  f"{change:+.1f}% vs last week" if change is not None else None)
+    with metrics_cols[1]:
+        change = latest["engagement_change_pct"]
+        st.metric("Engagement", f"{latest['engagement']:,}",
+                  f"{change:+.1f}% vs last week" if change is not None else None)
+    with metrics_cols[2]:
+        st.metric("Weeks with data", sum(1 for week in weekly if week["tweets"]))
+
+    labels = [datetime.fromtimestamp(week["week_start"], timezone.utc).strftime("%b %d") for week in weekly]
+    fig_weekly = go.Figure()
+    fig_weekly.add_trace(go.Bar(x=labels, y=[week["tweets"] for week in weekly], name="Tweets",
+                                marker_color=TWITTER_BLUE))
+    fig_weekly.add_trace(go.Scatter(x=labels, y=[week["engagement"] for week in weekly], name="Engagement",
+                                    yaxis="y2", mode="lines+markers", line=dict(color="#ff6b6b", width=3)))
+    fig_weekly.update_layout(
+        plot_bgcolor=WHITE,
+        paper_bgcolor=WHITE,
+        font_color=DARK_TEXT,
+        margin=dict(l=10, r=10, t=10, b=10),
+        height=300,
+        yaxis=dict(title="Tweets"),
+        yaxis2=dict(title="Engagement", overlaying="y", side="right", showgrid=False),
+        legend=dict(orientation="h", y=1.1),
+    )
+    st.plotly_chart(fig_weekly, use_container_width=True, key=f"over-time-{render_id}")
+
+    since = latest["week_start"]
+    cols = st.columns(3)
+    with cols[0]:
+        st.markdown("**Rising hashtags** (this week vs last)")
+        st.dataframe([{"Hashtag": f"#{term}", "This week": current, "Last week": previous}
+                      for term, current, previous in rollups.rising_terms(keyword, "hashtag", until=since)],
+                     use_container_width=True, hide_index=True)
+    with cols[1]:
+        st.markdown("**Top authors** (this week)")
+        st.dataframe([{"Author": f"@{term}", "Tweets": tweets, "Engagement": engagement}
+                      for term, tweets, engagement in rollups.top_terms(keyword, "author", since=since)],
+                     use_container_width=True, hide_index=True)
+    with cols[2]:
+        st.markdown("**Top locations** (this week)")
+        st.dataframe([{"Location": term, "Tweets": tweets, "Engagement": engagement}
+                      for term, tweets, engagement in rollups.top_terms(keyword, "location", since=since)],
+                     use_container_width=True, hide_index=True)
+
+
+def render_trends(candidates):
+    import trends
+
+    st.markdown(f"""
+    <h3 style="color: {DARK_TEXT}; margin-top: 10px;">
+        <span style="color: {TWITTER_BLUE};">🚀</span> Emerging Now
+    </h3>
+    """, unsafe_allow_html=True)
+
+    hours = trends.BUCKET_SECONDS / 3600
+    if not candidates:
+        st.caption(f"No hashtag or term is bursting in the last {hours:g} hours compared with its usual volume.")
+        return
+    st.caption(f"Hashtags and terms whose tweets in the last {hours:g} hours jumped well above their usual "
+               "volume. These are also given to the summary as trend signals.")
+    st.dataframe([{"Term": candidate["term"], "Last period": candidate["count"],
+                   "Usual": candidate["baseline"], "Burst score": candidate["score"]}
+                  for candidate in candidates],
+                 use_container_width=True, hide_index=True)
+
+
+def render_search(keyword):
+    import search_index
+
+    st.markdown(f"""
+    <h3 style="color: {DARK_TEXT}; margin-top: 10px;">
+        <span style="color: {TWITTER_BLUE};">🔎</span> Search Stored Tweets
+    </h3>
+    """, unsafe_allow_html=True)
+
+    query = st.text_input("Search every tweet fetched so far", key="search_query",
+                          placeholder='e.g. "spot etf" OR #bitcoin -scam')
+    only_keyword = st.checkbox(f"Only tweets fetched for \"{keyword}\"", key="search_only_keyword")
+    if not query:
+        st.caption('Words must all match; use "quotes" for phrases, OR for alternatives, '
+                   "-word to exclude, #tag for hashtags and word* for prefixes.")
+        return
+
+    results = search_index.search(query, keyword=keyword if only_keyword else None)
+    if "error" in results:
+        st.error(results["error"])
+        return
+    if not results["tweets"]:
+        st.info("No stored tweets match this search.")
+        return
+
+    authors = results["authors"]
+    st.caption(f"{len(results['tweets'])} matching tweets, best match first"
+               + (f" (showing the top {search_index.SEARCH_LIMIT})"
+                  if len(results["tweets"]) == search_index.SEARCH_LIMIT else ""))
+    st.dataframe(
+        [
+            {
+                "Date": datetime.fromtimestamp(tweet["createdAt"], timezone.utc).strftime("%Y-%m-%d %H:%M")
+                if tweet["createdAt"] else "",
+                "User": "@" + authors.get(tweet["authorId"], {}).get("userName", "unknown"),
+                "Tweet": tweet["text"],
+                "Likes": tweet["likeCount"],
+                "Retweets": tweet["retweetCount"],
+                "Link": tweet["url"],
+            }
+            for tweet in results["tweets"]
+        ],
+        use_container_width=True,
+        hide_index=True,
+        column_config={"Link": st.column_config.LinkColumn("Link", display_text="Open")},
+    )
+
+
+def create_layout():
+    # Layout is reserved up front so each section can be filled in
+    # as soon as its data is available
+    layout = {"progress": st.container(), "summary": st.container()}
+    tab1, tab2, tab3, tab4, tab5 = st.tabs(["📊 Overview", "📍 Locations", "🔥 Top Tweets", "📈 Over Time",
+                                             "🔎 Search"])
+    with tab1:
+        layout["overview"] = st.empty()
+    with tab2:
+        layout["locations"] = st.empty()
+    with tab3:
+        layout["top_tweets"] = st.empty()
+    with tab4:
+        layout["over_time"] = st.empty()
+    with tab5:
+        layout["search"] = st.empty()
+    with layout["progress"]:
+        layout["status"] = st.empty()
+    return layout
+
+
+# Jobs run on the shared worker pool (jobs.py); the session only polls them
+JOB_POLL_INTERVAL = 1
+
+
+@st.fragment(run_every=JOB_POLL_INTERVAL)
+def render_job(job_id):
+    import analytics
+    import jobs
+
+    job = jobs.get(job_id)
+    if job is None or job["stage"] in jobs.FINISHED_STAGES:
+        # Hand the finished job over to the session and redraw the whole page
+        st.session_state["job_id"] = None
+        if job is not None and job["stage"] == jobs.DONE:
+            st.session_state["analysis"] = job["result"]
+        else:
+            st.session_state["job_error"] = job["error"] if job is not None else "The analysis job was lost."
+        st.rerun()
+
+    st.progress(job["progress"], text=f"{job['stage'].capitalize()}: {job['message']}")
+    if job["partial"]:
+        # Early look at the pages fetched so far. They aren't in the search
+        # index until the fetch is stored, so locations match by substring.
+        df = analytics.build_frame(job["partial"])
+        render_id = f"partial-{len(df)}"
+        keyword = job["keyword"]
+        tab1, tab2, tab3 = st.tabs(["📊 Overview", "📍 Locations", "🔥 Top Tweets"])
+        with tab1:
+            render_overview(df, render_id)
+        with tab2:
+            render_locations(df, keyword, render_id, mask=analytics.keyword_mask(df, keyword))
+        with tab3:
+            render_top_tweets(df)
+
+
+def render_status(analysis, layout, reused):
+    import analysis_cache
+    from twitter_client import cache_stats
+
+    keyword = analysis["params"]["keyword"]
+    tweets_data = analysis["batch"]["tweets"]
+    with layout["progress"]:
+        stats = cache_stats()
+        st.caption(f"Tweet cache: {stats['hits']} hits, {stats['misses']} misses, "
+                   f"{stats['pages_from_cache']} pages reused, {stats['pages_fetched']} pages fetched")
+        if reused:
+            age = int((time.time() - analysis["created_at"]) / 60)
+            source = "the precomputed report" if analysis.get("precomputed") else "cached results"
+            st.caption(f"Showing {source} from {age} min ago. Use Refresh to fetch again.")
+
+        # Success message with custom styling
+        if not analysis["complete"]:
+            failed = ", ".join(str(page["page"]) for page in analysis["failed_pages"])
+            st.warning(f"Results are incomplete: page(s) {failed} could not be fetched "
+                       f"({analysis['failed_pages'][0]['error']}).")
+
+        st.markdown(f"""
+        <div style="background-color: #E8F7EF; color: #0C6B58; padding: 12px; border-radius: 8px; 
+                    display: flex; align-items: center; margin-bottom: 20px; border-left: 4px solid #0C6B58;">
+            <span style="font-size: 20px; margin-right: 8px;">✅</span>
+            <span>Successfully fetched {analysis["new_tweets"]} new tweets related to "{keyword}" ({len(tweets_data)} in the selected time range)</span>
+        </div>
+        """, unsafe_allow_html=True)
+        duplicates = len(tweets_data) - len(analysis["collapsed"]["tweets"])
+        if duplicates:
+            st.caption(f"{duplicates} near-duplicate tweets and retweets were merged into "
+                       f"{len(analysis['collapsed']['tweets'])} unique tweets for the charts and summary.")
+
+        # Download button with custom styling
+        col1, col2 = st.columns([1, 3])
+        with col1, analysis_cache.open_download(analysis) as dump:
+            st.download_button(
+                label="⬇️ Download Tweet Data",
+                data=dump,
+                file_name=os.path.basename(dump.name),
+                mime="application/gzip",
+                on_click="ignore",
+            )
+
+        st.markdown("<br>", unsafe_allow_html=True)
+
+
+def render_dashboard(analysis, layout):
+    import analysis_cache
+    import tracing
+
+    if analysis["batch"]["tweets"]:
+        # Final render over the merged history
+        keyword = analysis["params"]["keyword"]
+        df = analysis_cache.get_frame(analysis)
+        with layout["overview"].container(), tracing.span("render.overview", rows=len(df)):
+            render_overview(df, "final")
+            render_sentiment(df, "final")
+        with layout["locations"].container(), tracing.span("render.locations", rows=len(df)):
+            render_locations(df, keyword, "final")
+        with layout["top_tweets"].container(), tracing.span("render.top_tweets", rows=len(df)):
+            render_top_tweets(df)
+        with layout["over_time"].container(), tracing.span("render.over_time"):
+            render_trends(analysis.get("trends", []))
+            render_over_time(keyword, "final")
+        with layout["search"].container():
+            render_search(keyword)
+    else:
+        with layout["overview"].container():
+            st.info("No tweets available to display.")
+
+
+def render_summary(analysis, layout):
+    with layout["summary"]:
+        summary_response = analysis["summary"]
+
+        if "error" in summary_response:
+            st.error(summary_response["error"])
+        else:
+            st.markdown(f"""
+            <div style="background-color: {LIGHT_BLUE}; border-radius: 12px; padding: 20px; margin-bottom: 30px; 
+                    border: 1px solid {TWITTER_BLUE};">
+                <h3 style="color: {TWITTER_BLUE}; margin-top: 0;">
+                    <span style="font-size: 24px;">🧠</span> Synapt Insights
+                </h3>
+                <div style="color: {DARK_TEXT}; line-height: 1.6;">
+                    {summary_response.get("summary", "No summary returned.")}
+                
+            """, unsafe_allow_html=True)
+            if summary_response.get("cached"):
+                st.caption("Summary reused from cache (same tweet set as a previous run)")
+
+
+def render_diagnostics():
+    import tracing
+
+    with st.expander("⏱️ Diagnostics", expanded=False):
+        summary = tracing.summary()
+        if not summary:
+            st.info("No spans recorded yet. Run an analysis with diagnostics enabled.")
+            return
+        st.markdown("**Time per stage** (process-wide, since tracing was enabled)")
+        st.dataframe(summary, use_container_width=True, hide_index=True)
+
+        counters = tracing.counters()
+        if counters:
+            cols = st.columns(len(counters))
+            for col, (name, value) in zip(cols, sorted(counters.items())):
+                col.metric(name, f"{value:,}")
+
+        st.markdown("**Recent spans**")
+        st.dataframe(
+            [{"span": record["name"], "ms": record["duration_ms"], "thread": record["thread"],
+              "error": record.get("error", ""), **record["attrs"]}
+             for record in reversed(tracing.recent_spans(limit=50))],
+            use_container_width=True, hide_index=True,
+        )
+
+        col1, col2, col3 = st.columns([1, 1, 2])
+        with col1:
+            st.download_button("Spans (JSON)", data=tracing.export_json(), file_name="spans.json",
+                               mime="application/json", on_click="ignore")
+        with col2:
+            st.download_button("Metrics (Prometheus)", data=tracing.prometheus_text(), file_name="metrics.prom",
+                               mime="text/plain", on_click="ignore")
+
+
 def main():
     st.set_page_config(page_title="X Market Analysis", layout="wide")
     set_custom_theme()
+
+    if os.getenv("METRICS_PORT"):
+        # Prometheus text endpoint, started once per process
+        import tracing
+        tracing.start_metrics_server()
     
     # App header with Twitter-like styling
     col1, col2 = st.columns([1, 5])
@@ -208,330 +861,67 @@ def main():
             page_option = st.selectbox("Pages to fetch", options=["1 page", "2 page", "4 page", "7 page"])
         
         region = st.text_input("Region filter", placeholder="e.g., India, USA")
+
+        full_refresh = st.checkbox("Force full backfill", value=False,
+                                   help="Ignore stored history and re-fetch the whole time range")
         
         st.markdown("""</div>""", unsafe_allow_html=True)
         
         st.markdown("<br>", unsafe_allow_html=True)
         run_analysis = st.button("🚀 Fetch and Analyze")
+        refresh = st.button("🔄 Refresh", help="Fetch and summarize again instead of reusing cached results")
+        show_diagnostics = st.checkbox("Show diagnostics", value=False,
+                                       help="Record timings for every stage (process-wide) and show them below")
 
-    # Main content
-    if run_analysis:
-        week_mapping = {"1 week": 1, "2 weeks": 2, "3 weeks": 3, "4 weeks": 4}
-        page_mapping = {"1 page": 1, "2 page": 2, "4 page": 4, "7 page": 7}
-        selected_weeks = week_mapping[week_option]
-        selected_pages = page_mapping[page_option]
+    week_mapping = {"1 week": 1, "2 weeks": 2, "3 weeks": 3, "4 weeks": 4}
+    page_mapping = {"1 page": 1, "2 page": 2, "4 page": 4, "7 page": 7}
+    selected_weeks = week_mapping[week_option]
+    selected_pages = page_mapping[page_option]
 
-        # Create a progress container
-        progress_container = st.container()
-        with progress_container:
-            with st.spinner(f"Fetching tweets about '{keyword}'..."):
-                tweets_data = fetch_tweets(keyword, pages=selected_pages, weeks=selected_weeks, region=region)
+    # Spans are recorded while this session shows diagnostics; the hold is
+    # released on untick, or dropped with the session's state
+    import tracing
+    if show_diagnostics and "trace_hold" not in st.session_state:
+        st.session_state.trace_hold = tracing.hold()
+    elif not show_diagnostics and "trace_hold" in st.session_state:
+        tracing.release(st.session_state.pop("trace_hold"))
 
-        # Success message with custom styling
-        st.markdown(f"""
-        <div style="background-color: #E8F7EF; color: #0C6B58; padding: 12px; border-radius: 8px; 
-                    display: flex; align-items: center; margin-bottom: 20px; border-left: 4px solid #0C6B58;">
-            <span style="font-size: 20px; margin-right: 8px;">✅</span>
-            <span>Successfully fetched {len(tweets_data)} tweets related to "{keyword}"</span>
-        </div>
-        """, unsafe_allow_html=True)
-
-        # Save data
-        os.makedirs("data", exist_ok=True)
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        filename = f"data/{keyword}_{timestamp}.json"
-        with open(filename, "w", encoding="utf-8") as f:
-            json.dump(tweets_data, f, ensure_ascii=False, indent=2)
-
-        # Download button with custom styling
-        col1, col2 = st.columns([1, 3])
-        with col1:
-            st.download_button(
-                label="⬇️ Download Tweet Data",
-                data=json.dumps(tweets_data, indent=2),
-                file_name=f"{keyword}_{timestamp}.json",
-                mime="application/json"
-            )
+    # Main content: the current analysis lives in session state so reruns
+    # (widget changes, downloads) redraw it without repeating the pipeline
+    analysis = st.session_state.get("analysis")
+    job_id = st.session_state.get("job_id")
+    reused = False
+    if run_analysis or refresh:
+        import analysis_cache
+        import jobs
 
-        st.markdown("<br>", unsafe_allow_html=True)
-        
-        with st.spinner("Analyzing tweets with Synapt AI..."):
-            summary_response = summarize_with_gemini({"tweets": tweets_data})
-        
-        if "error" in summary_response:
-            st.error(summary_response["error"])
+        st.session_state["job_error"] = None
+        key = analysis_cache.result_key(keyword, selected_pages, selected_weeks, region)
+        if refresh or full_refresh:
+            analysis_cache.invalidate(key)
+            analysis = None
         else:
-            st.markdown(f"""
-            <div style="background-color: {LIGHT_BLUE}; border-radius: 12px; padding: 20px; margin-bottom: 30px; 
-                    border: 1px solid {TWITTER_BLUE};">
-                <h3 style="color: {TWITTER_BLUE}; margin-top: 0;">
-                    <span style="font-size: 24px;">🧠</span> Synapt Insights
-                </h3>
-                <div style="color: {DARK_TEXT}; line-height: 1.6;">
-                    {summary_response.get("summary", "No summary returned.")}
-                
-            """, unsafe_allow_html=True)
+            analysis = analysis_cache.get_result(key) or analysis_cache.load_report(key)
+            reused = analysis is not None
 
-        # Load data to DataFrame
-        df = pd.DataFrame(tweets_data)
-        df["createdAt"] = pd.to_datetime(df["createdAt"], errors='coerce')
-        if "author" in df.columns:
-            df["location"] = df["author"].apply(lambda x: x.get("location", "").strip() if isinstance(x, dict) else "")
-            df["username"] = df["author"].apply(lambda x: x.get("userName", "Unknown") if isinstance(x, dict) else "Unknown")
-
-        df["engagement"] = (
-            df.get("likeCount", 0) +
-            df.get("retweetCount", 0) +
-            df.get("replyCount", 0) +
-            df.get("quoteCount", 0)
-        )
-
-        # Tabs for Results
-        tab1, tab2, tab3 = st.tabs(["📊 Overview", "📍 Locations", "🔥 Top Tweets"])
-
-        with tab1:
-            # Overview metrics
-            metrics_cols = st.columns(4)
-            with metrics_cols[0]:
-                st.metric("Total Tweets", len(df))
-            with metrics_cols[1]:
-                avg_engagement = int(df["engagement"].mean()) if not df.empty else 0
-                st.metric("Avg. Engagement", avg_engagement)
-            with metrics_cols[2]:
-                unique_users = df["username"].nunique() if "username" in df.columns else 0
-                st.metric("Unique Users", unique_users)
-            with metrics_cols[3]:
-                total_likes = df["likeCount"].sum() if "likeCount" in df.columns else 0
-                st.metric("Total Likes", f"{total_likes:,}")
-            
-            # Create two columns for charts
-            chart_col1, chart_col2 = st.columns(2)
-            
-            with chart_col1:
-                # Engagement pie chart
-                st.markdown(f"""
-                <div class="chart-section">
-                    <h3 style="color: {DARK_TEXT}; margin-top: 0px; font-size: 18px;">
-                        <span style="color: {TWITTER_BLUE};">📊</span> Engagement Breakdown
-                    </h3>
-                </div>
-                """, unsafe_allow_html=True)
-                
-                if not df.empty:
-                    engagement_data = [
-                        df["likeCount"].fillna(0).sum(),
-                        df["retweetCount"].fillna(0).sum(),
-                        df["replyCount"].fillna(0).sum(),
-                        df["quoteCount"].fillna(0).sum()
-                    ]
-                    
-                    labels = ["Likes", "Retweets", "Replies", "Quotes"]
-                    
-                    # Check if we have engagement data
-                    if sum(engagement_data) > 0:
-                        fig_engagement = go.Figure(data=[go.Pie(
-                            labels=labels,
-                            values=engagement_data,
-                            hole=.4,
-                            marker=dict(colors=[TWITTER_BLUE, '#6c5ce7', '#00bfa6', '#ff6b6b']),
-                            textinfo='label+percent',
-                            insidetextorientation='radial',
-                            hoverinfo='label+value'
-                        )])
-                        
-                        fig_engagement.update_layout(
-                            showlegend=False,
-                            plot_bgcolor=WHITE,
-                            paper_bgcolor=WHITE,
-                            font_color=DARK_TEXT,
-                            margin=dict(l=20, r=20, t=20, b=20),
-                            height=300,
-                            annotations=[
-                                dict(
-                                    text=f'Total<br>{sum(engagement_data):,}',
-                                    x=0.5, y=0.5,
-                                    font_size=16,
-                                    font_color=DARK_TEXT,
-                                    showarrow=False
-                                )
-                            ]
-                        )
-                        
-                        st.plotly_chart(fig_engagement, use_container_width=True)
-                    else:
-                        st.info("No engagement data found in the fetched tweets.")
-            
-            with chart_col2:
-                # Hashtags Analysis
-                st.markdown(f"""
-                <div class="chart-section">
-                    <h3 style="color: {DARK_TEXT}; margin-top: 0px; font-size: 18px;">
-                        <span style="color: {TWITTER_BLUE};">🏷️</span> Top Hashtags
-                    </h3>
-                </div>
-                """, unsafe_allow_html=True)
-                
-                hashtags = []
-                for entry in tweets_data:
-                    tags = entry.get("entities", {}).get("hashtags", [])
-                    hashtags.extend([tag["text"].lower() for tag in tags])
-                
-                if hashtags:
-                    hashtags_df = pd.DataFrame(hashtags, columns=["Hashtag"])
-                    top_hashtags = hashtags_df["Hashtag"].value_counts().head(5).reset_index()
-                    top_hashtags.columns = ["Hashtag", "Count"]
-                    
-                    fig_hashtags = px.bar(
-                        top_hashtags, 
-                        x="Hashtag", 
-                        y="Count", 
-                        title="best performing hashtags",
-                        color_discrete_sequence=[TWITTER_BLUE]
-                    )
-                    fig_hashtags.update_layout(
-                        plot_bgcolor=WHITE,
-                        paper_bgcolor=WHITE,
-                        font_color=DARK_TEXT,
-                        title_font_color=DARK_TEXT,
-                        margin=dict(l=20, r=20, t=20, b=20),
-                        bargap=0.4,
-                        height=300,
-                        xaxis=dict(
-                            title="",
-                            tickangle=-30
-                        ),
-                        yaxis=dict(
-                            title="Count"
-                        )
-                    )
-                    st.plotly_chart(fig_hashtags, use_container_width=True)
-                else:
-                    st.info("No hashtags found in the analyzed tweets.")
-                    
-            # Activity Timeline
-            st.markdown(f"""
-            <div class="chart-section">
-                <h3 style="color: {DARK_TEXT}; margin-top: 0px; font-size: 18px;">
-                    <span style="color: {TWITTER_BLUE};">📅</span> Activity Timeline
-                </h3>
-            </div>
-            """, unsafe_allow_html=True)
-            
-            # Activity over time
-            if len(df) >= 3:
-                # Group by date and count tweets
-                df['date'] = df['createdAt'].dt.date
-                tweet_counts = df.groupby('date').size().reset_index(name='count')
-                
-                fig_timeline = px.line(
-                    tweet_counts, 
-                    x='date', 
-                    y='count',
-                    labels={"date": "Date", "count": "Tweets"}
-                )
-                
-                fig_timeline.update_traces(
-                    line_color=TWITTER_BLUE,
-                    line_width=3,
-                    mode='lines+markers',
-                    marker=dict(size=8, color=TWITTER_BLUE)
-                )
-                
-                fig_timeline.update_layout(
-                    plot_bgcolor=WHITE,
-                    paper_bgcolor=WHITE,
-                    font_color=DARK_TEXT,
-                    margin=dict(l=10, r=10, t=10, b=10),
-                    height=250,
-                    xaxis=dict(
-                        showgrid=True,
-                        gridcolor='rgba(220,220,220,0.4)'
-                    ),
-                    yaxis=dict(
-                        showgrid=True,
-                        gridcolor='rgba(220,220,220,0.4)'
-                    )
-                )
-                
-                st.plotly_chart(fig_timeline, use_container_width=True)
-            else:
-                st.info("Not enough data points for timeline visualization.")
-                
-     
+        # A cache miss attaches to the job already running for this query,
+        # or starts one
+        job_id = None
+        if analysis is None:
+            job_id = jobs.submit_analysis(keyword, selected_pages, selected_weeks, region, full_refresh)
+        st.session_state["analysis"] = analysis
+        st.session_state["job_id"] = job_id
 
-        with tab2:
-            st.markdown(f"""
-            <h3 style="color: {DARK_TEXT}; margin-top: 10px;">
-                <span style="color: {TWITTER_BLUE};">🌍</span> Top Locations
-            </h3>
-            """, unsafe_allow_html=True)
-            
-            keyword_lower = keyword.lower()
-            keyword_locs = df[df["text"].str.lower().str.contains(keyword_lower, na=False)]
-            keyword_locs = keyword_locs[keyword_locs["location"] != ""]
-            
-            if not keyword_locs.empty:
-                top_locs = keyword_locs["location"].value_counts().head(10).reset_index()
-                top_locs.columns = ["Location", "Mentions"]
-                
-                fig_loc = px.bar(
-                    top_locs, 
-                    x="Location", 
-                    y="Mentions", 
-                    title=f"Top 10 Locations Discussing '{keyword}'",
-                    color_discrete_sequence=[TWITTER_BLUE]
-                )
-                fig_loc.update_layout(
-                    plot_bgcolor=WHITE,
-                    paper_bgcolor=WHITE,
-                    font_color=DARK_TEXT,
-                    title_font_color=DARK_TEXT,
-                    margin=dict(l=20, r=20, t=40, b=20),
-                    title_x=0.5,
-                    bargap=0.4
-                )
-                st.plotly_chart(fig_loc, use_container_width=True)
-                
-                
+    if st.session_state.get("job_error"):
+        st.error(f"Analysis failed: {st.session_state['job_error']}")
 
-        with tab3:
-            st.markdown(f"""
-            <h3 style="color: {DARK_TEXT}; margin-top: 10px;">
-                <span style="color: {TWITTER_BLUE};">🔥</span> Top Tweets by Engagement
-            </h3>
-            """, unsafe_allow_html=True)
-            
-            top_engaged = df.sort_values(by="engagement", ascending=False).head(5)
-            
-            if not top_engaged.empty:
-                for _, row in top_engaged.iterrows():
-                    engagement = row.get('engagement', 0)
-                    created_at = row['createdAt'].strftime('%b %d, %Y') if pd.notnull(row['createdAt']) else ""
-                    
-                    st.markdown(f"""
-                        <div class="tweet-card">
-                            <div style="display: flex; justify-content: space-between; margin-bottom: 8px;">
-                                <div>
-                                    <span style="font-weight: bold; color: {DARK_TEXT};">@{row['username']}</span>
-                                    <span style="color: {GRAY_TEXT}; margin-left: 5px;">· {created_at}</span>
-                                </div>
-                                <div style="color: {TWITTER_BLUE}; font-weight: bold;">
-                                    {engagement} engagement
-                                </div>
-                            </div>
-                            <p style="font-size: 15px; line-height: 1.5; color: {DARK_TEXT}; margin-bottom: 12px;">
-                                {row['text']}
-                            </p>
-                            <div style="display: flex; justify-content: space-between; color: {GRAY_TEXT};">
-                                <span>❤️ {row.get('likeCount', 0)}</span>
-                                <span>🔁 {row.get('retweetCount', 0)}</span>
-                                <span>💬 {row.get('replyCount', 0)}</span>
-                                <span>🔖 {row.get('quoteCount', 0)}</span>
-                            </div>
-                        </div>
-                    """, unsafe_allow_html=True)
-            else:
-                st.info("No tweets available to display.")
+    if job_id is not None:
+        render_job(job_id)
+    elif analysis is not None:
+        layout = create_layout()
+        render_status(analysis, layout, reused)
+        render_dashboard(analysis, layout)
+        render_summary(analysis, layout)
     else:
         # Display welcome message when app first loads
         st.markdown(f"""
@@ -581,6 +971,9 @@ def main():
             </div>
             """, unsafe_allow_html=True)
 
+    if show_diagnostics:
+        render_diagnostics()
+
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,313 @@
+import argparse
+import hashlib
+import json
+import os
+import random
+import re
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from tweet_dump import dump_paths, dump_stem, read_raw_tweets
+
+# Offline stand-ins for twitterapi.io and Gemini, so fetching, caching and
+# concurrency can be exercised and profiled without live, paid services.
+#
+#   TWITTER_BACKEND=replay   serve the data/ dumps in-process instead of the API
+#   GEMINI_BACKEND=fake      deterministic summaries instead of Gemini
+#   python backends.py serve --port 8765
+#       HTTP stand-in for the search endpoint; point the app at it with
+#       TWITTER_API_URL=http://127.0.0.1:8765/twitter/tweet/advanced_search
+#
+# Latency and failures are injected with the REPLAY_* and FAKE_LLM_* settings.
+
+CREATED_AT_FORMAT = "%a %b %d %H:%M:%S %z %Y"
+SEARCH_PATH = "/twitter/tweet/advanced_search"
+_QUERY_TIME = re.compile(r"^(since|until):(\d{4}-\d{2}-\d{2}_\d{2}:\d{2}:\d{2})_UTC$")
+
+
+def _env_float(name, default):
+    return float(os.getenv(name, str(default)))
+
+
+def corpus_name(path):
+    # "gaming_20250508_113131.json" (or an export, with a settings hash
+    # after the stamp) -> "gaming"
+    return re.sub(r"_\d{8}_\d{6}(_[0-9a-f]{8})?$", "", dump_stem(path)).lower()
+
+
+class ReplayBackend:
+    # Serves recorded search results with real cursor pagination. Recorded
+    # timestamps are shifted so each corpus' newest tweet is "now", which
+    # keeps the app's since:/until: windows (and incremental refresh) meaningful.
+
+    def __init__(self, data_dir="data", page_size=20, latency=0.0, jitter=0.0,
+                 error_rate=0.0, rate_limit_rate=0.0, seed=None, shift_time=True):
+        self.data_dir = data_dir
+        self.page_size = page_size
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.shift_time = shift_time
+        self.requests = 0
+        self.failures = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._corpora = None
+
+    @classmethod
+    def from_env(cls):
+        seed = os.getenv("REPLAY_SEED")
+        return cls(
+            data_dir=os.getenv("REPLAY_DATA_DIR", "data"),
+            page_size=int(os.getenv("REPLAY_PAGE_SIZE", "20")),
+            latency=_env_float("REPLAY_LATENCY", 0.0),
+            jitter=_env_float("REPLAY_JITTER", 0.0),
+            error_rate=_env_float("REPLAY_ERROR_RATE", 0.0),
+            rate_limit_rate=_env_float("REPLAY_RATE_LIMIT_RATE", 0.0),
+            seed=int(seed) if seed else None,
+            shift_time=os.getenv("REPLAY_SHIFT_TIME", "1") != "0",
+        )
+
+    def _load(self):
+        with self._lock:
+            if self._corpora is not None:
+                return self._corpora
+
+            corpora = {}
+            for path in dump_paths(self.data_dir):
+                tweets = read_raw_tweets(path)
+                corpus = corpora.setdefault(corpus_name(path), {})
+                for tweet in tweets:
+                    if tweet.get("id"):
+                        corpus.setdefault(str(tweet["id"]), tweet)
+
+            self._corpora = {}
+            now = int(time.time())
+            for name, corpus in corpora.items():
+                items = []
+                for tweet in corpus.values():
+                    try:
+                        created = int(datetime.strptime(tweet["createdAt"], CREATED_AT_FORMAT).timestamp())
+                    except (KeyError, TypeError, ValueError):
+                        continue
+                    items.append((created, tweet))
+
+                # Each corpus is shifted on its own, so every keyword replays
+                # as if it was recorded just now
+                offset = now - max(created for created, _ in items) if self.shift_time and items else 0
+                shifted = []
+                for created, tweet in items:
+                    if offset:
+                        tweet = dict(tweet)
+                        tweet["createdAt"] = datetime.fromtimestamp(created + offset, timezone.utc).strftime(CREATED_AT_FORMAT)
+                    shifted.append((created + offset, tweet))
+                self._corpora[name] = shifted
+            return self._corpora
+
+    def search(self, query, cursor="", query_type="Top"):
+        corpora = self._load()
+        since = until = None
+        terms = []
+        for token in (query or "").split():
+            match = _QUERY_TIME.match(token)
+            if match:
+                value = datetime.strptime(match.group(2), "%Y-%m-%d_%H:%M:%S").replace(tzinfo=timezone.utc).timestamp()
+                if match.group(1) == "since":
+                    since = value
+                else:
+                    until = value
+            elif ":" not in token:
+                terms.append(token.lower())
+
+        # A corpus whose name matches the keyword is replayed as recorded;
+        # otherwise fall back to a text search across every corpus
+        keyword = " ".join(terms)
+        if keyword in corpora:
+            candidates = corpora[keyword]
+        else:
+            candidates = [
+                item for items in corpora.values() for item in items
+                if all(term in item[1].get("text", "").lower() for term in terms)
+            ]
+
+        matches = [
+            (created, tweet) for created, tweet in candidates
+            if (since is None or created >= since) and (until is None or created < until)
+        ]
+        if query_type == "Latest":
+            # Newest first; "Top" keeps the recorded order
+            matches.sort(key=lambda item: -item[0])
+        matches = [tweet for _, tweet in matches]
+        start = int(cursor) if cursor else 0
+        end = start + self.page_size
+        return {
+            "tweets": matches[start:end],
+            "has_next_page": end < len(matches),
+            "next_cursor": str(end) if end < len(matches) else "",
+        }
+
+    def handle(self, params, headers):
+        # Returns (status, headers, body) for one search request
+        with self._lock:
+            self.requests += 1
+            delay = max(0.0, self.latency + self._random.uniform(-self.jitter, self.jitter))
+            roll = self._random.random()
+        if delay:
+            time.sleep(delay)
+
+        if not headers.get("X-API-Key"):
+            return 401, {}, {"error": "missing X-API-Key"}
+        if roll < self.rate_limit_rate:
+            with self._lock:
+                self.failures += 1
+            return 429, {"Retry-After": "1", "x-ratelimit-remaining": "0"}, {"error": "rate limited"}
+        if roll < self.rate_limit_rate + self.error_rate:
+            with self._lock:
+                self.failures += 1
+            return 503, {}, {"error": "injected failure"}
+        return 200, {}, self.search(
+            params.get("query", ""), params.get("cursor", ""), params.get("queryType", "Top")
+        )
+
+    def stats(self):
+        with self._lock:
+            return {"requests": self.requests, "failures": self.failures}
+
+
+class ReplayResponse:
+    def __init__(self, status_code, headers, body):
+        self.status_code = status_code
+        self.headers = headers
+        self._body = body
+
+    @property
+    def content(self):
+        return json.dumps(self._body).encode("utf-8")
+
+    def json(self):
+        return self._body
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            import requests
+            raise requests.exceptions.HTTPError(f"{self.status_code} replay error", response=self)
+
+
+class ReplaySession:
+    # Drop-in for the requests.Session calls twitter_client makes
+    def __init__(self, backend):
+        self.backend = backend
+
+    def get(self, url, headers=None, params=None, timeout=None):
+        return ReplayResponse(*self.backend.handle(params or {}, headers or {}))
+
+
+def _make_handler(backend):
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            url = urlparse(self.path)
+            if url.path != SEARCH_PATH:
+                self._reply(404, {}, {"error": "not found"})
+                return
+            params = {name: values[-1] for name, values in parse_qs(url.query, keep_blank_values=True).items()}
+            self._reply(*backend.handle(params, {"X-API-Key": self.headers.get("X-API-Key")}))
+
+        def _reply(self, status, headers, body):
+            payload = json.dumps(body).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            for name, value in headers.items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+def make_server(backend, host="127.0.0.1", port=8765):
+    return ThreadingHTTPServer((host, port), _make_handler(backend))
+
+
+class _FakeResponse:
+    def __init__(self, text):
+        self.text = text
+
+
+class _FakeModels:
+    def __init__(self, client):
+        self.client = client
+
+    def generate_content(self, model, contents):
+        client = self.client
+        with client.lock:
+            client.calls += 1
+        tokens = len(contents) / 4
+        delay = client.latency + tokens / 1000 * client.seconds_per_1k_tokens
+        if delay:
+            time.sleep(delay)
+
+        # Same prompt, same answer: built only from the prompt's content
+        digest = hashlib.sha256(contents.encode("utf-8")).hexdigest()[:12]
+        tags = Counter(tag.lower() for tag in re.findall(r"#(\w+)", contents))
+        top_tags = ", ".join(f"#{tag}" for tag, _ in tags.most_common(5)) or "none"
+        lines = [line for line in contents.splitlines() if line.strip()]
+        return _FakeResponse(
+            "## Key Insights\n"
+            f"- Offline summary {digest} of {len(lines)} prompt lines (~{int(tokens)} tokens)\n"
+            f"- Most mentioned hashtags: {top_tags}\n"
+            "## Sentiment\n- Not analyzed by the fake model\n"
+        )
+
+
+class FakeGeminiClient:
+    # Mimics the genai.Client surface gemini_client uses (client.models.generate_content)
+    def __init__(self, latency=None, seconds_per_1k_tokens=None):
+        self.latency = _env_float("FAKE_LLM_LATENCY", 0.0) if latency is None else latency
+        self.seconds_per_1k_tokens = (_env_float("FAKE_LLM_SECONDS_PER_1K_TOKENS", 0.0)
+                                      if seconds_per_1k_tokens is None else seconds_per_1k_tokens)
+        self.calls = 0
+        self.lock = threading.Lock()
+        self.models = _FakeModels(self)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local twitterapi.io stand-in serving recorded corpora")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    serve = subparsers.add_parser("serve")
+    serve.add_argument("--host", default="127.0.0.1")
+    serve.add_argument("--port", type=int, default=8765)
+    serve.add_argument("--data-dir", default=os.getenv("REPLAY_DATA_DIR", "data"))
+    serve.add_argument("--page-size", type=int, default=int(os.getenv("REPLAY_PAGE_SIZE", "20")))
+    serve.add_argument("--latency", type=float, default=_env_float("REPLAY_LATENCY", 0.0))
+    serve.add_argument("--jitter", type=float, default=_env_float("REPLAY_JITTER", 0.0))
+    serve.add_argument("--error-rate", type=float, default=_env_float("REPLAY_ERROR_RATE", 0.0))
+    serve.add_argument("--rate-limit-rate", type=float, default=_env_float("REPLAY_RATE_LIMIT_RATE", 0.0))
+    serve.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    backend = ReplayBackend(
+        data_dir=args.data_dir, page_size=args.page_size, latency=args.latency, jitter=args.jitter,
+        error_rate=args.error_rate, rate_limit_rate=args.rate_limit_rate, seed=args.seed,
+    )
+    server = make_server(backend, args.host, args.port)
+    print(f"Serving {args.data_dir} at http://{args.host}:{args.port}{SEARCH_PATH}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print(f"Handled {backend.stats()['requests']} requests")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,227 @@
+import argparse
+import itertools
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import contextmanager
+from datetime import datetime
+
+# Headless runs of the dashboard pipeline (fetch, dedup, trends, summary)
+# for a list of queries, e.g. from cron overnight. Each query runs in its own
+# worker process and its report is saved to the store, where the dashboard
+# picks it up instead of computing the same query on demand.
+#
+#   python batch_runner.py queries.toml [--processes 4] [--full-refresh]
+#
+# The config is TOML (or JSON with the same keys). Top-level pages/weeks/
+# region are defaults; queries come from [[queries]] tables and/or from every
+# combination of keywords and regions:
+#
+#   pages = 2
+#   weeks = 1
+#   keywords = ["bitcoin", "ethereum"]
+#   regions = ["", "India"]
+#
+#   [[queries]]
+#   keyword = "skincare"
+#   pages = 4
+#
+# Exits with 1 if any query failed or was only partly fetched.
+MAX_PROCESSES = int(os.getenv("BATCH_PROCESSES", "4"))
+DEFAULTS = {"pages": 2, "weeks": 1, "region": ""}
+STAGES = ["fetch", "dedup", "trends", "summarize", "analytics", "store"]
+
+
+def load_config(path):
+    # Returns the list of queries; raises ValueError on a malformed config
+    with open(path, "rb") as f:
+        if path.endswith(".json"):
+            config = json.load(f)
+        else:
+            import tomllib
+            config = tomllib.load(f)
+
+    defaults = {field: config.get(field, value) for field, value in DEFAULTS.items()}
+    entries = [dict(entry) for entry in config.get("queries", [])]
+    regions = config.get("regions") or [defaults["region"]]
+    entries += [{"keyword": keyword, "region": region}
+                for keyword, region in itertools.product(config.get("keywords", []), regions)]
+
+    queries = []
+    for entry in entries:
+        query = {**defaults, **entry}
+        if not isinstance(query.get("keyword"), str) or not query["keyword"].strip():
+            raise ValueError(f"Query without a keyword: {entry}")
+        try:
+            query["pages"] = int(query["pages"])
+            query["weeks"] = int(query["weeks"])
+        except (TypeError, ValueError):
+            raise ValueError(f"pages and weeks must be whole numbers: {entry}") from None
+        query["keyword"] = query["keyword"].strip()
+        query["region"] = (query["region"] or "").strip()
+        queries.append(query)
+    if not queries:
+        raise ValueError("The config lists no queries")
+    return queries
+
+
+@contextmanager
+def _timed(timings, stage):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[stage] = time.perf_counter() - started
+
+
+def _analytics(df, keyword):
+    # The dashboard's headline numbers, as plain JSON-ready values
+    import analytics
+
+    return {
+        "overview": analytics.overview_metrics(df),
+        "engagement": analytics.engagement_totals(df),
+        "top_hashtags": analytics.top_hashtags(df, 10).to_dict("records"),
+        "top_countries": analytics.top_locations(df, keyword, 10, level="country").to_dict("records"),
+        "timeline": [{"date": str(row["date"]), "count": int(row["count"])}
+                     for row in analytics.daily_timeline(df).to_dict("records")],
+        "top_tweets": analytics.top_tweets(df, 5)["id"].tolist(),
+        "sentiment": analytics.sentiment_totals(df),
+        "sentiment_timeline": [{"date": str(row["date"]), "sentiment": round(float(row["sentiment"]), 3),
+                                "count": int(row["count"])}
+                               for row in analytics.sentiment_timeline(df).to_dict("records")],
+        "sentiment_by_hashtag": analytics.sentiment_by_hashtag(df, 10).round({"Sentiment": 3}).to_dict("records"),
+    }
+
+
+def run_query(query, full_refresh=False):
+    # Runs one query end to end and saves its report. Never raises, so one
+    # bad query doesn't stop the rest of the batch.
+    import analytics
+    import trends
+    from analysis_cache import result_key
+    from dedup import collapse_if_enabled
+    from gemini_client import summarize_with_gemini
+    from refresh import refresh_query
+    from tweet_store import save_report
+
+    timings = {}
+    outcome = {**query, "status": "ok", "error": None, "tweets": 0, "timings": timings}
+    started = time.perf_counter()
+    try:
+        keyword, pages, weeks, region = query["keyword"], query["pages"], query["weeks"], query["region"]
+        fetched_at = datetime.now()
+        with _timed(timings, "fetch"):
+            result = refresh_query(keyword, pages=pages, weeks=weeks, region=region,
+                                   full_refresh=full_refresh, fetched_at=fetched_at)
+        outcome["tweets"] = len(result["tweets"])
+        if not result["complete"]:
+            failed = result["failed_pages"]
+            outcome["status"] = "incomplete"
+            outcome["error"] = (f"page(s) {', '.join(str(page['page']) for page in failed)} "
+                                f"could not be fetched ({failed[0]['error']})")
+
+        with _timed(timings, "dedup"):
+            collapsed = collapse_if_enabled({"tweets": result["tweets"], "authors": result["authors"]})
+        with _timed(timings, "trends"):
+            df = analytics.build_frame(collapsed)
+            candidates = trends.detect(df, keyword)
+        with _timed(timings, "summarize"):
+            summary = summarize_with_gemini(collapsed, trends=trends.prompt_lines(candidates))
+        if "error" in summary:
+            outcome["status"] = "failed"
+            outcome["error"] = " - ".join(filter(None, [summary["error"], summary.get("details")]))
+            return outcome
+
+        with _timed(timings, "analytics"):
+            report_analytics = _analytics(df, keyword)
+        with _timed(timings, "store"):
+            report = {
+                "params": {"keyword": keyword, "pages": pages, "weeks": weeks, "region": region,
+                           "fetched_at": fetched_at.strftime("%Y%m%d_%H%M%S")},
+                "window_start": int(time.time()) - weeks * 7 * 24 * 3600,
+                "new_tweets": result["new_tweets"],
+                "complete": result["complete"],
+                "failed_pages": result["failed_pages"],
+                "summary": summary,
+                "trends": candidates,
+                "analytics": report_analytics,
+            }
+            save_report(result_key(keyword, pages, weeks, region), keyword, report, run_id=result["run_id"])
+    except Exception as e:
+        outcome["status"] = "failed"
+        outcome["error"] = f"{type(e).__name__}: {e}"
+    finally:
+        timings["total"] = time.perf_counter() - started
+    return outcome
+
+
+def _init_worker(workers):
+    # The request rate cap is per process, so every worker gets an equal
+    # share of TWITTER_MAX_RPS
+    import twitter_client
+
+    twitter_client.set_request_rate(twitter_client.MAX_REQUESTS_PER_SECOND / workers)
+
+
+def run_batch(queries, processes=MAX_PROCESSES, full_refresh=False, on_result=None):
+    # Outcomes in config order; on_result(outcome) is called as each finishes
+    outcomes = [None] * len(queries)
+    workers = max(1, min(processes, len(queries)))
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(workers,)) as pool:
+        futures = {pool.submit(run_query, query, full_refresh): index for index, query in enumerate(queries)}
+        for future in as_completed(futures):
+            index = futures[future]
+            try:
+                outcomes[index] = future.result()
+            except Exception as e:
+                # The worker process itself died
+                outcomes[index] = {**queries[index], "status": "failed", "error": f"{type(e).__name__}: {e}",
+                                   "tweets": 0, "timings": {}}
+            if on_result is not None:
+                on_result(outcomes[index])
+    return outcomes
+
+
+def print_report(outcomes, wall_s):
+    print(f"\n{'keyword':<20}{'region':<12}{'status':<12}{'tweets':>8}"
+          + "".join(f"{stage:>11}" for stage in STAGES + ["total"]))
+    for outcome in outcomes:
+        timings = outcome["timings"]
+        print(f"{outcome['keyword'][:19]:<20}{outcome['region'][:11] or '-':<12}{outcome['status']:<12}"
+              f"{outcome['tweets']:>8}"
+              + "".join(f"{timings[stage]:>10.2f}s" if stage in timings else f"{'-':>11}"
+                        for stage in STAGES + ["total"]))
+    failed = [outcome for outcome in outcomes if outcome["status"] != "ok"]
+    for outcome in failed:
+        print(f"{outcome['keyword']} ({outcome['region'] or 'any region'}): {outcome['status']}: {outcome['error']}")
+    print(f"{len(outcomes) - len(failed)} of {len(outcomes)} queries succeeded in {wall_s:.2f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Precompute dashboard reports for a list of queries")
+    parser.add_argument("config", help="TOML or JSON file listing the queries")
+    parser.add_argument("--processes", type=int, default=MAX_PROCESSES)
+    parser.add_argument("--full-refresh", action="store_true",
+                        help="ignore stored history and re-fetch each query's whole time range")
+    args = parser.parse_args()
+
+    try:
+        queries = load_config(args.config)
+    except (OSError, ValueError) as e:
+        parser.error(str(e))
+
+    started = time.perf_counter()
+    outcomes = run_batch(
+        queries, processes=args.processes, full_refresh=args.full_refresh,
+        on_result=lambda outcome: print(f"{outcome['status']:>10}  {outcome['keyword']} "
+                                        f"{outcome['region']}".rstrip(), flush=True),
+    )
+    print_report(outcomes, time.perf_counter() - started)
+    return 0 if all(outcome["status"] == "ok" for outcome in outcomes) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
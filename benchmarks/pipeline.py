@@ -0,0 +1,342 @@
+import argparse
+import gc
+import glob
+import json
+import os
+import platform
+import random
+import resource
+import string
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from functools import lru_cache
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import analytics
+import dedup
+import gemini_client
+import locations
+import search_index
+import sentiment
+import trends
+import tweet_dump
+import tweet_store
+from tweet_schema import project_tweets
+
+# Headless benchmark of the pipeline stages, from page JSON parsing to
+# persistence, on the recorded corpus and on synthetic datasets.
+# Usage: python benchmarks/pipeline.py [--sizes 10000,100000,1000000] [--no-alloc]
+# Every run appends one record per dataset to the history file together with
+# the git commit, and is compared against the previous run of that dataset.
+# The history is per machine, so it lives in the (untracked) .cache directory.
+
+HISTORY_PATH = os.path.join(ROOT, ".cache", "benchmark_history.jsonl")
+PAGE_SIZE = 20
+# Synthetic datasets replay this many distinct pages (with fresh tweet ids
+# and texts), so 1M tweets don't need 1M raw payloads in memory
+MAX_DISTINCT_PAGES = 250
+CREATED_AT_FORMAT = "%a %b %d %H:%M:%S %z %Y"
+
+
+def load_corpus():
+    tweets = {}
+    for path in sorted(glob.glob(os.path.join(ROOT, "data", "*.json"))):
+        with open(path, encoding="utf-8") as f:
+            for tweet in json.load(f):
+                if tweet.get("id"):
+                    tweets.setdefault(str(tweet["id"]), tweet)
+    return list(tweets.values())
+
+
+def _page_payload(tweets, has_next, cursor):
+    return json.dumps({"tweets": tweets, "has_next_page": has_next, "next_cursor": cursor})
+
+
+def corpus_dataset(corpus):
+    payloads = []
+    for start in range(0, len(corpus), PAGE_SIZE):
+        has_next = start + PAGE_SIZE < len(corpus)
+        payloads.append(_page_payload(corpus[start:start + PAGE_SIZE], has_next, str(start + PAGE_SIZE)))
+    return {"name": "corpus", "tweets": len(corpus), "pages": len(payloads), "payloads": payloads}
+
+
+def synthetic_dataset(corpus, size, seed=0):
+    # Recorded tweets with unique ids, texts resampled from the corpus
+    # vocabulary (so dedup doesn't collapse them), and randomized timestamps
+    # (last 4 weeks) and counts
+    rng = random.Random(seed)
+    now = time.time()
+    vocabulary = [word for tweet in corpus for word in (tweet.get("text") or "").split()]
+    pages = -(-size // PAGE_SIZE)
+    payloads = []
+    for page in range(min(pages, MAX_DISTINCT_PAGES)):
+        tweets = []
+        for index in range(PAGE_SIZE):
+            tweet = dict(rng.choice(corpus))
+            tweet["id"] = f"p{page}-{index}"
+            tweet["url"] = f"https://x.com/i/status/{tweet['id']}"
+            length = max(len((tweet.get("text") or "").split()), 4)
+            tweet["text"] = " ".join(rng.choice(vocabulary) for _ in range(length))
+            created = now - rng.uniform(0, 28 * 24 * 3600)
+            tweet["createdAt"] = datetime.fromtimestamp(created, timezone.utc).strftime(CREATED_AT_FORMAT)
+            for field in ("likeCount", "retweetCount", "replyCount", "quoteCount", "viewCount"):
+                tweet[field] = int(rng.paretovariate(1.2)) - 1
+            tweets.append(tweet)
+        payloads.append(_page_payload(tweets, page + 1 < pages, str(page + 1)))
+    return {"name": f"synthetic-{size}", "tweets": pages * PAGE_SIZE, "pages": pages, "payloads": payloads}
+
+
+@lru_cache(maxsize=None)
+def _replay_letters(replay):
+    # A fixed letter and digit substitution per replay round
+    rng = random.Random(replay)
+    letters = "".join(rng.sample(string.ascii_lowercase, 26))
+    digits = "".join(rng.sample(string.digits, 10))
+    return str.maketrans(string.ascii_lowercase + string.ascii_uppercase + string.digits,
+                         letters + letters.upper() + digits)
+
+
+def stage_parse(ctx):
+    # Page JSON -> compact batch, as the fetch path does per page
+    dataset = ctx["dataset"]
+    payloads = dataset["payloads"]
+    batch = None
+    for page in range(dataset["pages"]):
+        data = json.loads(payloads[page % len(payloads)])
+        start = len(batch["tweets"]) if batch else 0
+        batch = project_tweets(data["tweets"], batch=batch)
+        if page >= len(payloads):
+            # Replayed page: give its tweets ids (and prompt lines) of their
+            # own, and words no other replay has, so dedup doesn't fold them
+            # into the original page
+            table = _replay_letters(page // len(payloads))
+            for offset, tweet in enumerate(batch["tweets"][start:]):
+                tweet_id = f"s{page}-{offset}"
+                batch["tweets"][start + offset] = dict(tweet, id=tweet_id, url=f"{tweet['url']}#{tweet_id}",
+                                                       text=tweet["text"].translate(table))
+    ctx["batch"] = batch
+    ctx["keyword"] = ctx.get("keyword") or "the"
+
+
+def stage_dedup(ctx):
+    # Measured on its own; later stages keep the full batch so dataset sizes
+    # stay comparable between runs
+    ctx["collapsed"] = dedup.collapse(ctx["batch"])
+
+
+def stage_frame(ctx):
+    ctx["df"] = analytics.build_frame(ctx["batch"])
+
+
+def stage_engagement(ctx):
+    analytics.engagement_totals(ctx["df"])
+    analytics.overview_metrics(ctx["df"])
+
+
+def stage_hashtags(ctx):
+    analytics.top_hashtags(ctx["df"], 5)
+
+
+def stage_locations(ctx):
+    analytics.top_locations(ctx["df"], ctx["keyword"], 10)
+    # Canonical grouping; after the first round strings come from the in-process memo
+    db_path = os.path.join(ctx["tmpdir"], f"locations-{time.perf_counter_ns()}.db")
+    locations.level_counts(ctx["df"]["location"], "country", db_path=db_path)
+
+
+def stage_trends(ctx):
+    trends.detect(ctx["df"], ctx["keyword"])
+
+
+def stage_sentiment(ctx):
+    # Parsing already scores each tweet; this is the scorer on its own,
+    # without the repeated-text memo, then the dashboard aggregates
+    for tweet in ctx["batch"]["tweets"]:
+        sentiment.score(tweet["text"])
+    analytics.sentiment_timeline(ctx["df"])
+    analytics.sentiment_by_hashtag(ctx["df"], 10)
+
+
+def stage_timeline(ctx):
+    analytics.daily_timeline(ctx["df"])
+
+
+def stage_top_k(ctx):
+    analytics.top_tweets(ctx["df"], 5)
+
+
+def stage_prompt(ctx):
+    # Everything summarize_with_gemini does before calling the model
+    lines = gemini_client.canonical_lines(ctx["batch"]["tweets"])
+    gemini_client._digest(gemini_client.MODEL, gemini_client.PROMPT_VERSION, *lines)
+    chunks = gemini_client.pack_stable_chunks(lines, gemini_client.SUMMARY_PROMPT, gemini_client.CHUNK_TOKEN_BUDGET)
+    ctx["prompts"] = [gemini_client.CHUNK_PROMPT + "".join(chunk) for chunk in chunks]
+
+
+def stage_persist_dump(ctx):
+    path = os.path.join(ctx["tmpdir"], f"tweets-{time.perf_counter_ns()}.ndjson.gz")
+    tweet_dump.write_dump(ctx["batch"], path)
+    os.remove(path)
+
+
+def stage_store_write(ctx):
+    # Fresh database each time, so repeated runs measure inserts, not no-op upserts
+    db_path = os.path.join(ctx["tmpdir"], f"tweets-{time.perf_counter_ns()}.db")
+    tweet_store.save_run(ctx["batch"]["tweets"], ctx["keyword"], weeks=4, db_path=db_path)
+    ctx["db_path"] = db_path
+
+
+def stage_store_load(ctx):
+    tweet_store.load_tweets(ctx["keyword"], db_path=ctx["db_path"])
+
+
+def stage_search(ctx):
+    # Index lookups behind the Locations filter and the search tab
+    search_index.search_ids(ctx["keyword"], keyword=ctx["keyword"], db_path=ctx["db_path"])
+    search_index.search(ctx["keyword"], db_path=ctx["db_path"])
+
+
+STAGES = [
+    ("parse", stage_parse),
+    ("dedup", stage_dedup),
+    ("frame", stage_frame),
+    ("engagement", stage_engagement),
+    ("hashtags", stage_hashtags),
+    ("locations", stage_locations),
+    ("trends", stage_trends),
+    ("sentiment", stage_sentiment),
+    ("timeline", stage_timeline),
+    ("top_k", stage_top_k),
+    ("prompt", stage_prompt),
+    ("persist_dump", stage_persist_dump),
+    ("store_write", stage_store_write),
+    ("store_load", stage_store_load),
+    ("search", stage_search),
+]
+
+
+def current_rss_mb():
+    with open("/proc/self/statm") as f:
+        pages = int(f.read().split()[1])
+    return pages * os.sysconf("SC_PAGE_SIZE") / 1e6
+
+
+def peak_rss_mb():
+    # ru_maxrss is in KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024 / 1e6
+
+
+def measure(name, func, ctx, trace_alloc):
+    gc.collect()
+    rss_before = current_rss_mb()
+    start = time.perf_counter()
+    func(ctx)
+    wall = time.perf_counter() - start
+    result = {
+        "stage": name,
+        "wall_s": round(wall, 4),
+        "rss_mb": round(current_rss_mb(), 1),
+        "rss_delta_mb": round(current_rss_mb() - rss_before, 1),
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+    }
+    if trace_alloc:
+        # Separate pass, tracemalloc slows the stage down too much to time it.
+        # Only Python allocations are traced; Arrow buffers show up in RSS.
+        gc.collect()
+        tracemalloc.start()
+        func(ctx)
+        retained, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        result["alloc_peak_mb"] = round(peak / 1e6, 1)
+        result["alloc_retained_mb"] = round(retained / 1e6, 1)
+    return result
+
+
+def git_commit():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], cwd=ROOT, capture_output=True,
+                                text=True, check=True).stdout.strip()
+        dirty = bool(subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=ROOT,
+                                    capture_output=True, text=True, check=True).stdout.strip())
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+    return commit, dirty
+
+
+def previous_record(history_path, dataset_name):
+    if not os.path.exists(history_path):
+        return None
+    previous = None
+    with open(history_path, encoding="utf-8") as f:
+        for line in f:
+            record = json.loads(line)
+            if record["dataset"] == dataset_name:
+                previous = record
+    return previous
+
+
+def run_dataset(dataset, trace_alloc, keyword=None):
+    with tempfile.TemporaryDirectory() as tmpdir:
+        ctx = {"dataset": dataset, "tmpdir": tmpdir, "keyword": keyword}
+        return [measure(name, func, ctx, trace_alloc) for name, func in STAGES]
+
+
+def print_report(dataset, stages, previous):
+    before = {stage["stage"]: stage for stage in previous["stages"]} if previous else {}
+    print(f"\n{dataset['name']}: {dataset['tweets']} tweets, {dataset['pages']} pages")
+    print(f"{'stage':<14}{'wall s':>10}{'vs prev':>10}{'rss MB':>10}{'peak MB':>10}{'alloc MB':>10}")
+    for stage in stages:
+        change = ""
+        old = before.get(stage["stage"])
+        if old and old["wall_s"] > 0:
+            change = f"{(stage['wall_s'] / old['wall_s'] - 1) * 100:+.0f}%"
+        alloc = stage.get("alloc_peak_mb", "")
+        print(f"{stage['stage']:<14}{stage['wall_s']:>10.4f}{change:>10}{stage['rss_mb']:>10.1f}"
+              f"{stage['peak_rss_mb']:>10.1f}{alloc:>10}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the tweet pipeline stages")
+    parser.add_argument("--sizes", default="10000,100000",
+                        help="comma separated synthetic dataset sizes, e.g. 10000,100000,1000000")
+    parser.add_argument("--no-corpus", action="store_true", help="skip the recorded data/ corpus")
+    parser.add_argument("--no-alloc", action="store_true", help="skip the tracemalloc pass")
+    parser.add_argument("--keyword", default=None, help="keyword for the locations stage")
+    parser.add_argument("--history", default=HISTORY_PATH)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    corpus = load_corpus()
+    datasets = [] if args.no_corpus else [corpus_dataset(corpus)]
+    datasets += [synthetic_dataset(corpus, int(size), args.seed) for size in args.sizes.split(",") if size]
+
+    commit, dirty = git_commit()
+    for dataset in datasets:
+        stages = run_dataset(dataset, not args.no_alloc, args.keyword)
+        record = {
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "commit": commit,
+            "dirty": dirty,
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "dataset": dataset["name"],
+            "tweets": dataset["tweets"],
+            "stages": stages,
+        }
+        print_report(dataset, stages, previous_record(args.history, dataset["name"]))
+        os.makedirs(os.path.dirname(os.path.abspath(args.history)), exist_ok=True)
+        with open(args.history, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record) + "\n")
+        # Free this dataset's frame and batch before building the next one
+        del stages
+        gc.collect()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+import os
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# Startup budgets in milliseconds; the script exits non-zero when exceeded.
+# Usage: python benchmarks/startup.py
+COLD_START_BUDGET_MS = float(os.getenv("COLD_START_BUDGET_MS", "1000"))
+FIRST_RUN_BUDGET_MS = float(os.getenv("FIRST_RUN_BUDGET_MS", "1500"))
+RERUN_BUDGET_MS = float(os.getenv("RERUN_BUDGET_MS", "300"))
+SAMPLES = int(os.getenv("STARTUP_SAMPLES", "5"))
+
+
+def cold_import_ms():
+    # Fresh interpreter per sample so nothing is already in sys.modules
+    code = "import time; t = time.perf_counter(); import app; print((time.perf_counter() - t) * 1000)"
+    timings = []
+    for _ in range(SAMPLES):
+        output = subprocess.run(
+            [sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True, check=True,
+        ).stdout
+        timings.append(float(output.strip().splitlines()[-1]))
+    return min(timings)
+
+
+def welcome_screen_ms():
+    from streamlit.testing.v1 import AppTest
+
+    at = AppTest.from_file(os.path.join(ROOT, "app.py"), default_timeout=30)
+    start = time.perf_counter()
+    at.run()
+    first_run = (time.perf_counter() - start) * 1000
+    if at.exception:
+        raise RuntimeError(at.exception[0].message)
+
+    reruns = []
+    for _ in range(SAMPLES):
+        start = time.perf_counter()
+        at.run()
+        reruns.append((time.perf_counter() - start) * 1000)
+    return first_run, min(reruns)
+
+
+def main():
+    cold = cold_import_ms()
+    first_run, rerun = welcome_screen_ms()
+    results = [
+        ("cold import", cold, COLD_START_BUDGET_MS),
+        ("welcome screen first run", first_run, FIRST_RUN_BUDGET_MS),
+        ("welcome screen rerun", rerun, RERUN_BUDGET_MS),
+    ]
+
+    failed = False
+    for name, elapsed, budget in results:
+        status = "ok" if elapsed <= budget else "OVER BUDGET"
+        failed = failed or elapsed > budget
+        print(f"{name:<28} {elapsed:8.1f} ms  (budget {budget:.0f} ms)  {status}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,225 @@
+import hashlib
+import os
+import re
+from collections import defaultdict
+
+import tracing
+from tweet_schema import COUNT_FIELDS
+
+# Near-duplicate and retweet collapsing. Promotional copy-paste, "RT @x:"
+# variants and retweets of the same tweet are clustered and replaced by one
+# representative whose counts are the cluster's sums, so hashtag counts,
+# top tweets and the Gemini prompt aren't inflated by copies.
+#
+# Texts are compared by the Jaccard similarity of their word sets, estimated
+# with MinHash signatures. LSH banding (BANDS bands of ROWS rows) turns the
+# signatures into bucket keys, so only tweets sharing a bucket are compared
+# and clustering stays roughly linear in the number of tweets.
+THRESHOLD = float(os.getenv("DEDUP_THRESHOLD", "0.7"))
+ENABLED = os.getenv("DEDUP", "1") != "0"
+BANDS = 8
+ROWS = 4
+NUM_HASHES = BANDS * ROWS
+# Texts with fewer distinct words than this are too short to call near-duplicates
+MIN_TOKENS = 4
+SIGNATURE_CHUNK = 5000
+
+_URL = re.compile(r"https?://\S+")
+_RT_PREFIX = re.compile(r"^rt @\w+:\s*")
+_TOKEN = re.compile(r"[#@]?\w+")
+
+
+def tokens(text):
+    text = (text or "").lower()
+    if "http" in text:
+        text = _URL.sub(" ", text)
+    if text.startswith("rt @"):
+        text = _RT_PREFIX.sub("", text)
+    return _TOKEN.findall(text)
+
+
+def _seed_hashes(label):
+    # Fixed per-permutation constants, so signatures (and the collapsed set
+    # the summary cache keys on) are the same in every process
+    import numpy as np
+
+    digests = b"".join(hashlib.blake2b(f"{label}{index}".encode(), digest_size=8).digest()
+                       for index in range(NUM_HASHES))
+    return np.frombuffer(digests, dtype=np.uint64)
+
+
+def _minhash(token_ids, lengths, vocabulary_hashes, a, b):
+    # Signature rows for consecutive token runs, one run per text. With odd a,
+    # h -> a * h + b (mod 2**64) is a permutation of the token hashes.
+    import numpy as np
+
+    hashes = vocabulary_hashes[np.asarray(token_ids, dtype=np.int64)]
+    permuted = hashes[:, None] * a[None, :] + b[None, :]
+    offsets = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+    return np.minimum.reduceat(permuted, offsets, axis=0)
+
+
+def signatures(texts):
+    # MinHash signature per text as an (n, NUM_HASHES) uint64 array, plus a
+    # mask of texts long enough to compare. Identical texts, common with
+    # copy-paste spam, are hashed once.
+    import numpy as np
+
+    unique = {}
+    owners = np.fromiter((unique.setdefault(text, len(unique)) for text in texts), dtype=np.int64, count=len(texts))
+    unique_signatures = np.zeros((len(unique), NUM_HASHES), dtype=np.uint64)
+    usable = np.zeros(len(unique), dtype=bool)
+
+    # Word -> id, assigning the next id on first sight
+    vocabulary = defaultdict()
+    vocabulary.default_factory = vocabulary.__len__
+    token_ids = []
+    lengths = []
+    hashed = []
+    for index, text in enumerate(unique):
+        words = set(tokens(text))
+        if len(words) < MIN_TOKENS:
+            continue
+        token_ids.extend(map(vocabulary.__getitem__, words))
+        lengths.append(len(words))
+        hashed.append(index)
+
+    if hashed:
+        digests = b"".join(hashlib.blake2b(word.encode("utf-8"), digest_size=8).digest() for word in vocabulary)
+        vocabulary_hashes = np.frombuffer(digests, dtype=np.uint64)
+        a = _seed_hashes("a") | np.uint64(1)
+        b = _seed_hashes("b")
+        # Bounded chunks keep the token x permutation matrix small
+        position = 0
+        for start in range(0, len(hashed), SIGNATURE_CHUNK):
+            chunk_lengths = lengths[start:start + SIGNATURE_CHUNK]
+            size = sum(chunk_lengths)
+            unique_signatures[hashed[start:start + SIGNATURE_CHUNK]] = _minhash(
+                token_ids[position:position + size], chunk_lengths, vocabulary_hashes, a, b)
+            position += size
+        usable[hashed] = True
+    return unique_signatures[owners], usable[owners]
+
+
+def _components(size, left, right):
+    # Connected components of an edge list: every node ends up labelled with
+    # the smallest index in its component (min-label propagation with
+    # pointer jumping, all in numpy)
+    import numpy as np
+
+    labels = np.arange(size)
+    while len(left):
+        updated = labels.copy()
+        low = np.minimum(labels[left], labels[right])
+        np.minimum.at(updated, left, low)
+        np.minimum.at(updated, right, low)
+        updated = updated[updated]
+        if np.array_equal(updated, labels):
+            break
+        labels = updated
+    return labels
+
+
+def _bucket_keys(rows):
+    # One uint64 key per row of signature values (a band, or whole signatures)
+    import numpy as np
+
+    key = np.zeros(len(rows), dtype=np.uint64)
+    for column in range(rows.shape[1]):
+        key = (key ^ rows[:, column]) * np.uint64(0x9E3779B97F4A7C15)
+        key ^= key >> np.uint64(29)
+    return key
+
+
+def _similar_pairs(rows, threshold):
+    # Edges (left, right index arrays into rows) between signatures that
+    # share a bucket in some band and whose estimated Jaccard similarity is
+    # at least threshold. Each signature is only compared with the first one
+    # in its bucket and its sorted neighbour, so huge buckets (spam waves)
+    # stay linear; chains of similar members still end up in one cluster.
+    import numpy as np
+
+    lefts = []
+    rights = []
+    for band in range(BANDS):
+        keys = _bucket_keys(rows[:, band * ROWS:(band + 1) * ROWS])
+        order = np.argsort(keys, kind="stable")
+        sorted_keys = keys[order]
+        starts = np.concatenate(([True], sorted_keys[1:] != sorted_keys[:-1]))
+        leaders = np.maximum.accumulate(np.where(starts, np.arange(len(order)), 0))
+        for neighbours in (leaders, np.arange(len(order)) - 1):
+            positions = np.nonzero(~starts)[0]
+            left, right = order[neighbours[positions]], order[positions]
+            close = (rows[left] == rows[right]).mean(axis=1) >= threshold
+            lefts.append(left[close])
+            rights.append(right[close])
+    if not lefts:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    return np.concatenate(lefts), np.concatenate(rights)
+
+
+def cluster(tweets, threshold=THRESHOLD):
+    # Index arrays into tweets, one per cluster, in input order
+    import numpy as np
+
+    lefts = []
+    rights = []
+
+    # Retweets join the original (or, if it isn't in the set, each other)
+    by_id = {tweet.get("id"): index for index, tweet in enumerate(tweets)}
+    first_retweet = {}
+    for index, tweet in enumerate(tweets):
+        target = tweet.get("retweetedId")
+        if target:
+            lefts.append(index)
+            rights.append(by_id[target] if target in by_id else first_retweet.setdefault(target, index))
+    edges = [(np.array(lefts, dtype=np.int64), np.array(rights, dtype=np.int64))]
+
+    rows, usable = signatures([tweet.get("text") or "" for tweet in tweets])
+    indices = np.nonzero(usable)[0]
+    if len(indices):
+        # Identical signatures first, then similar ones between distinct rows
+        _, first, inverse = np.unique(_bucket_keys(rows[indices]), return_index=True, return_inverse=True)
+        distinct = rows[indices[first]]
+        representatives = indices[first]
+        edges.append((indices, representatives[inverse.ravel()]))
+        if threshold < 1:
+            left, right = _similar_pairs(distinct, threshold)
+            edges.append((representatives[left], representatives[right]))
+
+    labels = _components(len(tweets), np.concatenate([left for left, _ in edges]),
+                         np.concatenate([right for _, right in edges]))
+    order = np.argsort(labels, kind="stable")
+    boundaries = np.nonzero(np.diff(labels[order]))[0] + 1
+    return np.split(order, boundaries) if len(tweets) else []
+
+
+def _engagement(tweet):
+    return sum(tweet.get(field) or 0 for field in ("likeCount", "retweetCount", "replyCount", "quoteCount"))
+
+
+def collapse(batch, threshold=THRESHOLD):
+    # Returns a batch with one representative per cluster: the original tweet
+    # when a retweet's source is present, otherwise the most engaging copy.
+    # Its counts are summed over the cluster and duplicateCount says how
+    # many tweets were folded into it.
+    tweets = batch["tweets"]
+    with tracing.span("dedup.collapse", tweets=len(tweets)) as span:
+        collapsed = []
+        for members in cluster(tweets, threshold):
+            if len(members) == 1:
+                collapsed.append(tweets[members[0]])
+                continue
+            group = [tweets[index] for index in members.tolist()]
+            representative = max(group, key=lambda tweet: (not tweet.get("retweetedId"), _engagement(tweet)))
+            record = dict(representative)
+            for field in COUNT_FIELDS:
+                record[field] = sum(tweet.get(field) or 0 for tweet in group)
+            record["duplicateCount"] = len(group) - 1
+            collapsed.append(record)
+        span.set(clusters=len(collapsed))
+    return {"tweets": collapsed, "authors": batch["authors"]}
+
+
+def collapse_if_enabled(batch):
+    return collapse(batch) if ENABLED else batch
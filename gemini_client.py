@@ -1,21 +1,23 @@
+import hashlib
 import os
-from dotenv import load_dotenv
-from google import genai
-import streamlit as st
-
-load_dotenv()
-def summarize_with_gemini(tweets_data):
-    api_key = st.secrets["GEMINI_API_KEY"]
-    if not api_key:
-        return {"error": "API key not found. Please set GEMINI_API_KEY in your .env file."}
-
-    client = genai.Client(api_key=api_key)
-
-    tweets = tweets_data.get("tweets", [])
-    if not tweets:
-        return {"error": "No tweets to summarize."}
-
-    contents = """You are MarketIntel-Synth.
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import tracing
+from resources import get_gemini_client
+from ttl_cache import TTLCache, CACHE_DIR
+
+MODEL = "gemini-2.0-flash"
+# Input tokens per request; large fetches are split into chunks under this
+# budget, summarized in parallel and then merged.
+CHUNK_TOKEN_BUDGET = int(os.getenv("GEMINI_CHUNK_TOKENS", "30000"))
+MAX_PARALLEL_REQUESTS = int(os.getenv("GEMINI_MAX_PARALLEL", "4"))
+# Process-wide cap on in-flight model calls, shared by every concurrent
+# summary (each of which fans out to MAX_PARALLEL_REQUESTS chunks)
+MAX_CONCURRENT_CALLS = int(os.getenv("GEMINI_MAX_CONCURRENT", "4"))
+# Rough chars-per-token ratio for Gemini; avoids a count_tokens round trip
+CHARS_PER_TOKEN = 4
+
+SUMMARY_PROMPT = """You are MarketIntel-Synth.
 
 INPUT:
 A JSON array called **tweets**, each element containing the full text of a tweet and any embedded URLs.
@@ -60,22 +62,243 @@ STRICT RULES:
 - No apologies, disclaimers, or references to being an AI.
 - If a heading has no content, write “*None detected*” under it.
 """
-    for tweet in tweets:
-        text = tweet.get("text", "")
-        url = tweet.get("url", "")
-        contents += f"{text} ({url})\n"
 
-    try:
-        response = client.models.generate_content(
-            model="gemini-2.0-flash",
-            contents=contents,
-        )
+CHUNK_PROMPT = SUMMARY_PROMPT + """
+NOTE: The tweets below are one part of a larger set. Summarize this part only,
+using the same headings; the parts will be merged afterwards.
+"""
+
+REDUCE_PROMPT = """You are MarketIntel-Synth.
+
+INPUT:
+Several partial market summaries, each written in the Markdown format below,
+produced from different parts of the same tweet set.
+
+TASK:
+Merge them into one summary. Combine duplicate points, keep the most relevant
+and specific ones, and drop anything that only appears as filler.
+
+OUTPUT (Markdown only — no extra text):
+
+Summary
+
+
+## Key Insights 
+- …
+
+## Product Highlights and their prices
+- …
+
+## Content Recommendations
+- …
+
+## Current Market Trends
+- …
+
+## Marketing Tactics
+- …
+
+## Predicted Next Big Trends and Trend Analysis
+- …
+
+## Target Audience 
+- …
+
+STRICT RULES:
+- Use exactly the seven H2 headings above in that order.
+- Under each heading provide **bullet points only** (• or -), max 8 bullets per section, each ≤ 140 characters.
+- Do **not** mention the partial summaries, tweets, URLs, authors, or the analysis process.
+- No apologies, disclaimers, or references to being an AI.
+- If a heading has no content in any part, write “*None detected*” under it.
+
+PARTIAL SUMMARIES:
+"""
+
+# Put ahead of the summary (or final merge) prompt when trends.py measured
+# bursts, so predicted trends rest on counts rather than on the model's reading
+TRENDS_PROMPT = """MEASURED TREND SIGNALS:
+Hashtags and terms whose tweet volume jumped in the most recent period, highest burst score first.
+Base "Predicted Next Big Trends and Trend Analysis" on these signals first.
+
+{signals}
+"""
+
+
+# Bumps automatically whenever any of the prompts above change
+PROMPT_VERSION = hashlib.sha256(
+    (SUMMARY_PROMPT + CHUNK_PROMPT + REDUCE_PROMPT + TRENDS_PROMPT).encode("utf-8")).hexdigest()[:12]
+
+# Summaries are content-addressed: whole tweet sets by a hash of their
+# canonical lines, and individual model calls (chunk partials, merges) by a
+# hash of the exact request, so overlapping tweet sets reuse partials.
+# Entries are texts of very different lengths, so the memory tier is also
+# capped by their total size (counted in characters).
+_summary_cache = TTLCache(
+    ttl=int(os.getenv("SUMMARY_CACHE_TTL", str(7 * 24 * 3600))),
+    max_entries=int(os.getenv("SUMMARY_CACHE_MAX_ENTRIES", "256")),
+    weigh=len,
+    max_weight=int(float(os.getenv("SUMMARY_CACHE_MAX_MB", "16")) * 1024 * 1024),
+    disk_path=os.path.join(CACHE_DIR, "summaries.db"),
+    max_disk_entries=int(os.getenv("SUMMARY_CACHE_MAX_DISK_ENTRIES", "4096")),
+)
+
+
+def _digest(*parts):
+    sha = hashlib.sha256()
+    for part in parts:
+        sha.update(part.encode("utf-8"))
+        sha.update(b"\0")
+    return sha.hexdigest()
+
+
+def summary_cache_stats():
+    return _summary_cache.stats()
+
+
+def estimate_tokens(text):
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def tweet_line(tweet):
+    text = tweet.get("text", "")
+    url = tweet.get("url", "")
+    return f"{text} ({url})\n"
+
+
+def pack_chunks(lines, prompt, token_budget):
+    # Greedily pack lines into chunks whose prompt + lines fit the budget.
+    # A single line larger than the budget still gets a chunk of its own.
+    available = max(1, token_budget - estimate_tokens(prompt))
+    chunks = []
+    current = []
+    used = 0
+    for line in lines:
+        tokens = estimate_tokens(line)
+        if current and used + tokens > available:
+            chunks.append(current)
+            current = []
+            used = 0
+        current.append(line)
+        used += tokens
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def canonical_lines(tweets):
+    # Order-independent, duplicate-free view of the tweet set
+    return sorted(set(tweet_line(tweet) for tweet in tweets))
+
+
+def pack_stable_chunks(lines, prompt, token_budget):
+    # Content-defined chunking: lines are ordered by their hash and a chunk
+    # also ends after any line whose hash hits the boundary modulus. Adding or
+    # removing a few tweets then only changes the chunks they fall into, so
+    # the other chunk partials are reused from the cache.
+    available = max(1, token_budget - estimate_tokens(prompt))
+    # Aim for content boundaries at about half the budget (~100 tokens/line)
+    modulus = max(2, available // 200)
+    keyed = sorted((hashlib.sha256(line.encode("utf-8")).hexdigest(), line) for line in lines)
+    chunks = []
+    current = []
+    used = 0
+    for digest, line in keyed:
+        tokens = estimate_tokens(line)
+        if current and used + tokens > available:
+            chunks.append(current)
+            current = []
+            used = 0
+        current.append(line)
+        used += tokens
+        if int(digest[:8], 16) % modulus == 0:
+            chunks.append(current)
+            current = []
+            used = 0
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+_call_slots = threading.BoundedSemaphore(max(1, MAX_CONCURRENT_CALLS))
+
+
+def _generate(client, contents):
+    key = "call:" + _digest(MODEL, contents)
+    with tracing.span("llm.call", prompt_chars=len(contents), prompt_tokens=estimate_tokens(contents)) as span:
+        cached = _summary_cache.get(key)
+        if cached is not None:
+            span.set(cached=True)
+            return cached
+
+        tracing.count("llm.prompt_tokens", estimate_tokens(contents))
+        with _call_slots:
+            response = client.models.generate_content(
+                model=MODEL,
+                contents=contents,
+            )
 
         # Debugging: Check if we received the response correctly
-        if not response or not hasattr(response, 'text'):
-            return {"error": "Failed to receive a valid response from Gemini."}
+        if not response or not getattr(response, "text", None):
+            raise ValueError("Failed to receive a valid response from Gemini.")
+        span.set(cached=False, response_chars=len(response.text))
+        _summary_cache.set(key, response.text)
+        return response.text
+
+
+def _map_reduce(client, lines, token_budget, max_parallel, preamble=""):
+    # preamble goes ahead of the single-request or final merge prompt only,
+    # so chunk partials stay reusable across different preambles
+    if len(pack_chunks(lines, preamble + SUMMARY_PROMPT, token_budget)) == 1:
+        return _generate(client, preamble + SUMMARY_PROMPT + "".join(lines))
+
+    chunks = pack_stable_chunks(lines, SUMMARY_PROMPT, token_budget)
+
+    with ThreadPoolExecutor(max_workers=max(1, min(max_parallel, len(chunks)))) as pool:
+        partials = list(pool.map(lambda chunk: _generate(client, CHUNK_PROMPT + "".join(chunk)), chunks))
+
+        # Merge partial summaries, in several rounds if they don't fit one request
+        while True:
+            parts = [f"\n--- PART {number} ---\n{partial}\n" for number, partial in enumerate(partials, start=1)]
+            groups = pack_chunks(parts, preamble + REDUCE_PROMPT, token_budget)
+            if len(groups) == 1:
+                return _generate(client, preamble + REDUCE_PROMPT + "".join(groups[0]))
+            if len(groups) == len(parts):
+                # Each partial fills a request on its own; merge pairwise to make progress
+                groups = [parts[start:start + 2] for start in range(0, len(parts), 2)]
+            partials = list(pool.map(lambda group: _generate(client, REDUCE_PROMPT + "".join(group)), groups))
+
+
+def summarize_with_gemini(tweets_data, token_budget=None, max_parallel=None, trends=None):
+    # Long-lived client shared across calls and reruns
+    client = get_gemini_client()
+    if client is None:
+        return {"error": "API key not found. Please set GEMINI_API_KEY in your .env file."}
 
-        return {"summary": response.text}
+    tweets = tweets_data.get("tweets", [])
+    if not tweets:
+        return {"error": "No tweets to summarize."}
+
+    with tracing.span("llm.prompt", tweets=len(tweets)) as span:
+        lines = canonical_lines(tweets)
+        # trends: measured bursts as trends.prompt_lines, if any
+        preamble = TRENDS_PROMPT.format(signals="".join(trends)) if trends else ""
+        set_key = "set:" + _digest(MODEL, PROMPT_VERSION, *([preamble] if preamble else []), *lines)
+        span.set(lines=len(lines), prompt_tokens=sum(estimate_tokens(line) for line in lines))
+    summary = _summary_cache.get(set_key)
+    if summary is not None:
+        return {"summary": summary, "cached": True}
+
+    try:
+        with tracing.span("llm.summarize", lines=len(lines)):
+            summary = _map_reduce(
+                client,
+                lines,
+                token_budget or CHUNK_TOKEN_BUDGET,
+                max_parallel or MAX_PARALLEL_REQUESTS,
+                preamble,
+            )
+        _summary_cache.set(set_key, summary)
+        return {"summary": summary, "cached": False}
 
     except Exception as e:
         return {"error": "Failed to summarize", "details": str(e)}
@@ -0,0 +1,179 @@
+import itertools
+import os
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import tracing
+
+# Analyses run on a shared worker pool instead of inside the Streamlit
+# script thread. The pool size caps how many fetch + summarize pipelines
+# (and so API and LLM calls) run at once across all sessions, and identical
+# in-flight requests are collapsed into one job that every session polls.
+MAX_WORKERS = int(os.getenv("ANALYSIS_WORKERS", "2"))
+JOB_RETENTION = int(os.getenv("JOB_RETENTION", "3600"))
+MAX_FINISHED_JOBS = int(os.getenv("MAX_FINISHED_JOBS", "64"))
+
+QUEUED = "queued"
+FETCHING = "fetching"
+SUMMARIZING = "summarizing"
+DONE = "done"
+FAILED = "failed"
+FINISHED_STAGES = {DONE, FAILED}
+
+_lock = threading.Lock()
+_jobs = {}
+_inflight = {}
+_ids = itertools.count(1)
+_executor = None
+
+
+def _get_executor():
+    # Created under the lock, so concurrent first submits share one pool
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix="analysis-job")
+        return _executor
+
+
+def _prune(now):
+    finished = sorted(
+        (job for job in _jobs.values() if job["stage"] in FINISHED_STAGES),
+        key=lambda job: job["finished_at"],
+    )
+    excess = len(finished) - MAX_FINISHED_JOBS
+    for index, job in enumerate(finished):
+        if index < excess or now - job["finished_at"] > JOB_RETENTION:
+            del _jobs[job["id"]]
+
+
+def _run(job_id, func, args, kwargs):
+    started_at = time.time()
+    update(job_id, stage=FETCHING, started_at=started_at)
+    try:
+        with tracing.span("job.run", job=job_id) as span:
+            span.set(queued_ms=round((started_at - get(job_id)["submitted_at"]) * 1000, 1))
+            result = func(job_id, *args, **kwargs)
+    except Exception as e:
+        traceback.print_exc()
+        _finish(job_id, stage=FAILED, error=f"{type(e).__name__}: {e}")
+    else:
+        _finish(job_id, stage=DONE, result=result, progress=1.0)
+
+
+def _finish(job_id, **fields):
+    with _lock:
+        job = _jobs[job_id]
+        job.update(fields, finished_at=time.time(), partial=None)
+        if _inflight.get(job["key"]) == job_id:
+            del _inflight[job["key"]]
+
+
+def submit(key, func, *args, **kwargs):
+    # func(job_id, *args, **kwargs) runs on the pool; returns the id of the
+    # new job, or of the in-flight job already running for the same key
+    now = time.time()
+    with _lock:
+        if key in _inflight:
+            return _inflight[key]
+        _prune(now)
+        job_id = f"job-{next(_ids)}"
+        _jobs[job_id] = {
+            "id": job_id,
+            "key": key,
+            "stage": QUEUED,
+            "progress": 0.0,
+            "message": "Waiting for a free worker...",
+            "partial": None,
+            "result": None,
+            "error": None,
+            "submitted_at": now,
+            "started_at": None,
+            "finished_at": None,
+        }
+        _inflight[key] = job_id
+    _get_executor().submit(_run, job_id, func, args, kwargs)
+    return job_id
+
+
+def update(job_id, **fields):
+    with _lock:
+        job = _jobs.get(job_id)
+        if job is not None:
+            job.update(fields)
+
+
+def get(job_id):
+    # Snapshot, so callers never see a job half-way through an update
+    with _lock:
+        job = _jobs.get(job_id)
+        return dict(job) if job is not None else None
+
+
+def find(key):
+    with _lock:
+        return _inflight.get(key)
+
+
+def list_jobs():
+    with _lock:
+        return [dict(job) for job in _jobs.values()]
+
+
+def _analysis_job(job_id, keyword, pages, weeks, region, full_refresh, key):
+    import analysis_cache
+    import analytics
+    import trends
+    from dedup import collapse_if_enabled
+    from gemini_client import summarize_with_gemini
+    from refresh import refresh_query
+    from tweet_dump import DumpWriter, export_path, prune_exports
+    from tweet_schema import project_tweets
+
+    live_batch = {"tweets": [], "authors": {}}
+    fetched_at = datetime.now()
+    # The download artifact is written as pages arrive, then completed with
+    # the stored history for the window
+    writer = DumpWriter(export_path(keyword, fetched_at, region=region, weeks=weeks, pages=pages))
+
+    def on_page(page, result):
+        if "error" in page or not page["tweets"]:
+            return
+        page_batch = project_tweets(page["tweets"])
+        writer.write(page_batch)
+        live_batch["tweets"].extend(page_batch["tweets"])
+        live_batch["authors"].update(page_batch["authors"])
+        # Readers get a copy, the worker keeps appending to live_batch
+        update(job_id, progress=page["page"] / pages * 0.8,
+               message=f"Fetched page {page['page']} of {pages}: {len(live_batch['tweets'])} tweets so far...",
+               partial={"tweets": list(live_batch["tweets"]), "authors": dict(live_batch["authors"])},
+               keyword=keyword)
+
+    with writer:
+        fetch_result = refresh_query(keyword, pages=pages, weeks=weeks, region=region,
+                                     full_refresh=full_refresh, on_page=on_page, fetched_at=fetched_at)
+        writer.write(fetch_result)
+    prune_exports()
+
+    update(job_id, stage=SUMMARIZING, progress=0.8, message="Analyzing tweets with Synapt AI...")
+    collapsed = collapse_if_enabled({"tweets": fetch_result["tweets"], "authors": fetch_result["authors"]})
+    # Measured bursts go to the summarizer as trend candidates
+    df = analytics.build_frame(collapsed)
+    candidates = trends.detect(df, keyword)
+    summary_response = summarize_with_gemini(collapsed, trends=trends.prompt_lines(candidates))
+
+    params = {"keyword": keyword, "pages": pages, "weeks": weeks, "region": region,
+              "fetched_at": fetched_at.strftime("%Y%m%d_%H%M%S")}
+    return analysis_cache.store_result(key, params, fetch_result, summary_response, collapsed,
+                                       artifact=writer.path, trends=candidates, frame=df)
+
+
+def submit_analysis(keyword, pages, weeks, region, full_refresh=False):
+    import analysis_cache
+
+    key = analysis_cache.result_key(keyword, pages, weeks, region)
+    job_key = f"{key}|full" if full_refresh else key
+    return submit(job_key, _analysis_job, keyword, pages, weeks, region, full_refresh, key)
@@ -0,0 +1,210 @@
+import csv
+import hashlib
+import os
+import re
+import sys
+import threading
+import unicodedata
+from functools import lru_cache
+
+import tracing
+from ttl_cache import TTLCache
+from tweet_store import DB_PATH, connect
+
+# Maps free-text author locations ("Mumbai, India", "mumbai 🇮🇳", "Bombay")
+# to a canonical city, region and country using the offline gazetteer in
+# data/gazetteer.csv. Tweets vastly outnumber distinct location strings, so
+# strings are resolved once: an in-process LRU sits in front of the
+# location_memo table in the store, and lookups are done in batches.
+#
+# Gazetteer aliases are matched as whole words anywhere in the text, except
+# "="-prefixed ones (abbreviations like TX or UK), which must be a whole
+# comma/slash separated part of it, as in "Austin, TX".
+GAZETTEER_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "gazetteer.csv")
+MAX_CACHED_LOCATIONS = int(os.getenv("LOCATION_CACHE_MAX_ENTRIES", "50000"))
+# Bump when resolution rules change, so memoized results are recomputed
+RESOLVER_VERSION = 1
+LEVELS = ("city", "region", "country")
+UNRESOLVED = {"city": None, "region": None, "country": None}
+
+_SEGMENT_SPLIT = re.compile(r"[,|/\\;:()\[\]&·•+]+|\.\s|\s+and\s+")
+_WORD = re.compile(r"\w+")
+_FLAG = re.compile("[\U0001F1E6-\U0001F1FF]{2}")
+
+_memo = TTLCache(ttl=float("inf"), max_entries=MAX_CACHED_LOCATIONS)
+_lock = threading.Lock()
+
+
+def normalize(text):
+    # Case-, accent- and width-insensitive form used for aliases and input
+    text = unicodedata.normalize("NFKD", text or "")
+    return "".join(char for char in text if not unicodedata.combining(char)).casefold()
+
+
+def _words(text):
+    return tuple(word for word in _WORD.findall(text) if not word.isdigit())
+
+
+@lru_cache(maxsize=1)
+def gazetteer():
+    # {"words": {alias words: [entries]}, "segments": {...}, "codes": {ISO code: entry},
+    #  "max_words": n, "version": digest}
+    with open(GAZETTEER_PATH, "rb") as f:
+        content = f.read()
+    words = {}
+    segments = {}
+    codes = {}
+    for row in csv.DictReader(content.decode("utf-8").splitlines()):
+        entry = {"kind": row["kind"], "name": row["name"], "region": row["region"] or None,
+                 "country": row["country"]}
+        if row["code"]:
+            codes[row["code"]] = entry
+        for alias in [row["name"], *filter(None, row["aliases"].split("|"))]:
+            target = segments if alias.startswith("=") else words
+            key = _words(normalize(alias.lstrip("=")))
+            if key:
+                target.setdefault(key, []).append(entry)
+    digest = hashlib.sha256(content + str(RESOLVER_VERSION).encode()).hexdigest()[:16]
+    max_words = max(len(key) for key in words)
+    return {"words": words, "segments": segments, "codes": codes, "max_words": max_words, "version": digest}
+
+
+def _matches(text, table):
+    # Alias matches in reading order, each a list of candidate entries
+    found = [[table["codes"][code]] for code in (
+        "".join(chr(ord(char) - 0x1F1E6 + ord("A")) for char in flag) for flag in _FLAG.findall(text)
+    ) if code in table["codes"]]
+    # Aliases may span separators ("Washington, DC"); abbreviations must
+    # fill a whole segment
+    words = []
+    matches = []
+    for segment in _SEGMENT_SPLIT.split(normalize(text)):
+        segment_words = _words(segment)
+        if segment_words in table["segments"]:
+            matches.append((len(words), table["segments"][segment_words]))
+        words.extend(segment_words)
+    start = 0
+    while start < len(words):
+        for size in range(min(table["max_words"], len(words) - start), 0, -1):
+            candidates = table["words"].get(tuple(words[start:start + size]))
+            if candidates:
+                matches.append((start, candidates))
+                start += size
+                break
+        else:
+            start += 1
+    matches = [candidates for _, candidates in sorted(matches, key=lambda match: match[0])]
+    # Flags only count when the text names no country itself
+    return matches + found
+
+
+def _first(matches, kind, country=None):
+    for candidates in matches:
+        for entry in candidates:
+            if entry["kind"] == kind and (country is None or entry["country"] == country):
+                return entry
+    return None
+
+
+def _resolve(text):
+    table = gazetteer()
+    matches = _matches(text, table)
+    named = _first(matches, "country")
+    if named is not None:
+        # An explicit country wins; a city or region only counts if it is in it
+        country = named["country"]
+        city = _first(matches, "city", country)
+        region = city["region"] if city else (_first(matches, "region", country) or {}).get("name")
+        return {"city": city and city["name"], "region": region, "country": country}
+
+    # Otherwise a region mentioned alongside picks between same-named cities
+    # ("Hyderabad, Sindh"), then the city decides region and country
+    mentioned = _first(matches, "region")
+    city = _first(matches, "city", mentioned and mentioned["country"]) or _first(matches, "city")
+    if city is not None:
+        return {"city": city["name"], "region": city["region"], "country": city["country"]}
+    if mentioned is not None:
+        return {"city": None, "region": mentioned["name"], "country": mentioned["country"]}
+    return dict(UNRESOLVED)
+
+
+def resolve_many(raw_locations, db_path=DB_PATH):
+    # {raw string: {"city", "region", "country"}} for the distinct strings given;
+    # unknown places map to all-None
+    raws = list(dict.fromkeys(raw for raw in raw_locations if raw))
+    results = {}
+    missing = []
+    for raw in raws:
+        cached = _memo.get(raw)
+        if cached is None:
+            missing.append(raw)
+        else:
+            results[raw] = cached
+    if not missing:
+        return results
+
+    version = gazetteer()["version"]
+    with _lock, tracing.span("locations.resolve", strings=len(missing)) as span:
+        conn = connect(db_path)
+        try:
+            stored = {}
+            # Stay well under SQLite's bound-parameter limit
+            for start in range(0, len(missing), 500):
+                chunk = missing[start:start + 500]
+                for raw, city, region, country in conn.execute(
+                    f"SELECT raw, city, region, country FROM location_memo "
+                    f"WHERE version = ? AND raw IN ({', '.join('?' * len(chunk))})", [version, *chunk],
+                ):
+                    stored[raw] = {"city": city, "region": region, "country": country}
+
+            computed = {raw: _resolve(raw) for raw in missing if raw not in stored}
+            if computed:
+                with conn:
+                    conn.executemany(
+                        "INSERT OR REPLACE INTO location_memo (raw, version, city, region, country) "
+                        "VALUES (?, ?, ?, ?, ?)",
+                        [(raw, version, place["city"], place["region"], place["country"])
+                         for raw, place in computed.items()],
+                    )
+        finally:
+            conn.close()
+        span.set(from_store=len(stored), resolved=len(computed))
+
+    for raw, place in {**stored, **computed}.items():
+        _memo.set(raw, place)
+        results[raw] = place
+    return results
+
+
+def resolve(raw, db_path=DB_PATH):
+    return resolve_many([raw], db_path=db_path).get(raw, dict(UNRESOLVED))
+
+
+def level_counts(locations, level="country", db_path=DB_PATH):
+    # Tweets per canonical place at level ("city", "region" or "country"),
+    # most first, for a per-tweet sequence of raw location strings. Each
+    # distinct string is resolved once; counting is vectorized over codes.
+    import numpy as np
+    import pandas as pd
+
+    codes, uniques = pd.factorize(pd.Series(locations, dtype=object))
+    resolved = resolve_many(uniques, db_path=db_path)
+    names = [resolved.get(raw, UNRESOLVED)[level] for raw in uniques]
+    place_codes, places = pd.factorize(pd.Series(names, dtype=object))
+    tweet_places = place_codes[codes[codes >= 0]] if len(place_codes) else np.array([], dtype=np.int64)
+    counts = np.bincount(tweet_places[tweet_places >= 0], minlength=len(places))
+    return pd.Series(counts, index=pd.Index(places, dtype=object), name="count").sort_values(
+        ascending=False, kind="stable")
+
+
+def stats():
+    return _memo.stats()
+
+
+if __name__ == "__main__":
+    # Usage: python locations.py "Mumbai, India" ["Austin, TX" ...]
+    if len(sys.argv) < 2:
+        print('Usage: python locations.py "location" ["location" ...]')
+        sys.exit(1)
+    for raw, place in resolve_many(sys.argv[1:]).items():
+        print(f"{raw!r}: {place['city'] or '-'} / {place['region'] or '-'} / {place['country'] or '-'}")
@@ -0,0 +1,67 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from twitter_client import fetch_tweets_result
+
+# Each query's cursor chain is sequential, so concurrency comes from running
+# different queries side by side. The request rate across all of them is
+# capped by the shared token bucket in twitter_client (TWITTER_MAX_RPS).
+MAX_CONCURRENT_QUERIES = int(os.getenv("TWITTER_MAX_CONCURRENT_QUERIES", "8"))
+
+
+def query_label(keyword, region):
+    return f"{keyword} ({region})" if region else keyword
+
+
+def merge_results(queries, results):
+    # Merge per-query results in query order, keeping one copy of each tweet
+    # and tagging it with every query that returned it.
+    merged = {}
+    for (keyword, region), result in zip(queries, results):
+        match = {"keyword": keyword, "region": region}
+        for tweet in result["tweets"]:
+            tweet_id = tweet.get("id")
+            if tweet_id in merged:
+                if match not in merged[tweet_id]["matchedQueries"]:
+                    merged[tweet_id]["matchedQueries"].append(match)
+                continue
+            # Copy so cached page objects are never mutated
+            tagged = dict(tweet)
+            tagged["matchedQueries"] = [match]
+            merged[tweet_id] = tagged
+    return list(merged.values())
+
+
+def fetch_many(queries, pages, weeks, use_cache=True, max_workers=MAX_CONCURRENT_QUERIES):
+    # queries: iterable of (keyword, region) pairs
+    queries = [(keyword, region or "") for keyword, region in queries]
+    if not queries:
+        return {"tweets": [], "results": {}, "complete": True}
+
+    workers = max(1, min(max_workers, len(queries)))
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="fetch") as pool:
+        futures = [
+            pool.submit(fetch_tweets_result, keyword, pages, weeks, region, use_cache)
+            for keyword, region in queries
+        ]
+        results = []
+        for (keyword, region), future in zip(queries, futures):
+            try:
+                results.append(future.result())
+            except Exception as e:
+                results.append({
+                    "tweets": [],
+                    "pages_requested": pages,
+                    "pages_from_cache": 0,
+                    "pages_fetched": 0,
+                    "requests": 0,
+                    "failed_pages": [{"page": 1, "error": str(e), "status": None}],
+                    "exhausted": False,
+                    "complete": False,
+                })
+
+    return {
+        "tweets": merge_results(queries, results),
+        "results": {query_label(keyword, region): result for (keyword, region), result in zip(queries, results)},
+        "complete": all(result["complete"] for result in results),
+    }
@@ -0,0 +1,61 @@
+import time
+
+import tracing
+from tweet_store import (
+    clear_high_water_mark,
+    get_high_water_mark,
+    load_tweets,
+    save_run,
+    stored_ids,
+    update_high_water_mark,
+)
+from twitter_client import fetch_tweets_result, query_key
+
+
+def refresh_query(keyword, pages, weeks, region, full_refresh=False, on_page=None, fetched_at=None,
+                  use_cache=True):
+    # Incremental fetch: only ask the API for tweets newer than the newest one
+    # already stored for this normalized query, then merge them into the store.
+    # The returned result's "tweets" and "authors" hold the stored history
+    # (compact records) for the whole window.
+    #
+    # The first fetch of a query is a "Top" sample of the window; later ones
+    # ask for tweets after the mark newest first ("Latest"), so their cost
+    # follows new volume, not window size. The trade-off: when more new
+    # tweets arrived than `pages` pages hold, the oldest of them are skipped
+    # (the mark moves past them); a full refresh re-fetches the window.
+    with tracing.span("pipeline.refresh", keyword=keyword, pages=pages, weeks=weeks) as span:
+        result = _refresh(keyword, pages, weeks, region, full_refresh, on_page, fetched_at, use_cache)
+        span.set(incremental=result["incremental"], new_tweets=result["new_tweets"], tweets=len(result["tweets"]))
+    return result
+
+
+def _refresh(keyword, pages, weeks, region, full_refresh, on_page, fetched_at, use_cache):
+    key = query_key(keyword, region, weeks)
+    if full_refresh:
+        clear_high_water_mark(key)
+    mark = get_high_water_mark(key)
+    since = mark["created_at"] + 1 if mark else None
+
+    # A full refresh must really re-fetch, not replay the page cache
+    result = fetch_tweets_result(keyword, pages, weeks, region, use_cache=use_cache and not full_refresh,
+                                 on_page=on_page, since=since)
+    new_tweets = result["tweets"]
+    # Full refreshes and page-cache hits can return tweets already stored
+    known = stored_ids(tweet.get("id") for tweet in new_tweets)
+    run_id = save_run(new_tweets, keyword, region=region, weeks=weeks, pages=pages, fetched_at=fetched_at)
+
+    # A failed page may have held newer tweets, so the mark only moves
+    # forward after a complete fetch
+    if result["complete"]:
+        mark = update_high_water_mark(key, new_tweets)
+
+    window_start = time.time() - weeks * 7 * 24 * 3600
+    result["run_id"] = run_id
+    result["incremental"] = since is not None
+    result["new_tweets"] = sum(str(tweet.get("id")) not in known for tweet in new_tweets)
+    result["high_water_mark"] = mark
+    history = load_tweets(keyword, since=window_start, region=region)
+    result["tweets"] = history["tweets"]
+    result["authors"] = history["authors"]
+    return result
@@ -0,0 +1,89 @@
+import os
+import threading
+
+# Process-wide clients, created on first use and shared by every Streamlit
+# rerun and session (and by the CLI tools). Heavy SDKs are imported here
+# lazily so that code paths which never call the APIs don't pay for them.
+
+# Offline backends (see backends.py) for load testing and profiling
+TWITTER_BACKEND = os.getenv("TWITTER_BACKEND", "api")
+GEMINI_BACKEND = os.getenv("GEMINI_BACKEND", "api")
+
+_lock = threading.Lock()
+_resources = {}
+_dotenv_loaded = False
+
+
+def get_secret(name):
+    # Environment (including .env) first, then Streamlit secrets
+    global _dotenv_loaded
+    if not _dotenv_loaded:
+        from dotenv import load_dotenv
+        load_dotenv()
+        _dotenv_loaded = True
+
+    value = os.getenv(name)
+    if value:
+        return value
+    import streamlit as st
+    try:
+        return st.secrets[name]
+    except (KeyError, FileNotFoundError):
+        return None
+
+
+def _get_or_create(name, factory):
+    with _lock:
+        if name not in _resources:
+            _resources[name] = factory()
+        return _resources[name]
+
+
+def get_http_session():
+    def create():
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        # Pooled keep-alive connections; retries are handled by the callers
+        # so backoff can honor rate-limit headers
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=16, max_retries=0)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        return session
+
+    return _get_or_create("http_session", create)
+
+
+def get_twitter_session():
+    if TWITTER_BACKEND == "replay":
+        def create():
+            from backends import ReplayBackend, ReplaySession
+            return ReplaySession(ReplayBackend.from_env())
+
+        return _get_or_create("replay_session", create)
+    return get_http_session()
+
+
+def get_gemini_client():
+    if GEMINI_BACKEND == "fake":
+        def create_fake():
+            from backends import FakeGeminiClient
+            return FakeGeminiClient()
+
+        return _get_or_create("fake_gemini_client", create_fake)
+
+    api_key = get_secret("GEMINI_API_KEY")
+    if not api_key:
+        return None
+
+    def create():
+        from google import genai
+        return genai.Client(api_key=api_key)
+
+    return _get_or_create("gemini_client", create)
+
+
+def reset():
+    with _lock:
+        _resources.clear()
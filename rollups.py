@@ -0,0 +1,315 @@
+import json
+import sys
+import time
+from collections import defaultdict
+
+import tracing
+from tweet_store import DB_PATH, connect, load_tweets, normalize_keyword
+
+# Per-keyword, per-day aggregates kept next to the tweets. Every stored run
+# adds its tweets incrementally: new tweets add to their day's counts and
+# terms, and tweets seen again only apply the change in their engagement.
+# The "over time" views read only these tables, never the raw tweets.
+BUCKET_SECONDS = 24 * 3600
+WEEK_SECONDS = 7 * BUCKET_SECONDS
+# Epoch day 4 (1970-01-05) is a Monday, so weeks start on Mondays (UTC)
+WEEK_ANCHOR = 4 * BUCKET_SECONDS
+COUNT_FIELDS = ["likeCount", "retweetCount", "replyCount", "quoteCount", "viewCount"]
+COUNT_COLUMNS = ["like_count", "retweet_count", "reply_count", "quote_count", "view_count"]
+# Same definition as analytics.ENGAGEMENT_FIELDS (views are not engagement)
+ENGAGEMENT_FIELDS = ["likeCount", "retweetCount", "replyCount", "quoteCount"]
+
+
+def bucket_start(created_at):
+    return created_at - created_at % BUCKET_SECONDS
+
+
+def week_start(timestamp):
+    return timestamp - (timestamp - WEEK_ANCHOR) % WEEK_SECONDS
+
+
+def _engagement(counts):
+    return sum(counts[COUNT_FIELDS.index(field)] for field in ENGAGEMENT_FIELDS)
+
+
+def _tweet_terms(tweet, authors):
+    terms = [["hashtag", tag.lower()] for tag in dict.fromkeys(tweet.get("hashtags") or [])]
+    author = authors.get(tweet.get("authorId"))
+    if author is not None:
+        terms.append(["author", author["userName"]])
+        if author.get("location"):
+            terms.append(["location", author["location"]])
+    return terms
+
+
+def _select_in(conn, sql, values, params=()):
+    # Stay well under SQLite's bound-parameter limit
+    rows = []
+    for start in range(0, len(values), 500):
+        chunk = values[start:start + 500]
+        rows.extend(conn.execute(sql.format(placeholders=", ".join("?" * len(chunk))), [*params, *chunk]))
+    return rows
+
+
+def apply_batch(conn, keyword, batch):
+    # batch: {"tweets": [compact records], "authors": {id: author}}; runs
+    # inside the caller's transaction. New tweets join `keyword`'s rollups;
+    # changed counts are applied to every keyword that already holds the
+    # tweet, so rollups always reflect the latest stored counts.
+    keyword = normalize_keyword(keyword)
+    tweets = [tweet for tweet in batch["tweets"] if tweet.get("id") and tweet.get("createdAt") is not None]
+    if not tweets:
+        return 0
+
+    with tracing.span("rollups.apply", keyword=keyword, tweets=len(tweets)) as span:
+        ids = list(dict.fromkeys(tweet["id"] for tweet in tweets))
+        existing = {}
+        holders = defaultdict(list)
+        for row in _select_in(
+            conn,
+            f"SELECT keyword, tweet_id, bucket_start, {', '.join(COUNT_COLUMNS)}, terms FROM rollup_members "
+            "WHERE tweet_id IN ({placeholders})",
+            ids,
+        ):
+            existing[(row[0], row[1])] = (row[2], list(row[3:8]), json.loads(row[8]))
+            holders[row[1]].append(row[0])
+
+        authors = dict(batch["authors"])
+        missing = sorted({tweet.get("authorId") for tweet in tweets if tweet.get("authorId")} - set(authors))
+        for author_id, user_name, location in _select_in(
+            conn, "SELECT id, user_name, location FROM authors WHERE id IN ({placeholders})", missing,
+        ):
+            authors[author_id] = {"userName": user_name, "location": location}
+
+        buckets = defaultdict(lambda: [0] * (1 + len(COUNT_FIELDS)))
+        terms_delta = defaultdict(lambda: [0, 0])
+        members = {}
+        for tweet in tweets:
+            counts = [tweet.get(field) or 0 for field in COUNT_FIELDS]
+            for name in dict.fromkeys([keyword, *holders[tweet["id"]]]):
+                previous = existing.get((name, tweet["id"]))
+                if previous is None:
+                    bucket = bucket_start(tweet["createdAt"])
+                    terms = _tweet_terms(tweet, authors)
+                    delta = [1] + counts
+                    new_tweets = 1
+                else:
+                    bucket, old_counts, terms = previous
+                    if counts == old_counts:
+                        continue
+                    delta = [0] + [new - old for new, old in zip(counts, old_counts)]
+                    new_tweets = 0
+                existing[(name, tweet["id"])] = (bucket, counts, terms)
+                members[(name, tweet["id"])] = (name, tweet["id"], bucket, *counts,
+                                                json.dumps(terms, ensure_ascii=False))
+
+                totals = buckets[(name, bucket)]
+                for index, value in enumerate(delta):
+                    totals[index] += value
+                engagement = _engagement(delta[1:])
+                for kind, term in terms:
+                    entry = terms_delta[(name, bucket, kind, term)]
+                    entry[0] += new_tweets
+                    entry[1] += engagement
+
+        conn.executemany(
+            f"""
+            INSERT INTO rollup_members (keyword, tweet_id, bucket_start, {', '.join(COUNT_COLUMNS)}, terms)
+            VALUES (?, ?, ?, {', '.join('?' * len(COUNT_COLUMNS))}, ?)
+            ON CONFLICT(keyword, tweet_id) DO UPDATE SET
+                {', '.join(f'{column} = excluded.{column}' for column in COUNT_COLUMNS)}
+            """,
+            list(members.values()),
+        )
+        conn.executemany(
+            f"""
+            INSERT INTO rollup_buckets (keyword, bucket_start, tweets, {', '.join(COUNT_COLUMNS)})
+            VALUES (?, ?, ?, {', '.join('?' * len(COUNT_COLUMNS))})
+            ON CONFLICT(keyword, bucket_start) DO UPDATE SET
+                tweets = tweets + excluded.tweets,
+                {', '.join(f'{column} = {column} + excluded.{column}' for column in COUNT_COLUMNS)}
+            """,
+            [(name, bucket, *totals) for (name, bucket), totals in buckets.items()],
+        )
+        conn.executemany(
+            """
+            INSERT INTO rollup_terms (keyword, kind, bucket_start, term, tweets, engagement)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT(keyword, kind, bucket_start, term) DO UPDATE SET
+                tweets = tweets + excluded.tweets,
+                engagement = engagement + excluded.engagement
+            """,
+            [(name, kind, bucket, term, *values) for (name, bucket, kind, term), values in terms_delta.items()],
+        )
+        span.set(changed=len(members))
+    return len(members)
+
+
+def rebuild(keyword=None, db_path=DB_PATH):
+    # Recompute rollups from the stored tweets. Returns {keyword: tweets
+    # rolled up}.
+    conn = connect(db_path)
+    try:
+        if keyword is None:
+            keywords = [row[0] for row in conn.execute("SELECT DISTINCT keyword FROM runs ORDER BY keyword")]
+        else:
+            keywords = [normalize_keyword(keyword)]
+        results = {}
+        for name in keywords:
+            batch = load_tweets(name, db_path=db_path)
+            with conn:
+                for table in ("rollup_members", "rollup_buckets", "rollup_terms"):
+                    conn.execute(f"DELETE FROM {table} WHERE keyword = ?", (name,))
+                results[name] = apply_batch(conn, name, batch)
+        return results
+    finally:
+        conn.close()
+
+
+def keywords(db_path=DB_PATH):
+    conn = connect(db_path)
+    try:
+        return [row[0] for row in conn.execute("SELECT DISTINCT keyword FROM rollup_buckets ORDER BY keyword")]
+    finally:
+        conn.close()
+
+
+def _period_expression(period):
+    if period == "week":
+        return f"bucket_start - ((bucket_start - {WEEK_ANCHOR}) % {WEEK_SECONDS})"
+    return "bucket_start"
+
+
+def bucket_series(keyword, since=None, until=None, period="day", db_path=DB_PATH):
+    # [{"bucket_start", "tweets", "likeCount", ..., "engagement"}] oldest first
+    period_start = _period_expression(period)
+    sql = (
+        f"SELECT {period_start} AS period, SUM(tweets), "
+        f"{', '.join(f'SUM({column})' for column in COUNT_COLUMNS)} "
+        "FROM rollup_buckets WHERE keyword = ?"
+    )
+    params = [normalize_keyword(keyword)]
+    if since is not None:
+        sql += " AND bucket_start >= ?"
+        params.append(int(since))
+    if until is not None:
+        sql += " AND bucket_start < ?"
+        params.append(int(until))
+    sql += " GROUP BY period ORDER BY period"
+
+    conn = connect(db_path)
+    try:
+        series = []
+        for row in conn.execute(sql, params):
+            entry = {"bucket_start": row[0], "tweets": row[1]}
+            entry.update(zip(COUNT_FIELDS, row[2:]))
+            entry["engagement"] = _engagement(list(row[2:]))
+            series.append(entry)
+        return series
+    finally:
+        conn.close()
+
+
+def top_terms(keyword, kind, since=None, until=None, n=10, db_path=DB_PATH):
+    # [(term, tweets, engagement)] by tweet count over the window
+    sql = "SELECT term, SUM(tweets) AS total, SUM(engagement) FROM rollup_terms WHERE keyword = ? AND kind = ?"
+    params = [normalize_keyword(keyword), kind]
+    if since is not None:
+        sql += " AND bucket_start >= ?"
+        params.append(int(since))
+    if until is not None:
+        sql += " AND bucket_start < ?"
+        params.append(int(until))
+    sql += " GROUP BY term ORDER BY total DESC, term LIMIT ?"
+    params.append(int(n))
+
+    conn = connect(db_path)
+    try:
+        return [tuple(row) for row in conn.execute(sql, params)]
+    finally:
+        conn.close()
+
+
+def _change(current, previous):
+    if not previous:
+        return None
+    return round((current - previous) / previous * 100, 1)
+
+
+def latest_week(keyword, db_path=DB_PATH):
+    conn = connect(db_path)
+    try:
+        row = conn.execute(
+            "SELECT MAX(bucket_start) FROM rollup_buckets WHERE keyword = ?", (normalize_keyword(keyword),)
+        ).fetchone()
+    finally:
+        conn.close()
+    return week_start(row[0]) if row and row[0] is not None else None
+
+
+def week_over_week(keyword, weeks=4, until=None, db_path=DB_PATH):
+    # Weekly totals for the last `weeks` weeks that have data (up to the
+    # week containing `until`, default the newest stored week), each with
+    # its change against the week before
+    end_week = week_start(int(until)) if until is not None else latest_week(keyword, db_path)
+    if end_week is None:
+        return []
+    since = end_week - weeks * WEEK_SECONDS
+    series = {entry["bucket_start"]: entry
+              for entry in bucket_series(keyword, since=since, until=end_week + WEEK_SECONDS,
+                                         period="week", db_path=db_path)}
+    rows = []
+    for start in range(since, end_week + WEEK_SECONDS, WEEK_SECONDS):
+        entry = series.get(start, {"bucket_start": start, "tweets": 0, "engagement": 0})
+        previous = series.get(start - WEEK_SECONDS)
+        rows.append({
+            "week_start": start,
+            "tweets": entry["tweets"],
+            "engagement": entry["engagement"],
+            "tweets_change_pct": _change(entry["tweets"], previous["tweets"]) if previous else None,
+            "engagement_change_pct": _change(entry["engagement"], previous["engagement"]) if previous else None,
+        })
+    return rows[1:]
+
+
+def rising_terms(keyword, kind="hashtag", until=None, n=10, db_path=DB_PATH):
+    # Terms ranked by how much their tweet count grew from the previous week
+    # to the current one: [(term, this_week, last_week)]
+    end_week = week_start(int(until)) if until is not None else latest_week(keyword, db_path)
+    if end_week is None:
+        return []
+    conn = connect(db_path)
+    try:
+        rows = conn.execute(
+            """
+            SELECT term,
+                   SUM(CASE WHEN bucket_start >= ? THEN tweets ELSE 0 END) AS current,
+                   SUM(CASE WHEN bucket_start < ? THEN tweets ELSE 0 END) AS previous
+            FROM rollup_terms
+            WHERE keyword = ? AND kind = ? AND bucket_start >= ? AND bucket_start < ?
+            GROUP BY term
+            HAVING current > 0
+            ORDER BY current - previous DESC, current DESC, term
+            LIMIT ?
+            """,
+            (end_week, end_week, normalize_keyword(keyword), kind,
+             end_week - WEEK_SECONDS, end_week + WEEK_SECONDS, int(n)),
+        ).fetchall()
+    finally:
+        conn.close()
+    return [tuple(row) for row in rows]
+
+
+if __name__ == "__main__":
+    # Usage: python rollups.py rebuild [keyword] | python rollups.py weeks <keyword>
+    if len(sys.argv) >= 2 and sys.argv[1] == "rebuild":
+        started = time.perf_counter()
+        for name, count in rebuild(sys.argv[2] if len(sys.argv) > 2 else None).items():
+            print(f"{name or '(empty)'}: {count} tweets rolled up")
+        print(f"Done in {time.perf_counter() - started:.2f}s")
+    elif len(sys.argv) == 3 and sys.argv[1] == "weeks":
+        for row in week_over_week(sys.argv[2]):
+            print(json.dumps(row))
+    else:
+        print("Usage: python rollups.py rebuild [keyword] | python rollups.py weeks <keyword>")
+        sys.exit(1)
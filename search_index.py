@@ -0,0 +1,150 @@
+import re
+import sqlite3
+import sys
+
+import tracing
+from tweet_store import DB_PATH, _to_epoch, connect, load_tweets, normalize_keyword
+
+# Keyword, phrase and boolean search over every stored tweet, backed by the
+# FTS5 index tweet_store keeps over tweet text and hashtags. Query syntax:
+#
+#   bitcoin etf          both words (AND is implied)
+#   "spot etf"           exact phrase
+#   bitcoin OR ethereum  either word
+#   -scam / NOT scam     exclude a word or phrase
+#   #ai                  hashtag (matches the tweet's hashtags only)
+#   crypt*               prefix
+#   "spot et"*           phrase whose last word is a prefix
+SEARCH_LIMIT = 200
+
+_QUERY_TOKEN = re.compile(r'(-?)"([^"]*)"?(\*?)|(\S+)')
+_WORD = re.compile(r"\w+")
+
+
+def _term(text, hashtag=False, prefix=False):
+    # One FTS5 phrase; None if text has nothing the tokenizer would index
+    words = _WORD.findall(text.lower())
+    if not words:
+        return None
+    phrase = '"' + " ".join(words) + '"'
+    if prefix:
+        phrase += " *"
+    return f"hashtags : {phrase}" if hashtag else phrase
+
+
+def parse_query(query):
+    # Translates the query syntax above into an FTS5 MATCH expression.
+    # Raises ValueError when nothing positive is left to match.
+    clauses = []
+    excluded = []
+    pending_or = pending_not = False
+    for match in _QUERY_TOKEN.finditer(query or ""):
+        minus, phrase, star, word = match.groups()
+        if word in ("OR", "AND", "NOT"):
+            pending_or = word == "OR" and bool(clauses)
+            pending_not = word == "NOT"
+            continue
+        if phrase is not None:
+            negate = bool(minus)
+            term = _term(phrase, prefix=bool(star))
+        else:
+            negate = word.startswith("-") and len(word) > 1
+            word = word[1:] if negate else word
+            term = _term(word.lstrip("#"), hashtag=word.startswith("#"), prefix=word.endswith("*"))
+        negate = negate or pending_not
+        if term is not None:
+            if negate:
+                excluded.append(term)
+            elif pending_or:
+                clauses[-1].append(term)
+            else:
+                clauses.append([term])
+        pending_or = pending_not = False
+
+    if not clauses:
+        raise ValueError("Search needs at least one word, phrase or hashtag to match")
+    expression = " AND ".join(f"({' OR '.join(terms)})" if len(terms) > 1 else terms[0] for terms in clauses)
+    for term in excluded:
+        expression = f"({expression}) NOT {term}"
+    return expression
+
+
+def search_ids(query, keyword=None, since=None, until=None, limit=None, ranked=True, db_path=DB_PATH):
+    # Matching tweet ids, best match first unless ranked is False. keyword
+    # limits the search to tweets fetched for that keyword; raises
+    # ValueError on a bad query.
+    sql = ("SELECT t.id FROM tweet_search JOIN tweets t ON t.rowid = tweet_search.rowid "
+           "WHERE tweet_search MATCH ?")
+    params = [parse_query(query)]
+    if keyword is not None:
+        # Checked per match, which beats listing every tweet of the keyword
+        sql += (" AND EXISTS (SELECT 1 FROM sightings s JOIN runs r ON r.run_id = s.run_id "
+                "WHERE s.tweet_id = t.id AND r.keyword = ?)")
+        params.append(normalize_keyword(keyword))
+    if since is not None:
+        sql += " AND t.created_at >= ?"
+        params.append(_to_epoch(since))
+    if until is not None:
+        sql += " AND t.created_at < ?"
+        params.append(_to_epoch(until))
+    if ranked:
+        sql += " ORDER BY rank"
+    if limit:
+        sql += " LIMIT ?"
+        params.append(int(limit))
+
+    conn = connect(db_path)
+    try:
+        with tracing.span("search.query", keyword=keyword) as span:
+            try:
+                ids = [row[0] for row in conn.execute(sql, params)]
+            except sqlite3.OperationalError as e:
+                raise ValueError(f"Invalid search: {e}") from e
+            span.set(matches=len(ids))
+        return ids
+    finally:
+        conn.close()
+
+
+def search(query, keyword=None, since=None, until=None, limit=SEARCH_LIMIT, db_path=DB_PATH):
+    # Returns a batch of the matching tweets in rank order, or {"error": ...}
+    try:
+        ids = search_ids(query, keyword=keyword, since=since, until=until, limit=limit, db_path=db_path)
+    except ValueError as e:
+        return {"error": str(e)}
+    batch = load_tweets(ids=ids, db_path=db_path)
+    position = {tweet_id: index for index, tweet_id in enumerate(ids)}
+    batch["tweets"].sort(key=lambda tweet: position[tweet["id"]])
+    return batch
+
+
+def frame_mask(df, text, keyword=None, db_path=DB_PATH):
+    # Boolean mask over a tweet frame for the rows containing text, a plain
+    # keyword rather than a search query. Its words match as a phrase whose
+    # last word is a prefix, so "crypto" also matches "cryptocurrency" and
+    # "#crypto"; unlike the old substring filter, matches must start at a
+    # word ("bitcoin" no longer matches "mybitcoin"). Falls back to the
+    # substring match when text has nothing the index can match.
+    import analytics
+
+    words = _WORD.findall(text or "")
+    if not words:
+        return analytics.keyword_mask(df, text)
+    ids = search_ids(f'"{" ".join(words)}"*', keyword=keyword, ranked=False, db_path=db_path)
+    return df["id"].isin(ids)
+
+
+if __name__ == "__main__":
+    # Usage: python search_index.py "query" [keyword]
+    if len(sys.argv) < 2:
+        print("Usage: python search_index.py \"query\" [keyword]")
+        sys.exit(1)
+    result = search(sys.argv[1], keyword=sys.argv[2] if len(sys.argv) > 2 else None)
+    if "error" in result:
+        print(result["error"])
+        sys.exit(1)
+    authors = result["authors"]
+    for tweet in result["tweets"]:
+        author = authors.get(tweet["authorId"], {}).get("userName", "unknown")
+        print(f"{tweet['createdAt']}  @{author}: {' '.join((tweet['text'] or '').split())[:120]}")
+    print(f"{len(result['tweets'])} match(es)")
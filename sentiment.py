@@ -0,0 +1,108 @@
+import csv
+import math
+import os
+import re
+import sys
+from functools import lru_cache
+
+# Offline, CPU-only tweet sentiment. Texts are scored with the lexicon in
+# data/sentiment_lexicon.csv (words, a few two-word phrases and emoji,
+# weighted from -3 to 3) and a handful of rules: a negation up to three
+# words before a term flips and damps it, an intensifier right before it
+# strengthens it, and after "but" the rest of the text counts more. The sum
+# is squashed into a compound score in [-1, 1], like VADER's.
+#
+# Scoring is plain dict lookups, so a single core does tens of thousands of
+# tweets per second. Tweets are scored once, when projected at ingest.
+LEXICON_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "sentiment_lexicon.csv")
+# Scores at or beyond these count as positive or negative
+POSITIVE = 0.05
+NEGATIVE = -0.05
+
+NEGATIONS = frozenset("not no never none nobody nothing neither nor without cannot cant dont doesnt didnt "
+                      "isnt wasnt arent werent wont wouldnt shouldnt couldnt aint".split())
+INTENSIFIERS = {
+    "very": 0.3, "so": 0.3, "really": 0.3, "extremely": 0.4, "super": 0.3, "totally": 0.3, "absolutely": 0.4,
+    "incredibly": 0.4, "highly": 0.3, "most": 0.3, "too": 0.2, "quite": 0.1, "slightly": -0.3, "barely": -0.4,
+    "somewhat": -0.2, "kinda": -0.2, "little": -0.2,
+}
+NEGATION_WEIGHT = -0.74
+# Squashes the raw sum: compound = total / sqrt(total ** 2 + ALPHA)
+ALPHA = 15
+EXCLAMATION_BOOST = 0.29
+
+_URL = re.compile(r"https?://\S+|[@#]\w+")
+_TOKEN = re.compile(r"[a-z0-9]+(?:['’][a-z]+)?|[☀-➿\U0001F300-\U0001FAFF]️?")
+
+
+@lru_cache(maxsize=1)
+def lexicon():
+    # (single terms, two-word phrases by first word)
+    words = {}
+    phrases = {}
+    with open(LEXICON_PATH, encoding="utf-8", newline="") as f:
+        for row in csv.DictReader(f):
+            term = row["term"].strip().lower()
+            if " " in term:
+                first, second = term.split(" ", 1)
+                phrases.setdefault(first, {})[second] = float(row["score"])
+            else:
+                words[term] = float(row["score"])
+    return words, phrases
+
+
+def tokens(text):
+    text = _URL.sub(" ", (text or "").lower())
+    return [token.replace("’", "'") for token in _TOKEN.findall(text)]
+
+
+def score(text):
+    # Compound sentiment of one text, in [-1, 1]
+    words, phrases = lexicon()
+    found = tokens(text)
+    total = 0.0
+    after_but = 1.0
+    for index, token in enumerate(found):
+        if token == "but":
+            # What follows "but" is what the author means
+            total *= 0.5
+            after_but = 1.5
+            continue
+        value = words.get(token)
+        following = phrases.get(token)
+        if following and index + 1 < len(found) and found[index + 1] in following:
+            value = following[found[index + 1]]
+        if value is None:
+            continue
+        if index and found[index - 1] in INTENSIFIERS:
+            value += math.copysign(INTENSIFIERS[found[index - 1]], value)
+        for previous in found[max(0, index - 3):index]:
+            if previous in NEGATIONS or previous.endswith("n't"):
+                value *= NEGATION_WEIGHT
+                break
+        total += value * after_but
+
+    if total and "!" in text:
+        total += math.copysign(min(text.count("!"), 4) * EXCLAMATION_BOOST, total)
+    return total / math.sqrt(total * total + ALPHA)
+
+
+def label(value):
+    if value is None or value != value:
+        return "unscored"
+    if value >= POSITIVE:
+        return "positive"
+    if value <= NEGATIVE:
+        return "negative"
+    return "neutral"
+
+
+if __name__ == "__main__":
+    # Usage: python sentiment.py "text" ["text" ...]
+    if len(sys.argv) >= 2:
+        for text in sys.argv[1:]:
+            value = score(text)
+            print(f"{value:+.3f} {label(value):<9} {text}")
+    else:
+        print('Usage: python sentiment.py "text" ["text" ...]')
+        sys.exit(1)
@@ -0,0 +1,251 @@
+import json
+import os
+import threading
+import time
+import weakref
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Lightweight spans around pipeline stages (API pages, LLM calls, store,
+# frame build, chart rendering). Disabled by default; span() then returns a
+# shared no-op object, so instrumented code pays about one function call.
+#
+#   TRACING=1            record spans from startup (otherwise they are
+#                        recorded while some session holds the app's
+#                        diagnostics toggle on, see hold())
+#   TRACE_LOG=path       append every finished span as a JSON line
+#   METRICS_PORT=9108    serve Prometheus text at http://127.0.0.1:9108/metrics
+MAX_SPANS = int(os.getenv("TRACE_MAX_SPANS", "2000"))
+TRACE_LOG = os.getenv("TRACE_LOG")
+METRICS_PORT = os.getenv("METRICS_PORT")
+METRIC_PREFIX = "tweet_analyzer"
+
+_enabled = os.getenv("TRACING", "0") == "1"
+# Live hold() tokens; a token dropped with its session releases itself
+_holders = weakref.WeakSet()
+_lock = threading.Lock()
+# Finished spans waiting to be appended to TRACE_LOG
+_log_pending = []
+_log_lock = threading.Lock()
+_spans = deque(maxlen=MAX_SPANS)
+_stats = {}
+_counters = {}
+_server = None
+
+
+class _NoopSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+    def set(self, **attrs):
+        pass
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+class Span:
+    def __init__(self, name, attrs):
+        self.name = name
+        self.attrs = attrs
+        self.start = None
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        self.started_at = time.time()
+        return self
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def __exit__(self, exc_type, exc, tb):
+        duration = time.perf_counter() - self.start
+        record = {
+            "name": self.name,
+            "start": round(self.started_at, 6),
+            "duration_ms": round(duration * 1000, 3),
+            "thread": threading.current_thread().name,
+            "attrs": self.attrs,
+        }
+        if exc_type is not None:
+            record["error"] = f"{exc_type.__name__}: {exc}"
+        _record(record, duration)
+        return False
+
+
+class _Hold:
+    pass
+
+
+def is_enabled():
+    return _enabled or bool(_holders)
+
+
+def enable():
+    global _enabled
+    _enabled = True
+
+
+def disable():
+    global _enabled
+    _enabled = False
+
+
+def hold():
+    # Records spans while the returned token is alive and not released,
+    # e.g. for one Streamlit session's diagnostics view
+    token = _Hold()
+    with _lock:
+        _holders.add(token)
+    return token
+
+
+def release(token):
+    with _lock:
+        _holders.discard(token)
+
+
+def span(name, **attrs):
+    if not _enabled and not _holders:
+        return _NOOP_SPAN
+    return Span(name, attrs)
+
+
+def count(name, value=1):
+    # Monotonic counters, e.g. bytes received or retries
+    if not _enabled and not _holders:
+        return
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + value
+
+
+def _record(record, duration):
+    with _lock:
+        _spans.append(record)
+        stats = _stats.get(record["name"])
+        if stats is None:
+            stats = _stats[record["name"]] = {"count": 0, "errors": 0, "total_s": 0.0, "max_s": 0.0}
+        stats["count"] += 1
+        stats["total_s"] += duration
+        stats["max_s"] = max(stats["max_s"], duration)
+        if "error" in record:
+            stats["errors"] += 1
+    if TRACE_LOG:
+        _write_log(json.dumps(record, default=str) + "\n")
+
+
+def _write_log(line):
+    # The file is written outside _lock, so spans finishing on other threads
+    # don't wait on disk. Whichever thread gets _log_lock writes every line
+    # queued so far in one append; the others return at once.
+    _log_pending.append(line)
+    while _log_pending and _log_lock.acquire(blocking=False):
+        try:
+            lines = _log_pending[:]
+            del _log_pending[:len(lines)]
+            with open(TRACE_LOG, "a", encoding="utf-8") as f:
+                f.writelines(lines)
+        finally:
+            _log_lock.release()
+
+
+def recent_spans(limit=None, name=None):
+    with _lock:
+        spans = [record for record in _spans if name is None or record["name"] == name]
+    return spans[-limit:] if limit else spans
+
+
+def summary():
+    # Per-span totals, slowest total first
+    with _lock:
+        rows = [
+            {
+                "span": name,
+                "count": stats["count"],
+                "errors": stats["errors"],
+                "total_ms": round(stats["total_s"] * 1000, 1),
+                "avg_ms": round(stats["total_s"] * 1000 / stats["count"], 1),
+                "max_ms": round(stats["max_s"] * 1000, 1),
+            }
+            for name, stats in _stats.items()
+        ]
+    return sorted(rows, key=lambda row: row["total_ms"], reverse=True)
+
+
+def counters():
+    with _lock:
+        return dict(_counters)
+
+
+def export_json():
+    return json.dumps({"summary": summary(), "counters": counters(), "spans": recent_spans()}, default=str)
+
+
+def _metric_name(name):
+    return METRIC_PREFIX + "_" + "".join(c if c.isalnum() else "_" for c in name)
+
+
+def prometheus_text():
+    with _lock:
+        stats = {name: dict(values) for name, values in _stats.items()}
+        totals = dict(_counters)
+
+    lines = [
+        f"# HELP {METRIC_PREFIX}_span_seconds Time spent in each traced stage.",
+        f"# TYPE {METRIC_PREFIX}_span_seconds summary",
+    ]
+    for name, values in sorted(stats.items()):
+        lines.append(f'{METRIC_PREFIX}_span_seconds_sum{{span="{name}"}} {values["total_s"]:.6f}')
+        lines.append(f'{METRIC_PREFIX}_span_seconds_count{{span="{name}"}} {values["count"]}')
+    lines.append(f"# TYPE {METRIC_PREFIX}_span_errors_total counter")
+    for name, values in sorted(stats.items()):
+        lines.append(f'{METRIC_PREFIX}_span_errors_total{{span="{name}"}} {values["errors"]}')
+    for name, value in sorted(totals.items()):
+        metric = _metric_name(name) + "_total"
+        lines.append(f"# TYPE {metric} counter")
+        lines.append(f"{metric} {value}")
+    return "\n".join(lines) + "\n"
+
+
+def reset():
+    with _lock:
+        _spans.clear()
+        _stats.clear()
+        _counters.clear()
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] == "/metrics":
+            body, content_type = prometheus_text().encode("utf-8"), "text/plain; version=0.0.4"
+        elif self.path.split("?")[0] == "/spans":
+            body, content_type = export_json().encode("utf-8"), "application/json"
+        else:
+            self.send_response(404)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_metrics_server(port=None, host="127.0.0.1"):
+    # One server per process, however many Streamlit sessions call this
+    global _server
+    port = port or METRICS_PORT
+    if not port:
+        return None
+    with _lock:
+        if _server is None:
+            enable()
+            _server = ThreadingHTTPServer((host, int(port)), _MetricsHandler)
+            threading.Thread(target=_server.serve_forever, name="metrics-server", daemon=True).start()
+    return _server
@@ -0,0 +1,199 @@
+import os
+import sys
+
+import numpy as np
+
+# Deterministic burst detection over hashtag and word counts. Tweets are
+# counted per term in fixed time buckets ending at the newest tweet, and
+# every term's latest bucket is scored against an exponentially weighted
+# baseline (mean and variance) of its earlier buckets:
+#
+#   score = (latest - mean) / sqrt(variance + mean + 1)
+#
+# The mean in the denominator is a Poisson floor, so a term going from 0 to
+# 1 tweets doesn't look like a burst. All terms are updated at once as NumPy
+# vectors, one bucket at a time, so the same detector also runs
+# incrementally (TrendDetector.observe) as new buckets arrive.
+BUCKET_SECONDS = int(float(os.getenv("TREND_BUCKET_HOURS", "6")) * 3600)
+# Baseline half-life, in buckets
+HALF_LIFE = float(os.getenv("TREND_HALF_LIFE", "8"))
+SCORE_THRESHOLD = float(os.getenv("TREND_SCORE_THRESHOLD", "2.5"))
+# Tweets a term needs in the latest bucket before it can be flagged
+MIN_COUNT = int(os.getenv("TREND_MIN_COUNT", "3"))
+MAX_CANDIDATES = 15
+# Older buckets hardly move the baseline; 120 six-hour buckets is a month
+MAX_BUCKETS = 120
+
+STOPWORDS = frozenset("""
+a about above after again against all also am an and any are as at be because been before being below
+between both but by can could did do does doing down during each few for from further get got had has
+have having he her here hers him his how i if in into is it its itself just let like me more most my no
+nor not now of off on once only or other our ours out over own same she should so some such than that
+the their theirs them then there these they this those through to too under until up very via was we
+were what when where which while who whom why will with would you your yours rt amp new one today
+""".split())
+
+_URL = r"https?://\S+"
+_TAG_OR_MENTION = r"[#@]\w+"
+_SEPARATOR = r"[^\w]+"
+
+
+class TrendDetector:
+    # Streaming form: observe() one bucket of {term: count} at a time; each
+    # call scores that bucket against the baseline, then folds it in.
+
+    def __init__(self, half_life=HALF_LIFE):
+        self.alpha = 1 - 0.5 ** (1 / half_life)
+        self.terms = {}
+        self.mean = np.zeros(0)
+        self.var = np.zeros(0)
+        self.seen = np.zeros(0, dtype=bool)
+
+    def _grow(self, size):
+        extra = size - len(self.mean)
+        if extra > 0:
+            self.mean = np.concatenate([self.mean, np.zeros(extra)])
+            self.var = np.concatenate([self.var, np.zeros(extra)])
+            self.seen = np.concatenate([self.seen, np.zeros(extra, dtype=bool)])
+
+    def step(self, column):
+        # column: counts for every known term (index order); returns scores
+        column = np.asarray(column, dtype=float)
+        self._grow(len(column))
+        scores = _score(column, self.mean, self.var)
+        scores[~self.seen] = 0.0
+        delta = column - self.mean
+        self.mean += self.alpha * delta
+        self.var = (1 - self.alpha) * (self.var + self.alpha * delta ** 2)
+        self.seen[:] = True
+        return scores
+
+    def observe(self, counts):
+        # counts: {term: count} for one bucket; returns {term: score} for it
+        for term in counts:
+            self.terms.setdefault(term, len(self.terms))
+        column = np.zeros(len(self.terms))
+        column[[self.terms[term] for term in counts]] = list(counts.values())
+        scores = self.step(column)
+        return {term: float(scores[index]) for term, index in self.terms.items()}
+
+
+def _score(latest, mean, var):
+    return (latest - mean) / np.sqrt(var + mean + 1)
+
+
+def bucket_counts(df, bucket_seconds=BUCKET_SECONDS, exclude=()):
+    # (terms, kinds, counts) where counts[i, j] is how many tweets used
+    # term i in bucket j (oldest first). Buckets end at the newest tweet.
+    # Hashtags come from the hashtags column; words from the text, without
+    # URLs, hashtags, mentions, stopwords and the excluded words.
+    import pandas as pd
+    import pyarrow as pa
+    import pyarrow.compute as pc
+
+    created = pc.cast(pc.cast(pa.array(df["createdAt"]), pa.timestamp("s", tz="UTC")), pa.int64())
+    # Tweets without a parseable timestamp can't be bucketed
+    valid = pc.is_valid(created).to_numpy(zero_copy_only=False)
+    if not valid.all():
+        df = df[valid]
+        created = pc.filter(created, pa.array(valid))
+    if df.empty:
+        return [], [], np.zeros((0, 0))
+    created = created.to_numpy()
+    age_buckets = np.minimum((created.max() - created) // bucket_seconds, MAX_BUCKETS)
+    n_buckets = int(age_buckets.max()) + 1
+    buckets = n_buckets - 1 - age_buckets
+
+    text = pc.utf8_lower(pa.array(df["text"]))
+    text = pc.replace_substring_regex(pc.replace_substring_regex(text, _URL, " "), _TAG_OR_MENTION, " ")
+    words = pc.split_pattern_regex(text, _SEPARATOR)
+    tags = pa.array(df["hashtags"])
+
+    stop = pa.array(sorted(STOPWORDS | {word.lower() for word in exclude}))
+    parts = []
+    for kind, lists in (("hashtag", tags), ("term", words)):
+        values = pc.list_flatten(lists)
+        if kind == "hashtag":
+            values = pc.utf8_lower(values)
+        rows = pc.list_parent_indices(lists).to_numpy()
+        keep = pc.and_(pc.greater_equal(pc.utf8_length(values), 3 if kind == "term" else 1),
+                       pc.invert(pc.is_in(values, value_set=stop)))
+        if kind == "term":
+            keep = pc.and_(keep, pc.invert(pc.utf8_is_numeric(values)))
+        keep = keep.to_numpy(zero_copy_only=False)
+        prefix = "#" if kind == "hashtag" else ""
+        parts.append((pc.binary_join_element_wise(prefix, pc.filter(values, keep), "").to_numpy(zero_copy_only=False),
+                      rows[keep], kind))
+
+    values = np.concatenate([part[0] for part in parts])
+    rows = np.concatenate([part[1] for part in parts])
+    codes, terms = pd.factorize(values)
+    # Each tweet counts once per term
+    pairs = np.unique(codes.astype(np.int64) * len(df) + rows)
+    codes, rows = pairs // len(df), pairs % len(df)
+    recent = age_buckets[rows] < MAX_BUCKETS
+    codes, rows = codes[recent], rows[recent]
+    totals = np.bincount(codes, minlength=len(terms))
+    # Terms too rare to ever reach MIN_COUNT in a bucket are dropped before
+    # the dense terms x buckets matrix is built
+    frequent = np.flatnonzero(totals >= MIN_COUNT)
+    remap = np.full(len(terms), -1)
+    remap[frequent] = np.arange(len(frequent))
+    keep = remap[codes] >= 0
+    counts = np.bincount(remap[codes[keep]] * n_buckets + buckets[rows[keep]],
+                         minlength=len(frequent) * n_buckets).reshape(len(frequent), n_buckets)
+    terms = [terms[index] for index in frequent]
+    kinds = ["hashtag" if term.startswith("#") else "term" for term in terms]
+    return terms, kinds, counts
+
+
+def detect(df, keyword=None, bucket_seconds=BUCKET_SECONDS, n=MAX_CANDIDATES, threshold=SCORE_THRESHOLD):
+    # Ranked emerging terms: [{"term", "kind", "count", "baseline", "score"}]
+    # where count is the latest bucket's tweets and baseline the expected count
+    import tracing
+
+    with tracing.span("trends.detect", rows=len(df)) as span:
+        exclude = (keyword or "").lower().split()
+        terms, kinds, counts = bucket_counts(df, bucket_seconds, exclude=exclude)
+        if not terms or counts.shape[1] < 2:
+            span.set(terms=len(terms), candidates=0)
+            return []
+        # The baseline covers the buckets before the latest one
+        baseline = TrendDetector()
+        baseline._grow(len(terms))
+        for column in counts[:, :-1].T:
+            baseline.step(column)
+        latest = counts[:, -1].astype(float)
+        scores = _score(latest, baseline.mean, baseline.var)
+        flagged = np.flatnonzero((scores >= threshold) & (latest >= MIN_COUNT))
+        ranked = flagged[np.argsort(-scores[flagged], kind="stable")][:n]
+        span.set(terms=len(terms), candidates=len(ranked))
+    return [{"term": terms[index], "kind": kinds[index], "count": int(latest[index]),
+             "baseline": round(float(baseline.mean[index]), 2), "score": round(float(scores[index]), 2)}
+            for index in ranked]
+
+
+def prompt_lines(candidates, bucket_seconds=BUCKET_SECONDS):
+    # Plain-text candidates for the summarizer prompt
+    hours = bucket_seconds / 3600
+    return [f"- {candidate['term']}: {candidate['count']} tweets in the last {hours:g}h, "
+            f"usually {candidate['baseline']:g} (burst score {candidate['score']:g})\n"
+            for candidate in candidates]
+
+
+if __name__ == "__main__":
+    # Usage: python trends.py <keyword> [weeks]
+    if len(sys.argv) < 2:
+        print("Usage: python trends.py <keyword> [weeks]")
+        sys.exit(1)
+    import time
+
+    import analytics
+    from tweet_store import load_tweets
+
+    weeks = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+    frame = analytics.build_frame(load_tweets(sys.argv[1], since=time.time() - weeks * 7 * 24 * 3600))
+    started = time.perf_counter()
+    found = detect(frame, sys.argv[1])
+    print("".join(prompt_lines(found)) or "No emerging terms")
+    print(f"{len(frame)} tweets scored in {(time.perf_counter() - started) * 1000:.1f} ms")
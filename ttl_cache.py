@@ -0,0 +1,139 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+CACHE_DIR = os.getenv("CACHE_DIR", ".cache")
+
+
+class TTLCache:
+    # Two-tier cache: an in-process LRU in front of an optional SQLite file,
+    # so entries survive app restarts. Values must be JSON serializable.
+    # With weigh (value -> size) and max_weight, the in-process tier is also
+    # bounded by total size; the newest entry is always kept.
+
+    def __init__(self, ttl=900, max_entries=128, disk_path=None, max_disk_entries=1024, weigh=None,
+                 max_weight=None):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_disk_entries = max_disk_entries
+        self.weigh = weigh
+        self.max_weight = max_weight
+        self.weight = 0
+        self.disk_path = disk_path
+        self.hits = 0
+        self.misses = 0
+        self.disk_hits = 0
+        self._memory = OrderedDict()
+        self._lock = threading.RLock()
+        self._conn = None
+
+    def _disk(self):
+        if self.disk_path is None:
+            return None
+        if self._conn is None:
+            directory = os.path.dirname(self.disk_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._conn = sqlite3.connect(self.disk_path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache ("
+                "key TEXT PRIMARY KEY, expires_at REAL NOT NULL, "
+                "accessed_at REAL NOT NULL, value TEXT NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_cache_accessed ON cache(accessed_at)")
+        return self._conn
+
+    def _forget(self, key):
+        entry = self._memory.pop(key, None)
+        if entry is not None:
+            self.weight -= entry[2]
+
+    def _remember(self, key, expires_at, value):
+        self._forget(key)
+        self._memory[key] = (expires_at, value, self.weigh(value) if self.weigh else 0)
+        self.weight += self._memory[key][2]
+        while len(self._memory) > self.max_entries or (
+                self.max_weight is not None and self.weight > self.max_weight and len(self._memory) > 1):
+            self._forget(next(iter(self._memory)))
+
+    def get(self, key, default=None):
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                if entry[0] > now:
+                    self._memory.move_to_end(key)
+                    self.hits += 1
+                    return entry[1]
+                self._forget(key)
+
+            conn = self._disk()
+            if conn is not None:
+                row = conn.execute(
+                    "SELECT expires_at, value FROM cache WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None:
+                    if row[0] > now:
+                        with conn:
+                            conn.execute("UPDATE cache SET accessed_at = ? WHERE key = ?", (now, key))
+                        value = json.loads(row[1])
+                        self._remember(key, row[0], value)
+                        self.hits += 1
+                        self.disk_hits += 1
+                        return value
+                    with conn:
+                        conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+
+            self.misses += 1
+            return default
+
+    def set(self, key, value, ttl=None):
+        now = time.time()
+        expires_at = now + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._remember(key, expires_at, value)
+            conn = self._disk()
+            if conn is not None:
+                with conn:
+                    conn.execute(
+                        "INSERT OR REPLACE INTO cache (key, expires_at, accessed_at, value) "
+                        "VALUES (?, ?, ?, ?)",
+                        (key, expires_at, now, json.dumps(value, ensure_ascii=False, separators=(",", ":"))),
+                    )
+                    conn.execute("DELETE FROM cache WHERE expires_at <= ?", (now,))
+                    conn.execute(
+                        "DELETE FROM cache WHERE key IN (SELECT key FROM cache "
+                        "ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+                        (self.max_disk_entries,),
+                    )
+
+    def delete(self, key):
+        with self._lock:
+            self._forget(key)
+            conn = self._disk()
+            if conn is not None:
+                with conn:
+                    conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            self.weight = 0
+            conn = self._disk()
+            if conn is not None:
+                with conn:
+                    conn.execute("DELETE FROM cache")
+
+    def stats(self):
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "disk_hits": self.disk_hits,
+                "memory_entries": len(self._memory),
+                "memory_weight": self.weight,
+            }
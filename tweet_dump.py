@@ -0,0 +1,192 @@
+import gzip
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from datetime import datetime, timezone
+
+from tweet_schema import COUNT_FIELDS, project_tweets
+
+# Tweet dumps on disk. Analyses are written as gzip-compressed NDJSON: one
+# compact tweet record per line, with its author embedded under "author", so
+# a dump can be appended page by page as the fetch runs and streamed to a
+# download without being encoded again. read_dump also loads the old
+# pretty-printed data/*.json dumps (raw API tweets) and JSON downloads.
+EXPORT_DIR = os.getenv("EXPORT_DIR", os.path.join("data", "exports"))
+NDJSON_SUFFIX = ".ndjson.gz"
+DUMP_SUFFIXES = (".json", NDJSON_SUFFIX)
+COMPRESS_LEVEL = int(os.getenv("EXPORT_COMPRESS_LEVEL", "6"))
+# Every export holds the query's whole window, so older ones are
+# superseded: only the newest few per keyword and settings are kept, none
+# past the age
+EXPORT_KEEP = int(os.getenv("EXPORT_KEEP", "2"))
+EXPORT_MAX_AGE = int(os.getenv("EXPORT_MAX_AGE", str(7 * 24 * 3600)))
+
+_UNSAFE = re.compile(r"[^\w.'-]+")
+_STAMPED = re.compile(r"^(.*)_\d{8}_\d{6}(_[0-9a-f]{8})?$")
+
+
+def export_path(keyword, fetched_at, directory=None, region="", weeks=None, pages=None):
+    # "<keyword>_<YYYYmmdd_HHMMSS>_<hash>.ndjson.gz", the naming the importer
+    # expects. The hash of region/weeks/pages keeps analyses of one keyword
+    # with other settings, started in the same second, from sharing a file.
+    stamp = fetched_at.strftime("%Y%m%d_%H%M%S") if isinstance(fetched_at, datetime) else fetched_at
+    name = _UNSAFE.sub("_", (keyword or "").strip())
+    variant = hashlib.sha1(f"{region}|{weeks}|{pages}".encode("utf-8")).hexdigest()[:8]
+    return os.path.join(directory or EXPORT_DIR, f"{name}_{stamp}_{variant}{NDJSON_SUFFIX}")
+
+
+def dump_paths(directory):
+    return sorted(
+        os.path.join(directory, name) for name in os.listdir(directory)
+        if name.endswith(DUMP_SUFFIXES) and os.path.isfile(os.path.join(directory, name))
+    ) if os.path.isdir(directory) else []
+
+
+def dump_stem(path):
+    # "gaming_20250508_113131.ndjson.gz" -> "gaming_20250508_113131"
+    name = os.path.basename(path)
+    for suffix in DUMP_SUFFIXES:
+        if name.endswith(suffix):
+            return name[:-len(suffix)]
+    return os.path.splitext(name)[0]
+
+
+def prune_exports(directory=None, keep=EXPORT_KEEP, max_age=EXPORT_MAX_AGE):
+    # Deletes superseded exports; returns the paths removed. A download of
+    # a pruned export writes it again from the analysis.
+    directory = directory or EXPORT_DIR
+    by_query = {}
+    for path in dump_paths(directory):
+        match = _STAMPED.match(dump_stem(path))
+        if match and path.endswith(NDJSON_SUFFIX):
+            by_query.setdefault((match.group(1).lower(), match.group(2)), []).append(path)
+
+    now = time.time()
+    removed = []
+    for paths in by_query.values():
+        # Stamps sort by time, newest first
+        paths.sort(key=dump_stem, reverse=True)
+        for index, path in enumerate(paths):
+            try:
+                if index >= keep or now - os.path.getmtime(path) > max_age:
+                    os.remove(path)
+                    removed.append(path)
+            except FileNotFoundError:
+                pass
+    return removed
+
+
+class DumpWriter:
+    # Appends batches to a gzip NDJSON dump. Tweets already written are
+    # skipped, so fetched pages and the merged history can both be written.
+    # The file only appears under its final name once the writer is closed
+    # without an error.
+
+    def __init__(self, path):
+        self.path = path
+        self.count = 0
+        self._written = set()
+        self._partial = f"{path}.{os.getpid()}.{threading.get_ident()}.part"
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._file = gzip.open(self._partial, "wt", encoding="utf-8", compresslevel=COMPRESS_LEVEL)
+
+    def write(self, batch):
+        authors = batch["authors"]
+        lines = []
+        for tweet in batch["tweets"]:
+            if tweet["id"] in self._written:
+                continue
+            self._written.add(tweet["id"])
+            record = dict(tweet, author=authors.get(tweet["authorId"]))
+            lines.append(json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n")
+        self._file.writelines(lines)
+        self.count += len(lines)
+
+    def close(self):
+        self._file.close()
+        os.replace(self._partial, self.path)
+        return self.path
+
+    def abort(self):
+        self._file.close()
+        if os.path.exists(self._partial):
+            os.remove(self._partial)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+def write_dump(batch, path):
+    with DumpWriter(path) as writer:
+        writer.write(batch)
+    return path
+
+
+def read_dump(path):
+    # Returns a batch: {"tweets": [compact records], "authors": {id: author}}
+    if path.endswith(NDJSON_SUFFIX):
+        batch = {"tweets": [], "authors": {}}
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                tweet = json.loads(line)
+                author = tweet.pop("author", None)
+                if author:
+                    batch["authors"][author["id"]] = author
+                batch["tweets"].append(tweet)
+        return batch
+
+    with open(path, encoding="utf-8") as f:
+        data = json.load(f)
+    if isinstance(data, dict):
+        # A downloaded batch, or {"tweets": [raw tweets]}
+        batch = project_tweets(data.get("tweets", []))
+        batch["authors"].update(data.get("authors") or {})
+        return batch
+    return project_tweets(data)
+
+
+def _raw_tweet(tweet, author):
+    # API-shaped tweet rebuilt from a compact record, for consumers that
+    # replay dumps as search results
+    created = tweet.get("createdAt")
+    raw = {
+        "type": "tweet",
+        "id": tweet["id"],
+        "url": tweet.get("url") or "",
+        "text": tweet.get("text") or "",
+        "createdAt": datetime.fromtimestamp(created, timezone.utc).strftime("%a %b %d %H:%M:%S %z %Y")
+        if isinstance(created, (int, float)) else created,
+        "lang": tweet.get("lang") or "",
+        "isReply": bool(tweet.get("isReply")),
+        "author": author,
+        "entities": {"hashtags": [{"text": tag} for tag in tweet.get("hashtags") or []]},
+        "retweeted_tweet": {"id": tweet["retweetedId"]} if tweet.get("retweetedId") else None,
+        "quoted_tweet": {"id": tweet["quotedId"]} if tweet.get("quotedId") else None,
+    }
+    for field in COUNT_FIELDS:
+        raw[field] = tweet.get(field) or 0
+    return raw
+
+
+def read_raw_tweets(path):
+    # Raw API tweets as recorded in the old dumps; newer dumps are expanded
+    # back into that shape
+    if not path.endswith(NDJSON_SUFFIX):
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        tweets = data.get("tweets", []) if isinstance(data, dict) else data
+        if not any("authorId" in tweet for tweet in tweets):
+            return tweets
+    batch = read_dump(path)
+    return [_raw_tweet(tweet, batch["authors"].get(tweet.get("authorId"))) for tweet in batch["tweets"]]
@@ -0,0 +1,172 @@
+import hashlib
+from datetime import datetime
+from functools import lru_cache
+
+import sentiment
+
+# Raw twitterapi.io tweets carry the full author profile, media, cards and
+# nested quoted/retweeted tweets (~8 KB each). The app only needs the fields
+# below, so tweets are projected once at ingest into these compact records,
+# with authors normalized into their own table keyed by author id.
+TWEET_FIELDS = [
+    "id", "url", "text", "createdAt", "lang",
+    "likeCount", "retweetCount", "replyCount", "quoteCount", "viewCount", "bookmarkCount",
+    "isReply", "authorId", "hashtags", "retweetedId", "quotedId", "sentiment",
+]
+AUTHOR_FIELDS = ["id", "userName", "name", "location", "followers", "isBlueVerified"]
+COUNT_FIELDS = ["likeCount", "retweetCount", "replyCount", "quoteCount", "viewCount", "bookmarkCount"]
+
+
+@lru_cache(maxsize=None)
+def arrow_schema(with_author_columns=True):
+    # pyarrow is only imported when a batch is turned into a table
+    import pyarrow as pa
+
+    schema = pa.schema([
+        ("id", pa.string()),
+        ("url", pa.string()),
+        ("text", pa.string()),
+        ("createdAt", pa.timestamp("s", tz="UTC")),
+        ("lang", pa.string()),
+        ("likeCount", pa.int64()),
+        ("retweetCount", pa.int64()),
+        ("replyCount", pa.int64()),
+        ("quoteCount", pa.int64()),
+        ("viewCount", pa.int64()),
+        ("bookmarkCount", pa.int64()),
+        ("isReply", pa.bool_()),
+        ("authorId", pa.string()),
+        ("hashtags", pa.list_(pa.string())),
+        ("retweetedId", pa.string()),
+        ("quotedId", pa.string()),
+        ("sentiment", pa.float64()),
+    ])
+    if with_author_columns:
+        schema = schema.append(pa.field("username", pa.string())).append(pa.field("location", pa.string()))
+    return schema
+
+
+def parse_created_at(value):
+    # twitterapi.io format: "Sat May 03 10:23:58 +0000 2025"; compact
+    # records already hold epoch seconds
+    if value is None or value == "":
+        return None
+    if isinstance(value, (int, float)):
+        return int(value)
+    try:
+        return int(datetime.strptime(value, "%a %b %d %H:%M:%S %z %Y").timestamp())
+    except (TypeError, ValueError):
+        return None
+
+
+def is_compact(tweet):
+    return "authorId" in tweet
+
+
+def project_author(author):
+    if not isinstance(author, dict) or not author.get("id"):
+        return None
+    return {
+        "id": str(author["id"]),
+        "userName": author.get("userName") or "Unknown",
+        "name": author.get("name") or "",
+        "location": (author.get("location") or "").strip(),
+        "followers": author.get("followers") or 0,
+        "isBlueVerified": bool(author.get("isBlueVerified")),
+    }
+
+
+def project_tweet(tweet, keep_raw=False):
+    if is_compact(tweet):
+        return tweet
+
+    author = tweet.get("author")
+    entities = tweet.get("entities") or {}
+    retweeted = tweet.get("retweeted_tweet")
+    quoted = tweet.get("quoted_tweet")
+
+    text = tweet.get("text") or ""
+    record = {
+        "id": str(tweet.get("id") or ""),
+        "url": tweet.get("url") or "",
+        "text": text,
+        "createdAt": parse_created_at(tweet.get("createdAt")),
+        "lang": tweet.get("lang") or "",
+        "isReply": bool(tweet.get("isReply")),
+        "authorId": str(author["id"]) if isinstance(author, dict) and author.get("id") else None,
+        "hashtags": [tag["text"] for tag in entities.get("hashtags") or [] if tag.get("text")],
+        "retweetedId": str(retweeted["id"]) if isinstance(retweeted, dict) and retweeted.get("id") else None,
+        "quotedId": str(quoted["id"]) if isinstance(quoted, dict) and quoted.get("id") else None,
+        # Scored once here, at ingest, so views never wait on a scorer
+        "sentiment": round(sentiment.score(text), 4),
+    }
+    for field in COUNT_FIELDS:
+        record[field] = tweet.get(field) or 0
+    if "matchedQueries" in tweet:
+        record["matchedQueries"] = tweet["matchedQueries"]
+    if keep_raw:
+        record["raw"] = tweet
+    return record
+
+
+def empty_batch():
+    return {"tweets": [], "authors": {}}
+
+
+def project_tweets(tweets, keep_raw=False, batch=None):
+    # Returns (or extends) a batch: {"tweets": [compact records], "authors": {id: author}}
+    if batch is None:
+        batch = empty_batch()
+    authors = batch["authors"]
+    for tweet in tweets:
+        if not is_compact(tweet):
+            author = project_author(tweet.get("author"))
+            if author is not None:
+                authors[author["id"]] = author
+        batch["tweets"].append(project_tweet(tweet, keep_raw=keep_raw))
+    return batch
+
+
+def to_arrow(batch):
+    import pyarrow as pa
+    import pyarrow.compute as pc
+
+    tweets = batch["tweets"]
+    authors = list(batch["authors"].values())
+    table = pa.Table.from_pylist(tweets, schema=arrow_schema(with_author_columns=False))
+
+    # Join author columns through an index lookup instead of per-row dict access
+    author_index = pc.index_in(table["authorId"], value_set=pa.array([author["id"] for author in authors], pa.string()))
+    usernames = pa.array([author["userName"] for author in authors], pa.string())
+    locations = pa.array([author["location"] for author in authors], pa.string())
+    table = table.append_column("username", pc.fill_null(pc.take(usernames, author_index), "Unknown"))
+    table = table.append_column("location", pc.fill_null(pc.take(locations, author_index), ""))
+
+    for field in COUNT_FIELDS:
+        table = table.set_column(table.schema.get_field_index(field), field, pc.fill_null(table[field], 0))
+    table = table.set_column(
+        table.schema.get_field_index("hashtags"), "hashtags",
+        pc.fill_null(table["hashtags"], pa.scalar([], pa.list_(pa.string()))),
+    )
+    return table
+
+
+def to_frame(batch):
+    import pandas as pd
+
+    # Arrow-backed columns keep string and list operations in pyarrow compute
+    return to_arrow(batch).to_pandas(types_mapper=pd.ArrowDtype)
+
+
+def batch_digest(batch):
+    # Identifies a dataset by the fields the dashboard reads, so unchanged
+    # results can reuse cached frames and summaries
+    sha = hashlib.sha256()
+    for tweet in batch["tweets"]:
+        sha.update(f"{tweet['id']}|{tweet['createdAt']}|{tweet['authorId']}|".encode("utf-8"))
+        sha.update("|".join(str(tweet[field]) for field in COUNT_FIELDS).encode("utf-8"))
+        sha.update(b"\0")
+    for author_id in sorted(batch["authors"]):
+        author = batch["authors"][author_id]
+        sha.update(f"{author_id}|{author['userName']}|{author['location']}\0".encode("utf-8"))
+    return sha.hexdigest()
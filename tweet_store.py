@@ -0,0 +1,523 @@
+import glob
+import json
+import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+from datetime import datetime
+
+import tracing
+from tweet_schema import parse_created_at, project_tweets
+
+DB_PATH = os.path.join("data", "tweets.db")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS tweets (
+    id TEXT PRIMARY KEY,
+    created_at INTEGER,
+    first_seen INTEGER NOT NULL,
+    author_id TEXT,
+    url TEXT,
+    text TEXT,
+    lang TEXT,
+    like_count INTEGER NOT NULL DEFAULT 0,
+    retweet_count INTEGER NOT NULL DEFAULT 0,
+    reply_count INTEGER NOT NULL DEFAULT 0,
+    quote_count INTEGER NOT NULL DEFAULT 0,
+    view_count INTEGER NOT NULL DEFAULT 0,
+    bookmark_count INTEGER NOT NULL DEFAULT 0,
+    is_reply INTEGER NOT NULL DEFAULT 0,
+    hashtags TEXT,
+    retweeted_id TEXT,
+    quoted_id TEXT,
+    sentiment REAL,
+    raw TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_tweets_created_at ON tweets(created_at);
+
+CREATE TABLE IF NOT EXISTS authors (
+    id TEXT PRIMARY KEY,
+    user_name TEXT,
+    name TEXT,
+    location TEXT,
+    followers INTEGER,
+    is_blue_verified INTEGER
+);
+
+CREATE TABLE IF NOT EXISTS runs (
+    run_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    keyword TEXT NOT NULL,
+    region TEXT NOT NULL DEFAULT '',
+    weeks INTEGER,
+    pages INTEGER,
+    fetched_at INTEGER NOT NULL,
+    source TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_runs_keyword ON runs(keyword);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_runs_source ON runs(source);
+
+CREATE TABLE IF NOT EXISTS sightings (
+    tweet_id TEXT NOT NULL,
+    run_id INTEGER NOT NULL,
+    PRIMARY KEY (tweet_id, run_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_sightings_run ON sightings(run_id);
+
+CREATE TABLE IF NOT EXISTS watermarks (
+    query_key TEXT PRIMARY KEY,
+    newest_created_at INTEGER NOT NULL,
+    newest_id TEXT,
+    updated_at INTEGER NOT NULL
+);
+
+-- Per-keyword daily rollups, maintained by rollups.py
+CREATE TABLE IF NOT EXISTS rollup_members (
+    keyword TEXT NOT NULL,
+    tweet_id TEXT NOT NULL,
+    bucket_start INTEGER NOT NULL,
+    like_count INTEGER NOT NULL DEFAULT 0,
+    retweet_count INTEGER NOT NULL DEFAULT 0,
+    reply_count INTEGER NOT NULL DEFAULT 0,
+    quote_count INTEGER NOT NULL DEFAULT 0,
+    view_count INTEGER NOT NULL DEFAULT 0,
+    terms TEXT NOT NULL,
+    PRIMARY KEY (keyword, tweet_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_rollup_members_tweet ON rollup_members(tweet_id);
+
+CREATE TABLE IF NOT EXISTS rollup_buckets (
+    keyword TEXT NOT NULL,
+    bucket_start INTEGER NOT NULL,
+    tweets INTEGER NOT NULL DEFAULT 0,
+    like_count INTEGER NOT NULL DEFAULT 0,
+    retweet_count INTEGER NOT NULL DEFAULT 0,
+    reply_count INTEGER NOT NULL DEFAULT 0,
+    quote_count INTEGER NOT NULL DEFAULT 0,
+    view_count INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (keyword, bucket_start)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS rollup_terms (
+    keyword TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    bucket_start INTEGER NOT NULL,
+    term TEXT NOT NULL,
+    tweets INTEGER NOT NULL DEFAULT 0,
+    engagement INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (keyword, kind, bucket_start, term)
+) WITHOUT ROWID;
+
+-- Author location strings resolved against the gazetteer, by locations.py
+CREATE TABLE IF NOT EXISTS location_memo (
+    raw TEXT PRIMARY KEY,
+    version TEXT NOT NULL,
+    city TEXT,
+    region TEXT,
+    country TEXT
+) WITHOUT ROWID;
+
+-- Precomputed analyses written by batch_runner.py, keyed like analysis_cache results
+CREATE TABLE IF NOT EXISTS reports (
+    result_key TEXT PRIMARY KEY,
+    keyword TEXT NOT NULL,
+    run_id INTEGER,
+    created_at INTEGER NOT NULL,
+    report TEXT NOT NULL
+);
+"""
+
+# Full-text index over tweet text and hashtags, queried by search_index.py.
+# It reads the tweets table (external content). New tweets are indexed in
+# bulk by _write_batch (several times faster than a per-row insert trigger);
+# triggers cover the rarer updates that change text or hashtags.
+SEARCH_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS tweet_search USING fts5(
+    text, hashtags, content='tweets', content_rowid='rowid',
+    tokenize="unicode61 remove_diacritics 2 tokenchars '_'"
+);
+CREATE TRIGGER IF NOT EXISTS tweets_search_update AFTER UPDATE OF text, hashtags ON tweets
+WHEN old.text IS NOT new.text OR old.hashtags IS NOT new.hashtags BEGIN
+    INSERT INTO tweet_search (tweet_search, rowid, text, hashtags) VALUES ('delete', old.rowid, old.text, old.hashtags);
+    INSERT INTO tweet_search (rowid, text, hashtags) VALUES (new.rowid, new.text, new.hashtags);
+END;
+CREATE TRIGGER IF NOT EXISTS tweets_search_delete AFTER DELETE ON tweets BEGIN
+    INSERT INTO tweet_search (tweet_search, rowid, text, hashtags) VALUES ('delete', old.rowid, old.text, old.hashtags);
+END;
+"""
+
+# Compact record field -> tweets column
+TWEET_COLUMNS = [
+    ("id", "id"), ("createdAt", "created_at"), ("authorId", "author_id"), ("url", "url"),
+    ("text", "text"), ("lang", "lang"), ("likeCount", "like_count"),
+    ("retweetCount", "retweet_count"), ("replyCount", "reply_count"), ("quoteCount", "quote_count"),
+    ("viewCount", "view_count"), ("bookmarkCount", "bookmark_count"), ("isReply", "is_reply"),
+    ("hashtags", "hashtags"), ("retweetedId", "retweeted_id"), ("quotedId", "quoted_id"),
+    ("sentiment", "sentiment"),
+]
+AUTHOR_COLUMNS = [
+    ("id", "id"), ("userName", "user_name"), ("name", "name"), ("location", "location"),
+    ("followers", "followers"), ("isBlueVerified", "is_blue_verified"),
+]
+
+# Per-run dumps are named {keyword}_{YYYYmmdd_HHMMSS}.json, exports
+# {keyword}_{YYYYmmdd_HHMMSS}_{settings hash}.ndjson.gz
+DUMP_NAME = re.compile(r"^(.*)_(\d{8}_\d{6})(?:_[0-9a-f]{8})?$")
+
+# Stores whose schema this process has created (see connect)
+_schema_ready = set()
+_schema_lock = threading.Lock()
+
+
+def normalize_keyword(keyword):
+    return (keyword or "").strip().lower()
+
+
+def _to_epoch(value):
+    if value is None:
+        return None
+    if isinstance(value, datetime):
+        return int(value.timestamp())
+    return int(value)
+
+
+def connect(db_path=DB_PATH):
+    directory = os.path.dirname(db_path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    conn = sqlite3.connect(db_path)
+    conn.execute("PRAGMA synchronous=NORMAL")
+    # The schema (and WAL mode, which persists in the file) is set up once
+    # per store per process, not on every connect
+    key = os.path.abspath(db_path)
+    with _schema_lock:
+        if key not in _schema_ready:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(SCHEMA + SEARCH_SCHEMA)
+            _schema_ready.add(key)
+    return conn
+
+
+def _tweet_row(tweet, seen_at):
+    row = []
+    for field, column in TWEET_COLUMNS:
+        value = tweet.get(field)
+        if field == "hashtags":
+            value = json.dumps(value or [], ensure_ascii=False)
+        elif field == "isReply":
+            value = int(bool(value))
+        row.append(value)
+    raw = tweet.get("raw")
+    row.append(seen_at)
+    row.append(json.dumps(raw, ensure_ascii=False, separators=(",", ":")) if raw is not None else None)
+    return row
+
+
+def _write_batch(conn, batch, seen_at):
+    tweets = [tweet for tweet in batch["tweets"] if tweet.get("id")]
+    columns = [column for _, column in TWEET_COLUMNS] + ["first_seen", "raw"]
+    updates = [column for _, column in TWEET_COLUMNS if column not in ("id", "created_at")]
+
+    # Only rewrite a stored tweet when something actually changed (e.g.
+    # updated like counts), so repeat fetches stay cheap. A stored raw
+    # payload is kept unless a new one is supplied.
+    last_rowid = conn.execute("SELECT COALESCE(MAX(rowid), 0) FROM tweets").fetchone()[0]
+    conn.executemany(
+        f"""
+        INSERT INTO tweets ({", ".join(columns)}) VALUES ({", ".join("?" * len(columns))})
+        ON CONFLICT(id) DO UPDATE SET
+            {", ".join(f"{column} = excluded.{column}" for column in updates)},
+            raw = COALESCE(excluded.raw, tweets.raw)
+        WHERE ({", ".join(f"tweets.{column}" for column in updates)})
+            IS NOT ({", ".join(f"excluded.{column}" for column in updates)})
+            OR excluded.raw IS NOT NULL
+        """,
+        [_tweet_row(tweet, seen_at) for tweet in tweets],
+    )
+    # New rows always get rowids above the previous maximum
+    conn.execute(
+        "INSERT INTO tweet_search (rowid, text, hashtags) SELECT rowid, text, hashtags FROM tweets WHERE rowid > ?",
+        (last_rowid,),
+    )
+
+    author_columns = [column for _, column in AUTHOR_COLUMNS]
+    conn.executemany(
+        f"""
+        INSERT INTO authors ({", ".join(author_columns)}) VALUES ({", ".join("?" * len(author_columns))})
+        ON CONFLICT(id) DO UPDATE SET
+            {", ".join(f"{column} = excluded.{column}" for column in author_columns[1:])}
+        WHERE ({", ".join(f"authors.{column}" for column in author_columns[1:])})
+            IS NOT ({", ".join(f"excluded.{column}" for column in author_columns[1:])})
+        """,
+        [[author.get(field) for field, _ in AUTHOR_COLUMNS] for author in batch["authors"].values()],
+    )
+    return tweets
+
+
+def _upsert_tweets(conn, tweets, run_id, seen_at, keyword, keep_raw=False):
+    return _upsert_batch(conn, project_tweets(tweets, keep_raw=keep_raw), run_id, seen_at, keyword)
+
+
+def _upsert_batch(conn, batch, run_id, seen_at, keyword):
+    # rollups imports this module, so it is imported here rather than at the top
+    from rollups import apply_batch
+
+    written = _write_batch(conn, batch, seen_at)
+    conn.executemany(
+        "INSERT OR IGNORE INTO sightings (tweet_id, run_id) VALUES (?, ?)",
+        [(tweet["id"], run_id) for tweet in written],
+    )
+    apply_batch(conn, keyword, batch)
+    return len(written)
+
+
+def save_run(tweets, keyword, region="", weeks=None, pages=None, fetched_at=None,
+             source=None, keep_raw=False, db_path=DB_PATH):
+    # tweets may be raw API tweets or compact records; the raw payload is
+    # only stored when keep_raw is set
+    fetched_at = _to_epoch(fetched_at) or int(time.time())
+    conn = connect(db_path)
+    try:
+        with conn:
+            cursor = conn.execute(
+                "INSERT INTO runs (keyword, region, weeks, pages, fetched_at, source) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (normalize_keyword(keyword), (region or "").strip(), weeks, pages, fetched_at, source),
+            )
+            run_id = cursor.lastrowid
+            with tracing.span("store.save", tweets=len(tweets)) as span:
+                span.set(written=_upsert_tweets(conn, tweets, run_id, fetched_at, keyword, keep_raw=keep_raw))
+        return run_id
+    finally:
+        conn.close()
+
+
+def _row_to_tweet(row, include_raw):
+    tweet = {field: value for (field, _), value in zip(TWEET_COLUMNS, row)}
+    tweet["hashtags"] = json.loads(tweet["hashtags"]) if tweet["hashtags"] else []
+    tweet["isReply"] = bool(tweet["isReply"])
+    if include_raw and row[-1] is not None:
+        tweet["raw"] = json.loads(row[-1])
+    return tweet
+
+
+def load_tweets(keyword=None, since=None, until=None, limit=None, region=None,
+                include_raw=False, ids=None, db_path=DB_PATH):
+    # Returns a batch: {"tweets": [compact records], "authors": {id: author}}
+    columns = [f"t.{column}" for _, column in TWEET_COLUMNS] + ["t.raw" if include_raw else "NULL"]
+    sql = f"SELECT {', '.join(columns)} FROM tweets t"
+    clauses = []
+    params = []
+    if ids is not None:
+        # Loaded through a temporary table, so any number of ids fits
+        clauses.append("t.id IN (SELECT id FROM temp.load_ids)")
+    if keyword is not None:
+        run_filter = "r.keyword = ?"
+        params.append(normalize_keyword(keyword))
+        if region is not None:
+            run_filter += " AND lower(r.region) = ?"
+            params.append((region or "").strip().lower())
+        clauses.append(
+            "t.id IN (SELECT s.tweet_id FROM sightings s JOIN runs r ON r.run_id = s.run_id "
+            f"WHERE {run_filter})"
+        )
+    if since is not None:
+        clauses.append("t.created_at >= ?")
+        params.append(_to_epoch(since))
+    if until is not None:
+        clauses.append("t.created_at < ?")
+        params.append(_to_epoch(until))
+    if clauses:
+        sql += " WHERE " + " AND ".join(clauses)
+    sql += " ORDER BY t.created_at DESC"
+    if limit:
+        sql += " LIMIT ?"
+        params.append(int(limit))
+
+    conn = connect(db_path)
+    try:
+        if ids is not None:
+            conn.execute("CREATE TEMP TABLE IF NOT EXISTS load_ids (id TEXT PRIMARY KEY)")
+            conn.executemany("INSERT OR IGNORE INTO temp.load_ids (id) VALUES (?)", [(str(i),) for i in ids])
+        with tracing.span("store.load") as span:
+            tweets = [_row_to_tweet(row, include_raw) for row in conn.execute(sql, params)]
+            author_ids = sorted({tweet["authorId"] for tweet in tweets if tweet["authorId"]})
+            authors = {}
+            author_columns = ", ".join(column for _, column in AUTHOR_COLUMNS)
+            # Stay well under SQLite's bound-parameter limit
+            for start in range(0, len(author_ids), 500):
+                chunk = author_ids[start:start + 500]
+                for row in conn.execute(
+                    f"SELECT {author_columns} FROM authors WHERE id IN ({', '.join('?' * len(chunk))})", chunk
+                ):
+                    author = {field: value for (field, _), value in zip(AUTHOR_COLUMNS, row)}
+                    author["isBlueVerified"] = bool(author["isBlueVerified"])
+                    authors[author["id"]] = author
+            span.set(tweets=len(tweets), authors=len(authors))
+        return {"tweets": tweets, "authors": authors}
+    finally:
+        conn.close()
+
+
+def stored_ids(ids, db_path=DB_PATH):
+    # The subset of ids already in the store
+    ids = sorted({str(tweet_id) for tweet_id in ids})
+    found = set()
+    conn = connect(db_path)
+    try:
+        # Stay well under SQLite's bound-parameter limit
+        for start in range(0, len(ids), 500):
+            chunk = ids[start:start + 500]
+            found.update(row[0] for row in conn.execute(
+                f"SELECT id FROM tweets WHERE id IN ({', '.join('?' * len(chunk))})", chunk))
+    finally:
+        conn.close()
+    return found
+
+
+def list_runs(keyword=None, db_path=DB_PATH):
+    sql = (
+        "SELECT r.run_id, r.keyword, r.region, r.weeks, r.pages, r.fetched_at, r.source, "
+        "COUNT(s.tweet_id) FROM runs r LEFT JOIN sightings s ON s.run_id = r.run_id"
+    )
+    params = []
+    if keyword is not None:
+        sql += " WHERE r.keyword = ?"
+        params.append(normalize_keyword(keyword))
+    sql += " GROUP BY r.run_id ORDER BY r.fetched_at DESC"
+
+    columns = ["run_id", "keyword", "region", "weeks", "pages", "fetched_at", "source", "tweets"]
+    conn = connect(db_path)
+    try:
+        return [dict(zip(columns, row)) for row in conn.execute(sql, params)]
+    finally:
+        conn.close()
+
+
+def get_high_water_mark(query_key, db_path=DB_PATH):
+    conn = connect(db_path)
+    try:
+        row = conn.execute(
+            "SELECT newest_created_at, newest_id FROM watermarks WHERE query_key = ?", (query_key,)
+        ).fetchone()
+    finally:
+        conn.close()
+    if row is None:
+        return None
+    return {"created_at": row[0], "id": row[1]}
+
+
+def update_high_water_mark(query_key, tweets, db_path=DB_PATH):
+    # Only ever moves forward; returns the mark now stored (or None)
+    newest = None
+    for tweet in tweets:
+        created_at = parse_created_at(tweet.get("createdAt"))
+        if created_at is not None and (newest is None or created_at > newest[0]):
+            newest = (created_at, str(tweet.get("id")))
+
+    conn = connect(db_path)
+    try:
+        if newest is not None:
+            with conn:
+                conn.execute(
+                    """
+                    INSERT INTO watermarks (query_key, newest_created_at, newest_id, updated_at)
+                    VALUES (?, ?, ?, ?)
+                    ON CONFLICT(query_key) DO UPDATE SET
+                        newest_created_at = excluded.newest_created_at,
+                        newest_id = excluded.newest_id,
+                        updated_at = excluded.updated_at
+                    WHERE excluded.newest_created_at > watermarks.newest_created_at
+                    """,
+                    (query_key, newest[0], newest[1], int(time.time())),
+                )
+    finally:
+        conn.close()
+    return get_high_water_mark(query_key, db_path=db_path)
+
+
+def clear_high_water_mark(query_key, db_path=DB_PATH):
+    conn = connect(db_path)
+    try:
+        with conn:
+            conn.execute("DELETE FROM watermarks WHERE query_key = ?", (query_key,))
+    finally:
+        conn.close()
+
+
+def save_report(result_key, keyword, report, run_id=None, created_at=None, db_path=DB_PATH):
+    # report is any JSON-serializable dict; one is kept per result key
+    created_at = _to_epoch(created_at) or int(time.time())
+    conn = connect(db_path)
+    try:
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO reports (result_key, keyword, run_id, created_at, report) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (result_key, normalize_keyword(keyword), run_id, created_at,
+                 json.dumps(report, ensure_ascii=False, default=str)),
+            )
+    finally:
+        conn.close()
+
+
+def get_report(result_key, db_path=DB_PATH):
+    # {"keyword", "run_id", "created_at", "report"} or None
+    conn = connect(db_path)
+    try:
+        row = conn.execute(
+            "SELECT keyword, run_id, created_at, report FROM reports WHERE result_key = ?", (result_key,)
+        ).fetchone()
+    finally:
+        conn.close()
+    if row is None:
+        return None
+    return {"keyword": row[0], "run_id": row[1], "created_at": row[2], "report": json.loads(row[3])}
+
+
+def import_json_dumps(pattern=None, db_path=DB_PATH):
+    # One-shot import of per-run dumps, the old data/*.json files as well as
+    # the .ndjson.gz ones (pattern defaults to both in data/). Each file
+    # becomes one run, and files that were already imported are skipped.
+    from tweet_dump import dump_paths, dump_stem, read_dump
+
+    imported = {}
+    conn = connect(db_path)
+    try:
+        for path in sorted(glob.glob(pattern)) if pattern else dump_paths("data"):
+            name = os.path.basename(path)
+            source = f"import:{name}"
+            if conn.execute("SELECT 1 FROM runs WHERE source = ?", (source,)).fetchone():
+                continue
+
+            match = DUMP_NAME.match(dump_stem(path))
+            if match:
+                keyword = match.group(1)
+                fetched_at = int(datetime.strptime(match.group(2), "%Y%m%d_%H%M%S").timestamp())
+            else:
+                keyword = dump_stem(path)
+                fetched_at = int(os.path.getmtime(path))
+
+            batch = read_dump(path)
+            with conn:
+                cursor = conn.execute(
+                    "INSERT INTO runs (keyword, region, fetched_at, source) VALUES (?, '', ?, ?)",
+                    (normalize_keyword(keyword), fetched_at, source),
+                )
+                imported[name] = _upsert_batch(conn, batch, cursor.lastrowid, fetched_at, keyword)
+    finally:
+        conn.close()
+    return imported
+
+
+if __name__ == "__main__":
+    # Usage: python tweet_store.py import [glob]
+    if len(sys.argv) >= 2 and sys.argv[1] == "import":
+        results = import_json_dumps(sys.argv[2] if len(sys.argv) > 2 else None)
+        for name, count in results.items():
+            print(f"Imported {count} tweets from {name}")
+        print(f"{len(results)} file(s) imported into {DB_PATH}")
+    else:
+        print("Usage: python tweet_store.py import [glob]")
+        sys.exit(1)
@@ -1,49 +1,328 @@
 import requests
 import datetime
+import json
 import os
-import streamlit as st
+import random
+import threading
+import time
+import tracing
+from resources import TWITTER_BACKEND, get_secret, get_twitter_session
+from ttl_cache import TTLCache, CACHE_DIR
 
-def fetch_tweets(keyword, pages, weeks, region):
-    API_KEY = st.secrets["X_API_KEY"]
+API_URL = os.getenv("TWITTER_API_URL", "https://api.twitterapi.io/twitter/tweet/advanced_search")
+QUERY_TYPE = "Top"
+# Incremental fetches (since: set) ask for newest-first results instead, so
+# the pages they get are always the newest tweets after the mark
+INCREMENTAL_QUERY_TYPE = "Latest"
 
-    since_time = (datetime.datetime.now() - datetime.timedelta(weeks=weeks)).strftime('%Y-%m-%d_%H:%M:%S_UTC')
+CONNECT_TIMEOUT = float(os.getenv("TWITTER_CONNECT_TIMEOUT", "5"))
+READ_TIMEOUT = float(os.getenv("TWITTER_READ_TIMEOUT", "30"))
+MAX_RETRIES = int(os.getenv("TWITTER_MAX_RETRIES", "4"))
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 30.0
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+# Slow down once the API reports this few remaining requests in the window
+RATE_LIMIT_RESERVE = 2
+# Process-wide cap on request rate, shared by all concurrent fetches
+MAX_REQUESTS_PER_SECOND = float(os.getenv("TWITTER_MAX_RPS", "5"))
 
+# Cursor pages are cached per normalized query (page count is not part of
+# the key), so asking for more pages only fetches the missing ones.
+_page_cache = TTLCache(
+    ttl=int(os.getenv("TWEET_CACHE_TTL", "900")),
+    max_entries=int(os.getenv("TWEET_CACHE_MAX_ENTRIES", "64")),
+    disk_path=os.path.join(CACHE_DIR, "tweet_pages.db"),
+)
+_page_stats = {"pages_from_cache": 0, "pages_fetched": 0}
+# multi_fetch updates the counts from several threads
+_page_stats_lock = threading.Lock()
+
+_rate_limit = {"remaining": None, "reset_at": 0.0}
+_rate_limit_lock = threading.Lock()
+
+
+class _TokenBucket:
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        if self.rate <= 0:
+            return
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+_request_bucket = _TokenBucket(MAX_REQUESTS_PER_SECOND)
+
+
+def set_request_rate(rate):
+    # For processes that share TWITTER_MAX_RPS (batch_runner workers): each
+    # one limits itself to its share
+    global _request_bucket
+    _request_bucket = _TokenBucket(rate)
+
+
+class FetchError(Exception):
+    def __init__(self, message, status=None):
+        super().__init__(message)
+        self.status = status
+
+
+def normalize_query(keyword, region, weeks, query_type=QUERY_TYPE):
+    return {
+        "keyword": " ".join((keyword or "").lower().split()),
+        "region": " ".join((region or "").lower().split()),
+        "weeks": int(weeks),
+        "queryType": query_type,
+    }
+
+
+def query_key(keyword, region, weeks, query_type=QUERY_TYPE):
+    return json.dumps(normalize_query(keyword, region, weeks, query_type), sort_keys=True)
+
+
+def cache_stats():
+    stats = _page_cache.stats()
+    with _page_stats_lock:
+        stats.update(_page_stats)
+    return stats
+
+
+def clear_cache():
+    _page_cache.clear()
+
+
+def _parse_reset(value):
+    # Accept either an epoch timestamp or a number of seconds from now
+    try:
+        reset = float(value)
+    except (TypeError, ValueError):
+        return None
+    return reset if reset > 1e9 else time.time() + reset
+
+
+def _update_rate_limit(response):
+    remaining = response.headers.get("x-ratelimit-remaining")
+    reset_at = _parse_reset(response.headers.get("x-ratelimit-reset"))
+    with _rate_limit_lock:
+        if remaining is not None:
+            try:
+                _rate_limit["remaining"] = int(remaining)
+            except ValueError:
+                pass
+        if reset_at is not None:
+            _rate_limit["reset_at"] = reset_at
+
+
+def _wait_for_rate_limit():
+    with _rate_limit_lock:
+        remaining = _rate_limit["remaining"]
+        delay = _rate_limit["reset_at"] - time.time()
+    if remaining is not None and remaining <= RATE_LIMIT_RESERVE and delay > 0:
+        time.sleep(min(delay, BACKOFF_MAX))
+
+
+def _retry_delay(response, attempt):
+    if response is not None:
+        retry_after = response.headers.get("Retry-After")
+        if retry_after is not None:
+            try:
+                return min(float(retry_after), BACKOFF_MAX)
+            except ValueError:
+                pass
+    # Full jitter exponential backoff
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * (2 ** attempt)))
+
+
+def _request_page(headers, params, sent=None):
+    # One pooled keep-alive session per process, shared across reruns
+    # (or the in-process replay backend). sent["requests"] counts every
+    # attempt, retries included.
+    session = get_twitter_session()
+    last_error = None
+    with tracing.span("twitter.page", cursor=params.get("cursor") or "") as span:
+        for attempt in range(MAX_RETRIES + 1):
+            span.set(attempts=attempt + 1)
+            if attempt:
+                tracing.count("twitter.retries")
+            _wait_for_rate_limit()
+            _request_bucket.acquire()
+            if sent is not None:
+                sent["requests"] += 1
+            response = None
+            try:
+                started = time.perf_counter()
+                response = session.get(API_URL, headers=headers, params=params,
+                                       timeout=(CONNECT_TIMEOUT, READ_TIMEOUT))
+                span.set(status=response.status_code, http_ms=round((time.perf_counter() - started) * 1000, 1))
+                _update_rate_limit(response)
+                if response.status_code not in RETRY_STATUSES:
+                    response.raise_for_status()
+                    if tracing.is_enabled():
+                        size = len(response.content)
+                        span.set(bytes=size)
+                        tracing.count("twitter.bytes", size)
+                    started = time.perf_counter()
+                    data = response.json()
+                    span.set(parse_ms=round((time.perf_counter() - started) * 1000, 1),
+                             tweets=len(data.get("tweets", [])))
+                    return data
+                last_error = FetchError(f"HTTP {response.status_code}", status=response.status_code)
+            except requests.exceptions.HTTPError as err:
+                raise FetchError(f"HTTP error: {err}", status=response.status_code) from err
+            except requests.exceptions.InvalidJSONError as err:
+                raise FetchError(f"Invalid JSON response: {err}") from err
+            except requests.exceptions.RequestException as err:
+                if isinstance(err, ValueError):
+                    # Bad URL, schema or header: retrying won't help
+                    raise FetchError(f"Invalid request: {err}") from err
+                # Connection errors, timeouts, broken chunked bodies, redirect loops...
+                last_error = FetchError(f"{type(err).__name__}: {err}")
+            except ValueError as err:
+                raise FetchError(f"Invalid JSON response: {err}") from err
+
+            if attempt < MAX_RETRIES:
+                time.sleep(_retry_delay(response, attempt))
+
+        raise last_error
+
+
+def iter_tweet_pages(keyword, pages, weeks, region, use_cache=True, since=None):
+    # since: optional epoch seconds that narrows the window to newer tweets
+    # (incremental refresh). Such fetches bypass the page cache.
+    # Yields one event per page as soon as it is available:
+    #   {"page": n, "tweets": [...], "from_cache": bool, "has_next": bool, "requests": int}
+    # or, if a page cannot be fetched, a final
+    #   {"page": n, "tweets": [], "error": str, "status": int | None, "requests": int}
+    # where requests is the number of API requests the page took.
+    API_KEY = get_secret("X_API_KEY")
+    if not API_KEY and TWITTER_BACKEND == "replay":
+        # The replay backend accepts any key
+        API_KEY = "replay"
+    if not API_KEY:
+        yield {"page": 1, "tweets": [], "error": "API key not found. Please set X_API_KEY.", "status": None,
+               "requests": 0}
+        return
+
+    if since is not None:
+        use_cache = False
+
+    key = query_key(keyword, region, weeks)
+    cached = _page_cache.get(key) if use_cache else None
+
+    if cached:
+        # Keep the original since: window so cached cursors stay valid
+        since_time = cached["since"]
+        cached_at = cached["cached_at"]
+        cached_pages = list(cached["pages"])
+    elif since is not None and since > time.time() - weeks * 7 * 24 * 3600:
+        since_time = datetime.datetime.fromtimestamp(since, datetime.timezone.utc).strftime('%Y-%m-%d_%H:%M:%S_UTC')
+        cached_at = time.time()
+        cached_pages = []
+    else:
+        since_time = (datetime.datetime.now() - datetime.timedelta(weeks=weeks)).strftime('%Y-%m-%d_%H:%M:%S_UTC')
+        cached_at = time.time()
+        cached_pages = []
+
+    reused = cached_pages[:pages]
+    for number, page in enumerate(reused, start=1):
+        with _page_stats_lock:
+            _page_stats["pages_from_cache"] += 1
+        tracing.count("twitter.pages_from_cache")
+        yield {"page": number, "tweets": page["tweets"], "from_cache": True, "has_next": bool(page["next_cursor"]),
+               "requests": 0}
+
+    if len(reused) == pages or (reused and not reused[-1]["next_cursor"]):
+        return
 
-    url = "https://api.twitterapi.io/twitter/tweet/advanced_search"
     headers = {
         "X-API-Key": API_KEY
     }
 
     params = {
         "query": f"{keyword} lang:en {region} filter:media filter:has_engagement since:{since_time}",
-        "queryType": "Top",
-        "cursor": ""
+        "queryType": QUERY_TYPE if since is None else INCREMENTAL_QUERY_TYPE,
+        "cursor": reused[-1]["next_cursor"] if reused else ""
     }
 
-    all_tweets = []
     try:
-        for _ in range(pages):
-            response = requests.get(url, headers=headers, params=params)
-            response.raise_for_status()
-            data = response.json()
+        for page_number in range(len(reused) + 1, pages + 1):
+            sent = {"requests": 0}
+            try:
+                data = _request_page(headers, params, sent)
+            except FetchError as err:
+                tracing.count("twitter.failed_pages")
+                yield {"page": page_number, "tweets": [], "error": str(err), "status": err.status,
+                       "requests": sent["requests"]}
+                return
 
+            with _page_stats_lock:
+                _page_stats["pages_fetched"] += 1
             tweets = data.get("tweets", [])
-            all_tweets.extend(tweets)
+            next_cursor = data.get("next_cursor") if data.get("has_next_page") else None
+            cached_pages.append({"tweets": tweets, "next_cursor": next_cursor or ""})
+
+            yield {"page": page_number, "tweets": tweets, "from_cache": False, "has_next": bool(next_cursor),
+                   "requests": sent["requests"]}
 
-            if data.get("has_next_page") and data.get("next_cursor"):
-                params["cursor"] = data["next_cursor"]
+            if next_cursor:
+                params["cursor"] = next_cursor
             else:
                 break  # No more pages available
+    finally:
+        # Runs even if the consumer stops early, so fetched pages are never wasted
+        if use_cache and len(cached_pages) > len(reused):
+            # Extending a cached chain must not extend its lifetime
+            ttl = _page_cache.ttl - (time.time() - cached_at)
+            if ttl > 0:
+                _page_cache.set(key, {"since": since_time, "cached_at": cached_at, "pages": cached_pages}, ttl=ttl)
+
+
+def fetch_tweets_result(keyword, pages, weeks, region, use_cache=True, on_page=None, since=None):
+    # Structured variant of fetch_tweets: reports which pages came from the
+    # cache, which were fetched, and which failed, so truncated runs are visible.
+    # on_page(page, result) is called after every page for progressive rendering.
+    result = {
+        "tweets": [],
+        "pages_requested": pages,
+        "pages_from_cache": 0,
+        "pages_fetched": 0,
+        "requests": 0,
+        "failed_pages": [],
+        "exhausted": False,
+        "complete": True,
+    }
+
+    for page in iter_tweet_pages(keyword, pages, weeks, region, use_cache=use_cache, since=since):
+        result["requests"] += page["requests"]
+        if "error" in page:
+            # Later pages depend on this page's cursor, so they are lost too
+            result["failed_pages"] = [
+                {"page": number, "error": page["error"], "status": page["status"]}
+                for number in range(page["page"], pages + 1)
+            ]
+            result["complete"] = False
+        else:
+            result["tweets"].extend(page["tweets"])
+            result["pages_from_cache" if page["from_cache"] else "pages_fetched"] += 1
+            result["exhausted"] = not page["has_next"]
+        if on_page is not None:
+            on_page(page, result)
+
+    return result
+
 
-    except requests.exceptions.HTTPError as http_err:
-        print(f"HTTP error occurred: {http_err}")
-    except requests.exceptions.ConnectionError as conn_err:
-        print(f"Connection error occurred: {conn_err}")
-    except requests.exceptions.Timeout as timeout_err:
-        print(f"Timeout error occurred: {timeout_err}")
-    except requests.exceptions.RequestException as req_err:
-        print(f"Request exception occurred: {req_err}")
-    except Exception as e:
-        print(f"An unexpected error occurred: {e}")
-
-    return all_tweets
+def fetch_tweets(keyword, pages, weeks, region, use_cache=True):
+    return fetch_tweets_result(keyword, pages, weeks, region, use_cache=use_cache)["tweets"]
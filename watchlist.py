@@ -0,0 +1,266 @@
+import argparse
+import heapq
+import itertools
+import os
+import sys
+import threading
+import time
+
+import tracing
+
+# Long-running poller that keeps a watchlist of queries fresh under one API
+# budget. Every poll is an incremental refresh_query (only tweets newer than
+# the stored high-water mark are fetched and merged into the store), and
+# each query's interval follows its activity:
+#
+#   - an EWMA of its new-tweet rate sets the interval that should bring in
+#     about TARGET_NEW_TWEETS new tweets per poll,
+#   - growing engagement on its stored tweets shortens that interval, and
+#     failed or empty polls back off.
+#
+# Polls fetch the newest tweets after the mark first, and the mark moves to
+# the newest one, so a poll that stops at its page limit has skipped the
+# oldest of the new tweets. The polls after it fetch twice the pages (up to
+# MAX_PAGES) until one reaches the end of the results. Polls bypass the page
+# cache: a cached page would be stale by the next poll.
+#
+# Due queries wait in a priority queue ordered by activity, so when the
+# budget (API requests per hour) runs short, it is spent on the busiest ones.
+#
+#   python watchlist.py queries.toml [--budget 600]
+#
+# The config is the batch_runner.py format.
+BUDGET_PER_HOUR = float(os.getenv("WATCHLIST_BUDGET_PER_HOUR", "600"))
+MIN_INTERVAL = float(os.getenv("WATCHLIST_MIN_INTERVAL", "60"))
+MAX_INTERVAL = float(os.getenv("WATCHLIST_MAX_INTERVAL", str(6 * 3600)))
+INITIAL_INTERVAL = float(os.getenv("WATCHLIST_INITIAL_INTERVAL", "900"))
+TARGET_NEW_TWEETS = float(os.getenv("WATCHLIST_TARGET_NEW_TWEETS", "20"))
+# Most pages a catch-up poll fetches
+MAX_PAGES = int(os.getenv("WATCHLIST_MAX_PAGES", "8"))
+# Weight of the newest observation in the rate and growth averages
+SMOOTHING = 0.3
+ENGAGEMENT_FIELDS = ["likeCount", "retweetCount", "replyCount", "quoteCount"]
+
+
+def watch_key(keyword, region=""):
+    return (keyword.strip().lower(), (region or "").strip().lower())
+
+
+def _engagement(tweets):
+    return sum(tweet.get(field) or 0 for tweet in tweets for field in ENGAGEMENT_FIELDS)
+
+
+class Watchlist:
+    # clock and sleep are injectable so schedules can be simulated
+
+    def __init__(self, budget_per_hour=BUDGET_PER_HOUR, refresh=None, clock=time.monotonic, sleep=time.sleep):
+        if refresh is None:
+            from refresh import refresh_query as refresh
+        self.refresh = refresh
+        self.clock = clock
+        self.sleep = sleep
+        self.budget_rate = budget_per_hour / 3600
+        # Up to five minutes of budget can be saved up for bursts
+        self.budget_capacity = max(1.0, budget_per_hour / 12)
+        self.budget = self.budget_capacity
+        self.budget_updated = clock()
+        self.entries = {}
+        self._scheduled = []
+        self._ready = []
+        self._seq = itertools.count()
+        self._stop = threading.Event()
+
+    def add(self, keyword, pages=1, weeks=1, region=""):
+        key = watch_key(keyword, region)
+        self.entries[key] = {
+            "keyword": keyword.strip(), "region": (region or "").strip(), "pages": pages, "weeks": weeks,
+            "fetch_pages": pages,
+            "interval": INITIAL_INTERVAL, "rate": None, "growth": 0.0, "engagement": None,
+            "last_poll": None, "next_poll": self.clock(), "polls": 0, "requests": 0, "new_tweets": 0,
+            "last_error": None,
+        }
+        heapq.heappush(self._scheduled, (self.clock(), next(self._seq), key))
+        return key
+
+    def remove(self, keyword, region=""):
+        # Stale queue entries are skipped when they come up
+        self.entries.pop(watch_key(keyword, region), None)
+
+    def stop(self):
+        self._stop.set()
+
+    def activity(self, entry):
+        # New tweets per hour, boosted by engagement growth
+        return (entry["rate"] or 0.0) * 3600 * (1 + entry["growth"])
+
+    def _refill(self):
+        now = self.clock()
+        self.budget = min(self.budget_capacity, self.budget + (now - self.budget_updated) * self.budget_rate)
+        self.budget_updated = now
+
+    def _promote_due(self):
+        # Moves due queries into the ready queue, busiest first
+        now = self.clock()
+        while self._scheduled and self._scheduled[0][0] <= now:
+            _, _, key = heapq.heappop(self._scheduled)
+            entry = self.entries.get(key)
+            if entry is not None and entry["next_poll"] <= now:
+                heapq.heappush(self._ready, (-self.activity(entry), next(self._seq), key))
+
+    def _next_wait(self, cost):
+        # Seconds until the next poll could start
+        waits = []
+        if self._ready:
+            waits.append((cost - self.budget) / self.budget_rate if self.budget_rate > 0 else MAX_INTERVAL)
+        if self._scheduled:
+            waits.append(self._scheduled[0][0] - self.clock())
+        return max(0.05, min(waits)) if waits else MAX_INTERVAL
+
+    def step(self):
+        # Runs the next poll the budget allows; returns its outcome, or None
+        # (after waiting) if nothing could run yet
+        self._promote_due()
+        self._refill()
+        while self._ready and self._ready[0][2] not in self.entries:
+            heapq.heappop(self._ready)
+        if self._ready:
+            entry = self.entries[self._ready[0][2]]
+            cost = min(entry["fetch_pages"], self.budget_capacity)
+            if self.budget >= cost:
+                heapq.heappop(self._ready)
+                return self.poll(entry)
+            self.sleep(self._next_wait(cost))
+            return None
+        self.sleep(self._next_wait(0))
+        return None
+
+    def poll(self, entry):
+        # The page count is reserved up front, then settled against the
+        # requests the poll really made: pages that weren't needed are
+        # refunded and retries are charged
+        reserved = entry["fetch_pages"]
+        self.budget -= reserved
+        started = self.clock()
+        outcome = {"keyword": entry["keyword"], "region": entry["region"], "new_tweets": 0, "requests": 0,
+                   "error": None}
+        with tracing.span("watchlist.poll", keyword=entry["keyword"]) as span:
+            try:
+                result = self.refresh(entry["keyword"], pages=reserved, weeks=entry["weeks"],
+                                      region=entry["region"], use_cache=False)
+            except Exception as e:
+                result = None
+                outcome["error"] = f"{type(e).__name__}: {e}"
+                # Unknown how far it got, so the reservation stands
+                outcome["requests"] = reserved
+            if result is not None:
+                outcome["new_tweets"] = result["new_tweets"]
+                outcome["requests"] = result["requests"]
+                if not result["complete"]:
+                    outcome["error"] = result["failed_pages"][0]["error"]
+            self.budget += reserved - outcome["requests"]
+            self._reschedule(entry, result, outcome, started)
+            span.set(new_tweets=outcome["new_tweets"], requests=outcome["requests"],
+                     interval_s=round(entry["interval"], 1))
+        tracing.count("watchlist.requests", outcome["requests"])
+        outcome["interval"] = entry["interval"]
+        return outcome
+
+    def _reschedule(self, entry, result, outcome, now):
+        previous = entry["last_poll"]
+        entry.update(last_poll=now, polls=entry["polls"] + 1, last_error=outcome["error"],
+                     requests=entry["requests"] + outcome["requests"],
+                     new_tweets=entry["new_tweets"] + outcome["new_tweets"])
+
+        if outcome["error"] is not None:
+            interval = entry["interval"] * 2
+        else:
+            engagement = _engagement(result["tweets"])
+            if previous is not None:
+                hours = max(now - previous, 1.0) / 3600
+                rate = outcome["new_tweets"] / (hours * 3600)
+                entry["rate"] = rate if entry["rate"] is None else SMOOTHING * rate + (1 - SMOOTHING) * entry["rate"]
+            if previous is not None and entry["engagement"] is not None:
+                # Relative engagement gain per hour on the stored window
+                growth = max(0.0, engagement - entry["engagement"]) / max(entry["engagement"], 1) / hours
+                entry["growth"] = SMOOTHING * growth + (1 - SMOOTHING) * entry["growth"]
+            entry["engagement"] = engagement
+
+            if result["exhausted"]:
+                entry["fetch_pages"] = entry["pages"]
+            else:
+                # Stopped at the page limit: more tweets arrived than the
+                # pages hold, so fetch more of them next time
+                entry["fetch_pages"] = min(max(MAX_PAGES, entry["pages"]), entry["fetch_pages"] * 2)
+
+            if entry["rate"] is None:
+                interval = INITIAL_INTERVAL
+            elif entry["rate"] > 0:
+                interval = TARGET_NEW_TWEETS / entry["rate"] / (1 + entry["growth"])
+            elif result["exhausted"]:
+                interval = entry["interval"] * 2
+            else:
+                # Nothing new on the pages fetched, but the results go on
+                interval = entry["interval"]
+        entry["interval"] = min(MAX_INTERVAL, max(MIN_INTERVAL, interval))
+        entry["next_poll"] = now + entry["interval"]
+        key = watch_key(entry["keyword"], entry["region"])
+        heapq.heappush(self._scheduled, (entry["next_poll"], next(self._seq), key))
+
+    def run(self, max_polls=None, on_poll=None):
+        polls = 0
+        while not self._stop.is_set() and self.entries and (max_polls is None or polls < max_polls):
+            outcome = self.step()
+            if outcome is not None:
+                polls += 1
+                if on_poll is not None:
+                    on_poll(outcome)
+        return polls
+
+    def status(self):
+        # One row per query, busiest first
+        now = self.clock()
+        rows = [{
+            "keyword": entry["keyword"], "region": entry["region"],
+            "tweets_per_hour": round((entry["rate"] or 0.0) * 3600, 1),
+            "engagement_growth": round(entry["growth"], 3),
+            "interval_s": round(entry["interval"]), "pages": entry["fetch_pages"],
+            "next_poll_in_s": round(max(0.0, entry["next_poll"] - now)),
+            "polls": entry["polls"], "requests": entry["requests"], "new_tweets": entry["new_tweets"],
+            "last_error": entry["last_error"],
+        } for entry in self.entries.values()]
+        return sorted(rows, key=lambda row: -row["tweets_per_hour"] * (1 + row["engagement_growth"]))
+
+
+def main():
+    from batch_runner import load_config
+
+    parser = argparse.ArgumentParser(description="Keep a watchlist of queries fresh under an API budget")
+    parser.add_argument("config", help="TOML or JSON file listing the queries (batch_runner.py format)")
+    parser.add_argument("--budget", type=float, default=BUDGET_PER_HOUR, help="API requests per hour")
+    parser.add_argument("--max-polls", type=int, default=None, help="stop after this many polls")
+    args = parser.parse_args()
+
+    try:
+        queries = load_config(args.config)
+    except (OSError, ValueError) as e:
+        parser.error(str(e))
+
+    watchlist = Watchlist(budget_per_hour=args.budget)
+    for query in queries:
+        watchlist.add(query["keyword"], pages=query["pages"], weeks=query["weeks"], region=query["region"])
+
+    def report(outcome):
+        status = f"error: {outcome['error']}" if outcome["error"] else f"{outcome['new_tweets']} new"
+        print(f"{time.strftime('%H:%M:%S')}  {outcome['keyword']:<20} {outcome['region'] or '-':<10} "
+              f"{status:<30} {outcome['requests']} request(s), next in {outcome['interval']:.0f}s", flush=True)
+
+    try:
+        watchlist.run(max_polls=args.max_polls, on_poll=report)
+    except KeyboardInterrupt:
+        pass
+    for row in watchlist.status():
+        print(row)
+
+
+if __name__ == "__main__":
+    sys.exit(main())